@@ -0,0 +1,329 @@
+"""
+Rankings and time series of the analytics files, without Athena.
+
+Reads a local copy (e.g. `aws s3 sync`) of the files written by Firehose
+under `<system_name>/success/`:
+
+    year=YYYY/month=MM/day=DD/hour=HH/[bucket=NN/]<files>
+
+The directories outside the requested period, and with --user and --buckets
+the buckets other than the user's and `mixed`, are never listed. The files
+are read line by line, plain or gzip compressed, by a pool of processes;
+each file is reduced to counters before the next one is read, so memory
+does not grow with the amount of data.
+
+    python analytics/offline.py ./s3/slack_assignment/success --since 2023-09-01 --until 2023-10-01
+    python analytics/offline.py ./s3/slack_assignment/success --pairs --series day --user alice --buckets 16 --json
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lambda_function_firehose.handler import MIXED_BUCKET, loads, partition_bucket
+
+# Partition directories, outermost first.
+PARTITION_KEYS = ('year', 'month', 'day', 'hour')
+# Keys of the time series points, by granularity.
+SERIES_FORMATS = {
+    'hour': '%Y-%m-%dT%H',
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+}
+GZIP_MAGIC = b'\x1f\x8b'
+HOUR_MS = 3600 * 1000
+
+
+def parse_time(value):
+    """
+    Args:
+        value (str): ISO 8601 date or time, UTC, e.g. 2023-09-01 or 2023-09-01T14
+    Returns:
+        datetime: aware datetime in UTC
+    """
+    if len(value) == 13:
+        # 2023-09-01T14, the format of the hourly series
+        value += ':00'
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def partition_range(partition):
+    """
+    Args:
+        partition (dict): values of the partition directories found so far, e.g. {'year': '2023', 'month': '09'}
+    Returns:
+        tuple: (start, end) datetimes of the period covered by the partition, end excluded
+    """
+    year = int(partition['year'])
+    month = int(partition.get('month', 1))
+    day = int(partition.get('day', 1))
+    hour = int(partition.get('hour', 0))
+    start = datetime.datetime(year, month, day, hour, tzinfo=datetime.timezone.utc)
+    if 'hour' in partition:
+        end = start + datetime.timedelta(hours=1)
+    elif 'day' in partition:
+        end = start + datetime.timedelta(days=1)
+    elif 'month' in partition:
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+    else:
+        end = datetime.datetime(year + 1, 1, 1, tzinfo=datetime.timezone.utc)
+    return start, end
+
+
+def iter_files(root, since=None, until=None, buckets=None):
+    """
+    List the files of the partitions that can hold rows of the period.
+
+    Args:
+        root (str): directory holding the year=YYYY directories
+        since (datetime): start of the period, None for no start
+        until (datetime): end of the period (excluded), None for no end
+        buckets (set): bucket directories to read, None for all
+    Returns:
+        generator: (path, partition) of each file, partition being the dict of its directory values
+    """
+    def walk(directory, partition):
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_file():
+                yield entry.path, partition
+                continue
+            key, sep, value = entry.name.partition('=')
+            if not entry.is_dir() or not sep:
+                continue
+            if key in PARTITION_KEYS:
+                child = {**partition, key: value}
+                try:
+                    start, end = partition_range(child)
+                except ValueError:
+                    continue
+                if (since is not None and end <= since) or (until is not None and start >= until):
+                    continue
+            elif key == 'bucket':
+                if buckets is not None and value not in buckets:
+                    continue
+                child = {**partition, key: value}
+            else:
+                continue
+            yield from walk(entry.path, child)
+
+    yield from walk(root, {})
+
+
+def read_rows(path):
+    """
+    Args:
+        path (str): file written by Firehose, one JSON document per line, plain or gzip compressed
+    Returns:
+        generator: decoded rows; None for a line that is not valid JSON
+    """
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    opener = gzip.open if compressed else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield loads(line)
+            except ValueError:
+                yield None
+
+
+def new_summary():
+    """
+    Returns:
+        dict: empty counters, see summarize_file
+    """
+    return {
+        'totals': Counter(),
+        'pairs': Counter(),
+        'series': Counter(),
+        'stats': Counter(),
+    }
+
+
+def to_ms(value):
+    """
+    Args:
+        value (datetime): aware datetime, or None
+    Returns:
+        int: epoch milliseconds, or None
+    """
+    return None if value is None else int(value.timestamp() * 1000)
+
+
+def summarize_file(task):
+    """
+    Args:
+        task (tuple): (path, partition, options), options being a dict of
+                      since and until (datetime or None), user (str or None),
+                      pairs (bool) and series (granularity or None)
+    Returns:
+        dict:
+            totals (Counter): incr_num received by each to_username
+            pairs (Counter): incr_num by (from_username, to_username)
+            series (Counter): incr_num by period, see SERIES_FORMATS
+            stats (Counter): files, rows read, rows counted and invalid rows
+    """
+    path, partition, options = task
+    summary = new_summary()
+    since, until = to_ms(options['since']), to_ms(options['until'])
+    user, pairs, series = options['user'], options['pairs'], options['series']
+    partition_start = to_ms(partition_range(partition)[0]) if 'year' in partition else None
+    # series key of each hour, formatted once per file
+    periods = {}
+
+    summary['stats']['files'] += 1
+    for row in read_rows(path):
+        summary['stats']['rows'] += 1
+        try:
+            to_username = row['to_username']
+            incr_num = int(row['incr_num'])
+        except (TypeError, KeyError, ValueError):
+            summary['stats']['invalid'] += 1
+            continue
+        if user is not None and to_username != user:
+            continue
+
+        created = row.get('ApproximateCreationDateTime')
+        if not isinstance(created, (int, float)):
+            # files written before the transform emitted the creation time
+            created = partition_start
+        if created is not None:
+            if (since is not None and created < since) or (until is not None and created >= until):
+                continue
+
+        summary['stats']['counted'] += 1
+        summary['totals'][to_username] += incr_num
+        if pairs:
+            summary['pairs'][(row.get('from_username', ''), to_username)] += incr_num
+        if series is not None and created is not None:
+            hour = int(created // HOUR_MS)
+            if hour not in periods:
+                period_start = datetime.datetime.fromtimestamp(hour * 3600, datetime.timezone.utc)
+                periods[hour] = period_start.strftime(SERIES_FORMATS[series])
+            summary['series'][periods[hour]] += incr_num
+    return summary
+
+
+def merge(summary, other):
+    """
+    Add the counters of other to summary.
+
+    Args:
+        summary (dict): counters updated, see summarize_file
+        other (dict): counters of another file
+    Returns:
+        dict: summary
+    """
+    for name, counter in other.items():
+        summary[name].update(counter)
+    return summary
+
+
+def analyze(root, since=None, until=None, user=None, buckets=0, pairs=False, series=None, workers=0):
+    """
+    Args:
+        root (str): directory holding the year=YYYY directories
+        since (datetime): start of the period, None for no start
+        until (datetime): end of the period (excluded), None for no end
+        user (str): count only the rows of this to_username, None for all
+        buckets (int): PARTITION_BUCKETS of the files; with user, only its bucket and `mixed` are read
+        pairs (bool): count the (from_username, to_username) pairs
+        series (str): granularity of the time series, a key of SERIES_FORMATS, None for none
+        workers (int): processes reading the files, 0 reads them in this process
+    Returns:
+        dict: counters of all the files, see summarize_file
+    """
+    bucket_names = None
+    if user is not None and buckets:
+        bucket_names = {partition_bucket(user, buckets), MIXED_BUCKET}
+    options = {'since': since, 'until': until, 'user': user, 'pairs': pairs, 'series': series}
+    tasks = ((path, partition, options) for path, partition in iter_files(root, since, until, bucket_names))
+
+    summary = new_summary()
+    if not workers:
+        for task in tasks:
+            merge(summary, summarize_file(task))
+        return summary
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # the counters of a file are merged as soon as it is read
+        for result in executor.map(summarize_file, tasks, chunksize=8):
+            merge(summary, result)
+    return summary
+
+
+def report(summary, top=10, pairs=False):
+    """
+    Args:
+        summary (dict): value returned by analyze
+        top (int): entries of the rankings
+        pairs (bool): include the ranking of (from_username, to_username), see analyze
+    Returns:
+        dict: rankings and series, ready for json.dumps
+    """
+    result = {
+        'stats': dict(summary['stats']),
+        'top': [{'to_username': name, 'total_incr_num': total} for name, total in summary['totals'].most_common(top)],
+    }
+    if pairs:
+        result['pairs'] = [
+            {'from_username': sender, 'to_username': recipient, 'total_incr_num': total}
+            for (sender, recipient), total in summary['pairs'].most_common(top)
+        ]
+    if summary['series']:
+        result['series'] = [{'period': period, 'total_incr_num': total} for period, total in sorted(summary['series'].items())]
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='directory holding the year=YYYY directories')
+    parser.add_argument('--since', type=parse_time, help='start of the period (UTC), e.g. 2023-09-01')
+    parser.add_argument('--until', type=parse_time, help='end of the period (UTC, excluded)')
+    parser.add_argument('--user', help='count only the ++ received by this user')
+    parser.add_argument('--buckets', type=int, default=0, help='analytics_partition_buckets of the files')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--pairs', action='store_true', help='rank the (from_username, to_username) pairs too')
+    parser.add_argument('--series', choices=sorted(SERIES_FORMATS), help='granularity of the time series')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes, 0 for none')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args(argv)
+
+    summary = analyze(args.root, args.since, args.until, args.user, args.buckets, args.pairs, args.series, args.workers)
+    result = report(summary, args.top, args.pairs)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    stats = result['stats']
+    print(f"{stats.get('files', 0)} files, {stats.get('rows', 0)} rows, {stats.get('counted', 0)} counted, "
+          f"{stats.get('invalid', 0)} invalid")
+    print(f"\n{'to_username':<24}{'total_incr_num':>16}")
+    for entry in result['top']:
+        print(f"{entry['to_username']:<24}{entry['total_incr_num']:>16}")
+    if 'pairs' in result:
+        print(f"\n{'from_username':<24}{'to_username':<24}{'total_incr_num':>16}")
+        for entry in result['pairs']:
+            print(f"{entry['from_username']:<24}{entry['to_username']:<24}{entry['total_incr_num']:>16}")
+    if 'series' in result:
+        print(f"\n{'period':<16}{'total_incr_num':>16}")
+        for entry in result['series']:
+            print(f"{entry['period']:<16}{entry['total_incr_num']:>16}")
+
+
+if __name__ == '__main__':
+    main()
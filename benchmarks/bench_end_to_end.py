@@ -0,0 +1,334 @@
+"""
+End-to-end benchmark of the Slack handler and of the Firehose transform.
+
+Signed synthetic Slack events go through lambda_handler (signature check
+included) against in-process fakes of DynamoDB and of the Slack Web API
+(benchmarks/fakes.py) that sleep for a configurable latency per call. The
+Messages rows written by the handler are then sent through the Firehose
+transform as DynamoDB change records.
+
+Reports events/sec, the p50/p95/p99 latency of an invocation and the number
+of DynamoDB and Slack calls per event for each scenario, and compares them
+with the stored baselines.
+
+    python benchmarks/bench_end_to_end.py [--events 200] [--dynamodb-latency-ms 2] [--slack-latency-ms 5]
+    python benchmarks/bench_end_to_end.py --check           # exit 1 on a regression
+    python benchmarks/bench_end_to_end.py --save-baseline   # store the results as the new baselines
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('SLACK_TOKEN', 'xoxb-bench')
+# the handler verifies the events with the secret it has been loaded with
+SIGNING_SECRET = os.environ.setdefault('SLACK_SIGNING_SECRET', 'bench-signing-secret')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+
+from fakes import FakeDynamoDB, FakeSlackClient
+from lambda_function import handler, dedupe, leaderboard, metrics, outbox, sharded_counter, user_cache
+from lambda_function_firehose import handler as firehose_handler
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Settings of the Slack handler for each scenario. sqs_batch goes through
+# sqs_handler with batches of SQS_BATCH_SIZE events.
+SCENARIOS = {
+    'item': {'DYNAMODB_WRITE_MODE': 'item', 'IO_MAX_WORKERS': 0},
+    'batch': {'DYNAMODB_WRITE_MODE': 'batch', 'IO_MAX_WORKERS': 0},
+    'transact': {'DYNAMODB_WRITE_MODE': 'transact', 'IO_MAX_WORKERS': 0},
+    'item_concurrent': {'DYNAMODB_WRITE_MODE': 'item', 'IO_MAX_WORKERS': 8},
+    'sqs_batch': {'DYNAMODB_WRITE_MODE': 'item', 'IO_MAX_WORKERS': 0},
+}
+SQS_BATCH_SIZE = 10
+FIREHOSE_BATCH_SIZE = 500
+# Firehose invocations per run, enough for a stable p95.
+FIREHOSE_BATCHES = 20
+
+
+def sign(body, timestamp, secret=SIGNING_SECRET):
+    """
+    Args:
+        body (str): raw request body
+        timestamp (str): x-slack-request-timestamp
+        secret (str): signing secret of the app
+    Returns:
+        str: x-slack-signature, computed as verify_request checks it
+    """
+    basestring = f"v0:{timestamp}:{body}".encode('utf-8')
+    return 'v0=' + hmac.new(secret.encode('utf-8'), basestring, hashlib.sha256).hexdigest()
+
+
+def signed_event(body, secret=SIGNING_SECRET):
+    """
+    Args:
+        body (dict): request body sent by Slack
+        secret (str): signing secret of the app
+    Returns:
+        dict: Lambda event of a signed request, as received through the function URL
+    """
+    raw_body = json.dumps(body)
+    timestamp = str(int(time.time()))
+    return {
+        'headers': {
+            'content-type': 'application/json',
+            'x-slack-request-timestamp': timestamp,
+            'x-slack-signature': sign(raw_body, timestamp, secret),
+        },
+        'body': raw_body,
+    }
+
+
+def make_body(i, rng, users=300, senders=50):
+    """
+    Args:
+        i (int): sequence number of the event
+        rng (random.Random): source of the recipients and senders
+        users (int): number of recipients; a few of them receive most of the ++
+        senders (int): number of senders
+    Returns:
+        dict: request body of a `name++` message event
+    """
+    recipients = {f"user{min(int(rng.paretovariate(1.2)) - 1, users - 1)}" for _ in range(rng.randint(1, 3))}
+    text = ' '.join(f"{name}++" for name in sorted(recipients)) + " thanks for the review!"
+    ts = 1693751100 + i / 1000
+    return {
+        'token': 'bench',
+        'team_id': 'T0BENCH',
+        'type': 'event_callback',
+        'event_id': f"Ev{i:08d}",
+        'event_time': int(ts),
+        'event': {
+            'type': 'message',
+            'client_msg_id': f"msg-{i:08d}",
+            'text': text,
+            'user': f"U{rng.randrange(senders):05d}",
+            'channel': 'C0BENCH',
+            'ts': f"{ts:.6f}",
+        },
+    }
+
+
+def change_records(items):
+    """
+    Args:
+        items (list): Messages items in DynamoDB JSON format
+    Returns:
+        list: Firehose records holding the DynamoDB change records of the items
+    """
+    records = []
+    for i, item in enumerate(items):
+        change = {
+            'eventID': f"change-{i}",
+            'eventName': 'INSERT',
+            'dynamodb': {'ApproximateCreationDateTime': 1693751100000 + i, 'NewImage': item},
+        }
+        records.append({
+            'recordId': str(i),
+            'data': base64.b64encode(json.dumps(change).encode('utf-8')).decode('ascii'),
+        })
+    return records
+
+
+def percentile(sorted_values, p):
+    """
+    Returns:
+        float: nearest-rank percentile of already sorted values
+    """
+    index = max(0, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(events, durations, calls, elapsed):
+    durations = sorted(durations)
+    return {
+        'events': events,
+        'events_per_sec': round(events / elapsed, 1),
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'p99_ms': round(percentile(durations, 99) * 1000, 2),
+        'calls_per_event': round(calls / events, 3),
+    }
+
+
+def install_fakes(dynamodb_latency, slack_latency):
+    """
+    Returns:
+        tuple: (FakeDynamoDB, FakeSlackClient) used by the handler from now on
+    """
+    fake_dynamodb = FakeDynamoDB(latency=dynamodb_latency)
+    fake_slack = FakeSlackClient(latency=slack_latency)
+    handler.dynamodb = fake_dynamodb
+    handler._executor = None
+    handler.load_slack_client().set_client(fake_slack)
+    user_cache.reset_cache()
+    dedupe.reset_deduplicator()
+    leaderboard.reset_cache()
+    sharded_counter.reset_counters()
+    return fake_dynamodb, fake_slack
+
+
+def run_slack_scenario(name, settings, bodies, dynamodb_latency, slack_latency):
+    """
+    Returns:
+        tuple: (summary dict, Messages items written)
+    """
+    saved = {key: getattr(handler, key) for key in settings}
+    for key, value in settings.items():
+        setattr(handler, key, value)
+    try:
+        fake_dynamodb, fake_slack = install_fakes(dynamodb_latency, slack_latency)
+        durations = []
+        start = time.perf_counter()
+        if name == 'sqs_batch':
+            for i in range(0, len(bodies), SQS_BATCH_SIZE):
+                records = [{'messageId': f"m{j}", 'body': json.dumps(body)}
+                           for j, body in enumerate(bodies[i:i + SQS_BATCH_SIZE], i)]
+                call_start = time.perf_counter()
+                response = handler.sqs_handler({'Records': records}, None)
+                durations.append(time.perf_counter() - call_start)
+                assert not response['batchItemFailures'], response
+        else:
+            for body in bodies:
+                event = signed_event(body)
+                call_start = time.perf_counter()
+                response = handler.lambda_handler(event, None)
+                durations.append(time.perf_counter() - call_start)
+                assert response and response.get('ok'), response
+        elapsed = time.perf_counter() - start
+
+        calls = sum(fake_dynamodb.calls.values()) + sum(fake_slack.calls.values())
+        summary = summarize(len(bodies), durations, calls, elapsed)
+        summary['calls'] = dict(sorted({**fake_dynamodb.calls, **fake_slack.calls}.items()))
+        return summary, list(fake_dynamodb.tables.get('Messages', {}).values())
+    finally:
+        for key, value in saved.items():
+            setattr(handler, key, value)
+        handler.load_slack_client().reset_client()
+        handler.dynamodb = None
+        handler._executor = None
+
+
+def run_firehose_scenario(items):
+    durations = []
+    start = time.perf_counter()
+    for i in range(0, len(items), FIREHOSE_BATCH_SIZE):
+        event = {'records': change_records(items[i:i + FIREHOSE_BATCH_SIZE])}
+        call_start = time.perf_counter()
+        firehose_handler.lambda_handler(event, None)
+        durations.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    return summarize(len(items), durations, 0, elapsed)
+
+
+def compare(results, baselines, tolerance):
+    """
+    Returns:
+        list: descriptions of the metrics that are worse than their baseline
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        if result['events_per_sec'] < baseline['events_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: events/sec {result['events_per_sec']} < {baseline['events_per_sec']}")
+        if result['p95_ms'] > baseline['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms > {baseline['p95_ms']} ms")
+        if result['calls_per_event'] > baseline['calls_per_event'] + 1e-9:
+            regressions.append(f"{name}: calls/event {result['calls_per_event']} > {baseline['calls_per_event']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=2)
+    parser.add_argument('--slack-latency-ms', type=float, default=5)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS) + ['firehose'],
+                        help='scenario to run, all of them by default')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed slowdown against the baselines')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 on a regression')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    # keep the handler logs out of the report
+    logging.getLogger().addHandler(logging.NullHandler())
+    # one EMF line per event would mix with the report; set here rather than
+    # at import, as the tests import this module
+    if 'METRICS_ENABLED' not in os.environ:
+        metrics.METRICS_ENABLED = False
+    # every event posts to one channel of the fake Slack API, which has no rate limit
+    if 'SLACK_CHANNEL_RATE' not in os.environ:
+        outbox.SLACK_CHANNEL_RATE = 0
+        outbox.reset_outbox()
+
+    settings = {
+        'events': args.events,
+        'dynamodb_latency_ms': args.dynamodb_latency_ms,
+        'slack_latency_ms': args.slack_latency_ms,
+        'seed': args.seed,
+    }
+    rng = random.Random(args.seed)
+    bodies = [make_body(i, rng) for i in range(args.events)]
+    scenarios = args.scenario or list(SCENARIOS) + ['firehose']
+
+    results = {}
+    messages = []
+    for name in scenarios:
+        if name == 'firehose':
+            continue
+        results[name], messages = run_slack_scenario(
+            name, SCENARIOS[name], bodies, args.dynamodb_latency_ms / 1000, args.slack_latency_ms / 1000)
+    if 'firehose' in scenarios:
+        if not messages:
+            _, messages = run_slack_scenario('item', SCENARIOS['item'], bodies, 0, 0)
+        rows = FIREHOSE_BATCHES * FIREHOSE_BATCH_SIZE
+        items = (messages * (1 + rows // len(messages)))[:rows]
+        results['firehose'] = run_firehose_scenario(items)
+
+    print(f"{'scenario':<17}{'events':>7}{'events/sec':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'calls/event':>13}")
+    for name, result in results.items():
+        print(f"{name:<17}{result['events']:>7}{result['events_per_sec']:>12.1f}{result['p50_ms']:>9.2f}"
+              f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['calls_per_event']:>13.3f}")
+
+    stored = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            stored = json.load(f)
+
+    if args.save_baseline:
+        stored = {'settings': settings, 'scenarios': {**stored.get('scenarios', {}), **results}}
+        with open(BASELINES, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baselines saved to {BASELINES}")
+        return
+
+    if not stored:
+        return
+    if stored.get('settings') != settings:
+        print(f"baselines were measured with {stored.get('settings')}, not comparable")
+        return
+    regressions = compare(results, stored['scenarios'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("no regression against the baselines")
+    if regressions and args.check:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
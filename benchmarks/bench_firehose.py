@@ -0,0 +1,92 @@
+"""
+Benchmark of the Firehose transform at the maximum batch size.
+
+Firehose invokes the transform with up to 3 MiB of records (the largest
+buffer of the Lambda processor). Reports records/sec and the peak memory
+allocated by the handler, with orjson and with the standard json module.
+
+    python benchmarks/bench_firehose.py [--batch-mb 3] [--repeat 5]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lambda_function_firehose import handler
+
+
+def make_record(i):
+    return {
+        "eventID": f"event-{i}",
+        "eventName": "INSERT",
+        "dynamodb": {
+            "ApproximateCreationDateTime": 1693569741000 + i,
+            "NewImage": {
+                "to_username": {"S": f"user{i % 300}"},
+                "from_username": {"S": "John"},
+                "message": {"S": f"user{i % 300}++ thanks for the help with the release! " * 3},
+                "username": {"S": "U0123ABCD"},
+                "incr_num": {"N": "1"},
+                "time_to_username": {"S": f"{1693569741000 + i}#user{i % 300}"}
+            }
+        }
+    }
+
+
+def make_event(batch_bytes):
+    records = []
+    size = 0
+    while size < batch_bytes:
+        data = json.dumps(make_record(len(records))).encode('utf-8')
+        size += len(data)
+        records.append({
+            'recordId': str(len(records)),
+            'data': base64.b64encode(data).decode('ascii')
+        })
+    return {'records': records}, size
+
+
+def run(batch_bytes, repeat):
+    durations = []
+    for _ in range(repeat):
+        # the handler releases the input records, so each run gets a new event
+        event, _ = make_event(batch_bytes)
+        start = time.perf_counter()
+        response = handler.lambda_handler(event, None)
+        durations.append(time.perf_counter() - start)
+
+    # tracemalloc slows the handler down several times: the memory is
+    # measured in a run of its own, which is not timed
+    event, _ = make_event(batch_bytes)
+    tracemalloc.start()
+    handler.lambda_handler(event, None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(response['records']), min(durations), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-mb', type=float, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    batch_bytes = int(args.batch_mb * 1024 * 1024)
+    codecs = {'json': None}
+    if handler.orjson is not None:
+        codecs['orjson'] = handler.orjson
+
+    print(f"{'codec':<8}{'records':>9}{'records/sec':>14}{'peak MiB':>10}")
+    for name, module in codecs.items():
+        handler.orjson = module
+        records, duration, peak = run(batch_bytes, args.repeat)
+        print(f"{name:<8}{records:>9}{records / duration:>14.0f}{peak / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark of the increment tokenizer against the regular expressions it replaced.
+
+    python benchmarks/bench_tokenizer.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lambda_function.tokenizer import parse
+
+SIZE = 40 * 1024
+
+INPUTS = {
+    'chat message': "thanks for the review, see you tomorrow",
+    'reaction message': "alice++ bob++ alice++ thanks for the release!",
+    'long message': "lorem ipsum dolor sit amet " * (SIZE // 27),
+    'long word': 'a' * SIZE + '+',
+    'many tokens': 'a++ ' * (SIZE // 4),
+    'plus signs': '+' * SIZE,
+    'words between increments': ('a' * 100 + '+-') * (SIZE // 102) + '++',
+}
+
+
+def legacy_parse(text):
+    is_reaction = bool(re.match(r'(\w+\+\+ *)+\s*.*', text))
+    user_map = {}
+    for user in re.findall(r'(\w+)\+\+', text):
+        user_map[user] = 1 + user_map.get(user, 0)
+    return is_reaction, user_map
+
+
+def measure(function, text):
+    timer = timeit.Timer(lambda: function(text))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def main():
+    print(f"{'input':<26}{'bytes':>8}{'tokenizer (us)':>16}{'regex (us)':>14}")
+    for name, text in INPUTS.items():
+        new = measure(parse, text) * 1e6
+        old = measure(legacy_parse, text) * 1e6
+        print(f"{name:<26}{len(text.encode('utf-8')):>8}{new:>16.1f}{old:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+In-process fakes of the DynamoDB client and of the Slack WebClient.
+
+They implement the calls made by the functions of this repository, with
+the same request and response shapes as boto3 and slack_sdk, count every
+call and can sleep for a configurable latency to stand in for the network.
+"""
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+# Primary keys of the tables used by the functions.
+TABLE_KEYS = {
+    'Messages': ('username', 'time_to_username'),
+    'UserCounts': ('username',),
+    'ProcessedEvents': ('event_key',),
+    'Rollups': ('period', 'username'),
+}
+# Global secondary indexes: (partition key, sort key)
+TABLE_INDEXES = {
+    ('UserCounts', 'leaderboard'): ('board', 'total_num'),
+    ('Messages', 'history'): ('to_username', 'time_to_username'),
+}
+
+CONDITION_TERM = re.compile(r'attribute_not_exists\((\w+)\)|(\w+)\s*(<=|>=|<>|<|>|=)\s*(:\w+)')
+SET_ACTION = re.compile(r'(\w+)\s*=\s*(?:if_not_exists\(\s*\w+\s*,\s*(:\w+)\s*\)|(:\w+))')
+CLAUSE = re.compile(r'\b(ADD|SET|REMOVE)\b')
+# commas between actions, not the ones inside if_not_exists(...)
+ACTION_SEPARATOR = re.compile(r',(?![^()]*\))')
+
+
+def value_of(attribute):
+    """
+    Args:
+        attribute (dict): attribute value in DynamoDB JSON, e.g. {'N': '3'}
+    Returns:
+        object: comparable Python value
+    """
+    (type_, value), = attribute.items()
+    if type_ == 'N':
+        return float(value)
+    return value
+
+
+def conditional_check_failed(operation):
+    return ClientError(
+        {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}},
+        operation
+    )
+
+
+class FakeDynamoDB:
+    """
+    Low-level DynamoDB client (boto3.client('dynamodb')) keeping the tables in memory.
+
+    Supports the expressions used in this repository: ADD and SET (with
+    if_not_exists) updates, and conditions made of attribute_not_exists and
+    comparisons joined by OR.
+    """
+
+    def __init__(self, latency=0.0):
+        """
+        Args:
+            latency (float): seconds every call sleeps for
+        """
+        self.latency = latency
+        self.tables = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _table(self, table_name):
+        return self.tables.setdefault(table_name, {})
+
+    def _key(self, table_name, key_or_item):
+        return tuple(key_or_item[name]['S'] for name in TABLE_KEYS[table_name])
+
+    def _check(self, item, condition, values, operation):
+        if not condition:
+            return
+        for term in condition.split(' OR '):
+            match = CONDITION_TERM.search(term)
+            not_exists, name, operator, placeholder = match.groups()
+            if not_exists:
+                if item is None or not_exists not in item:
+                    return
+                continue
+            if item is None or name not in item:
+                continue
+            current, expected = value_of(item[name]), value_of(values[placeholder])
+            if {'<': current < expected, '>': current > expected, '=': current == expected,
+                    '<=': current <= expected, '>=': current >= expected, '<>': current != expected}[operator]:
+                return
+        raise conditional_check_failed(operation)
+
+    def _update(self, item, expression, values):
+        parts = CLAUSE.split(expression)
+        for keyword, body in zip(parts[1::2], parts[2::2]):
+            for action in filter(None, (a.strip() for a in ACTION_SEPARATOR.split(body))):
+                if keyword == 'ADD':
+                    name, placeholder = action.split()
+                    value = values[placeholder]
+                    if 'N' in value:
+                        total = value_of(item.get(name, {'N': '0'})) + value_of(value)
+                        item[name] = {'N': str(int(total)) if total == int(total) else str(total)}
+                    else:
+                        members = set(item.get(name, {'SS': []})['SS']) | set(value['SS'])
+                        item[name] = {'SS': sorted(members)}
+                elif keyword == 'SET':
+                    name, if_not_exists, placeholder = SET_ACTION.match(action).groups()
+                    if if_not_exists:
+                        item.setdefault(name, values[if_not_exists])
+                    else:
+                        item[name] = values[placeholder]
+                else:
+                    item.pop(action, None)
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeValues=None, **kwargs):
+        self._call('PutItem')
+        with self._lock:
+            table = self._table(TableName)
+            key = self._key(TableName, Item)
+            self._check(table.get(key), ConditionExpression, ExpressionAttributeValues or {}, 'PutItem')
+            table[key] = dict(Item)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues,
+                    ConditionExpression=None, ReturnValues='NONE', **kwargs):
+        self._call('UpdateItem')
+        with self._lock:
+            item = self._update_locked(TableName, Key, UpdateExpression, ExpressionAttributeValues,
+                                       ConditionExpression, 'UpdateItem')
+            response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+            if ReturnValues == 'ALL_NEW':
+                response['Attributes'] = dict(item)
+            elif ReturnValues == 'UPDATED_NEW':
+                names = re.findall(r'(\w+)\s+:\w+|(\w+)\s*=', UpdateExpression)
+                updated = {a or b for a, b in names}
+                response['Attributes'] = {name: item[name] for name in updated if name in item}
+        return response
+
+    def _update_locked(self, table_name, key, expression, values, condition, operation):
+        table = self._table(table_name)
+        table_key = self._key(table_name, key)
+        current = table.get(table_key)
+        self._check(current, condition, values, operation)
+        item = dict(current) if current else dict(key)
+        self._update(item, expression, values)
+        table[table_key] = item
+        return item
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._call('DeleteItem')
+        with self._lock:
+            self._table(TableName).pop(self._key(TableName, Key), None)
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def get_item(self, TableName, Key, ConsistentRead=False, **kwargs):
+        self._call('GetItem')
+        with self._lock:
+            item = self._table(TableName).get(self._key(TableName, Key))
+        response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if item is not None:
+            response['Item'] = dict(item)
+        return response
+
+    def batch_write_item(self, RequestItems):
+        self._call('BatchWriteItem')
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                table = self._table(table_name)
+                for request in requests:
+                    item = request['PutRequest']['Item']
+                    table[self._key(table_name, item)] = dict(item)
+        return {'UnprocessedItems': {}, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def batch_get_item(self, RequestItems):
+        self._call('BatchGetItem')
+        responses = {}
+        with self._lock:
+            for table_name, request in RequestItems.items():
+                table = self._table(table_name)
+                found = (table.get(self._key(table_name, key)) for key in request['Keys'])
+                responses[table_name] = [dict(item) for item in found if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def transact_write_items(self, TransactItems):
+        self._call('TransactWriteItems')
+        with self._lock:
+            snapshot = {name: dict(table) for name, table in self.tables.items()}
+            try:
+                for action in TransactItems:
+                    if 'Put' in action:
+                        put = action['Put']
+                        table = self._table(put['TableName'])
+                        key = self._key(put['TableName'], put['Item'])
+                        self._check(table.get(key), put.get('ConditionExpression'),
+                                    put.get('ExpressionAttributeValues', {}), 'TransactWriteItems')
+                        table[key] = dict(put['Item'])
+                    else:
+                        update = action['Update']
+                        self._update_locked(update['TableName'], update['Key'], update['UpdateExpression'],
+                                            update['ExpressionAttributeValues'],
+                                            update.get('ConditionExpression'), 'TransactWriteItems')
+            except ClientError:
+                self.tables = snapshot
+                raise ClientError(
+                    {'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                     'CancellationReasons': [{'Code': 'ConditionalCheckFailed'}]},
+                    'TransactWriteItems'
+                )
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues,
+              IndexName=None, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, **kwargs):
+        """
+        Supports equality on the partition key only, and pagination with Limit
+        and ExclusiveStartKey.
+        """
+        self._call('Query')
+        if IndexName:
+            partition, sort = TABLE_INDEXES[(TableName, IndexName)]
+        else:
+            partition, sort = (TABLE_KEYS[TableName] + (None,))[:2]
+        name, placeholder = re.match(r'(\w+)\s*=\s*(:\w+)', KeyConditionExpression).groups()
+        expected = ExpressionAttributeValues[placeholder]
+
+        with self._lock:
+            items = [dict(item) for item in self._table(TableName).values()
+                     if partition in item and item[partition] == expected and (sort is None or sort in item)]
+        if sort:
+            items.sort(key=lambda item: (value_of(item[sort]), self._key(TableName, item)),
+                       reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = self._key(TableName, ExclusiveStartKey)
+            keys = [self._key(TableName, item) for item in items]
+            items = items[keys.index(start) + 1:] if start in keys else []
+
+        response = {'Items': items[:Limit], 'Count': len(items[:Limit])}
+        if Limit is not None and len(items) > Limit:
+            last = items[Limit - 1]
+            names = TABLE_KEYS[TableName] + ((partition, sort) if IndexName else ())
+            response['LastEvaluatedKey'] = {name: last[name] for name in names if name}
+        return response
+
+    def scan(self, TableName, Segment=None, TotalSegments=None, Limit=None, ExclusiveStartKey=None,
+             ProjectionExpression=None, **kwargs):
+        """
+        Supports parallel scans (Segment and TotalSegments), pagination with
+        Limit and ExclusiveStartKey, and a ProjectionExpression of plain
+        attribute names. Each item belongs to the segment of the CRC-32 of its key.
+        """
+        self._call('Scan')
+        with self._lock:
+            items = sorted(self._table(TableName).items())
+        if TotalSegments:
+            items = [(key, item) for key, item in items
+                     if zlib.crc32('#'.join(key).encode('utf-8')) % TotalSegments == Segment]
+        if ExclusiveStartKey:
+            start = self._key(TableName, ExclusiveStartKey)
+            items = [(key, item) for key, item in items if key > start]
+
+        page = [item for _, item in items[:Limit]]
+        if ProjectionExpression:
+            names = [name.strip() for name in ProjectionExpression.split(',')]
+            page = [{name: item[name] for name in names if name in item} for item in page]
+        else:
+            page = [dict(item) for item in page]
+        response = {'Items': page, 'Count': len(page), 'ScannedCount': len(page)}
+        if Limit is not None and len(items) > Limit:
+            last = items[Limit - 1][1]
+            response['LastEvaluatedKey'] = {name: last[name] for name in TABLE_KEYS[TableName]}
+        return response
+
+
+class FakeSlackResponse(dict):
+    """
+    dict-like response, as SlackResponse supports response['ok'] and response.get('ok').
+    """
+
+
+class FakeSlackClient:
+    """
+    Slack WebClient with the methods called by the handler.
+    """
+
+    def __init__(self, latency=0.0, users=None):
+        """
+        Args:
+            latency (float): seconds every call sleeps for
+            users (dict): display name of each user id; unknown ids get `name-<id>`
+        """
+        self.latency = latency
+        self.users = users or {}
+        self.posted = []
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def chat_postMessage(self, channel, text, **kwargs):
+        self._call('chat.postMessage')
+        with self._lock:
+            self.posted.append((channel, text))
+        return FakeSlackResponse(ok=True, channel=channel, ts=f"{time.time():.6f}")
+
+    def users_info(self, user):
+        self._call('users.info')
+        name = self.users.get(user, f"name-{user}")
+        return FakeSlackResponse(ok=True, user={'id': user, 'profile': {'display_name': name, 'real_name': name}})
+
+    def users_list(self, cursor=None, limit=200, **kwargs):
+        self._call('users.list')
+        members = [
+            {'id': user_id, 'profile': {'display_name': name, 'real_name': name}}
+            for user_id, name in self.users.items()
+        ]
+        return FakeSlackResponse(ok=True, members=members, response_metadata={'next_cursor': ''})
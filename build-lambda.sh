@@ -1,17 +1,36 @@
 #!/usr/bin/env bash
+set -e
+
+# Python of the Lambda runtime: the .pyc files are only used by the same version.
+PYTHON=${PYTHON:-python3.11}
 
 if [ -d build ]; then
   rm -rf build
 fi
 
 # Recreate build directory
-mkdir -p build/function/ build/layer/
+mkdir -p build/function/ build/function_firehose/ build/function_rollup/ build/layer/
 
 # copy lambda function file
 echo "copy lambda function file"
-cp -r lambda_function/ build/function/
-cp -r lambda_function_firehose/ build/function_firehose/
+cp -R lambda_function/. build/function/
+cp -R lambda_function_firehose/. build/function_firehose/
+# shared with the Slack App function
+cp lambda_function/message_schema.py lambda_function/structured_log.py build/function_firehose/
+cp -R lambda_function_rollup/. build/function_rollup/
 
 # create lambda layer zip
 echo "create lambda layer zip"
-pip install -r requirements.txt -t build/layer/python
\ No newline at end of file
+# binary wheels (orjson) must match the Lambda platform, not the build machine
+"$PYTHON" -m pip install --no-compile -r requirements.txt -t build/layer/python \
+  --platform manylinux2014_x86_64 --implementation cp --only-binary=:all:
+
+# remove files that are not needed at runtime
+echo "remove unneeded files"
+find build -type d \( -name __pycache__ -o -name tests \) -prune -exec rm -rf {} +
+find build -type f \( -name '*.pyi' -o -name '*.pyc' \) -delete
+
+# precompile, so that the first import does not compile the sources.
+# unchecked-hash: the .pyc files are used whatever the timestamps in the zip files are.
+echo "precompile python files"
+"$PYTHON" -m compileall -q --invalidation-mode unchecked-hash build/function build/function_firehose build/function_rollup build/layer/python
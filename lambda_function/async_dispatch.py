@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger()
+
+# Marks the events that the handler sends to itself.
+WORKER_EVENT_SOURCE = 'slack_bot.worker'
+
+# SQS queue the verified Slack events are sent to, consumed in batches by
+# handler.sqs_handler. Unset invokes this function asynchronously instead.
+DISPATCH_QUEUE_URL = os.environ.get('DISPATCH_QUEUE_URL', '')
+
+# Created on first use and kept for the lifetime of the container.
+_lambda_client = None
+_sqs_client = None
+# Replaces the self-invocation when set, e.g. with an InProcessDispatcher in tests.
+_dispatcher = None
+
+
+class InProcessDispatcher:
+    """
+    Local stand-in for the asynchronous self-invocation.
+
+    Worker events are queued when dispatched and only run when drain is called,
+    so a test can check what the handler returned before the work is done.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def drain(self, handler):
+        """
+        Args:
+            handler (function): Lambda handler the worker events are passed to
+        Returns:
+            list: return values of the handler, one per worker event
+        """
+        results = []
+        while self.events:
+            results.append(handler(self.events.pop(0), None))
+        return results
+
+
+def is_worker_event(event):
+    """
+    Args:
+        event (dict): Lambda event
+    Returns:
+        bool: True if the event has been sent by dispatch
+    """
+    return event.get('source') == WORKER_EVENT_SOURCE
+
+
+def dispatch(body):
+    """
+    Hand a verified Slack event over to a worker invocation.
+
+    Args:
+        body (dict): request body sent by Slack
+    """
+    event = {
+        'source': WORKER_EVENT_SOURCE,
+        'body': body
+    }
+    if _dispatcher is not None:
+        _dispatcher(event)
+    elif DISPATCH_QUEUE_URL:
+        send_to_queue(body)
+    else:
+        invoke_self(event)
+
+
+def get_lambda_client():
+    """
+    Returns:
+        object: boto3 Lambda client shared by all invocations of this container
+    """
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+        _lambda_client = boto3.client('lambda')
+    return _lambda_client
+
+
+def get_sqs_client():
+    """
+    Returns:
+        object: boto3 SQS client shared by all invocations of this container
+    """
+    global _sqs_client
+    if _sqs_client is None:
+        import boto3
+        _sqs_client = boto3.client('sqs')
+    return _sqs_client
+
+
+def get_client():
+    """
+    Returns:
+        object: client used by dispatch, SQS or Lambda depending on DISPATCH_QUEUE_URL
+    """
+    if DISPATCH_QUEUE_URL:
+        return get_sqs_client()
+    return get_lambda_client()
+
+
+def send_to_queue(body):
+    """
+    Args:
+        body (dict): request body sent by Slack
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sqs/client/send_message.html
+    """
+    get_sqs_client().send_message(
+        QueueUrl=DISPATCH_QUEUE_URL,
+        MessageBody=json.dumps(body)
+    )
+
+
+def invoke_self(event):
+    """
+    Invoke this function asynchronously (InvocationType=Event).
+
+    Args:
+        event (dict): event passed to the worker invocation
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/lambda/client/invoke.html
+    """
+    response = get_lambda_client().invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps(event).encode('utf-8')
+    )
+    if response['StatusCode'] != 202:
+        logger.error(f"Error invoking worker: {response}")
+
+
+def set_dispatcher(dispatcher):
+    """
+    Args:
+        dispatcher (function): called with the worker event instead of invoke_self
+    """
+    global _dispatcher
+    _dispatcher = dispatcher
+
+
+def reset_dispatcher():
+    """
+    Go back to invoking this function.
+    """
+    global _dispatcher
+    _dispatcher = None
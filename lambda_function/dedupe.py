@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# Table holding one marker item per processed event. Empty keeps the
+# markers in memory only, which does not catch retries sent to another container.
+DEDUPE_TABLE = os.environ.get('DEDUPE_TABLE', '')
+# Seconds a processed event is remembered. Slack gives up retrying after about an hour.
+DEDUPE_TTL = int(os.environ.get('DEDUPE_TTL', '3600'))
+# Number of processed events remembered in memory.
+DEDUPE_CACHE_SIZE = int(os.environ.get('DEDUPE_CACHE_SIZE', '10000'))
+
+# Created on first use and kept for the lifetime of the container.
+_deduplicator = None
+_lock = threading.Lock()
+
+
+def event_key(body):
+    """
+    Args:
+        body (dict): request body sent by Slack
+    Returns:
+        str: id shared by every delivery of the same message, or None if there is none
+    """
+    event = body.get('event', {})
+    if event.get('client_msg_id'):
+        return 'msg#' + event['client_msg_id']
+    if body.get('event_id'):
+        return 'event#' + body['event_id']
+    return None
+
+
+class EventDeduplicator:
+    """
+    Remembers processed events in an LRU of the container, backed by
+    marker items written with a conditional PutItem.
+    """
+
+    def __init__(self, table_name=DEDUPE_TABLE, ttl=DEDUPE_TTL, cache_size=DEDUPE_CACHE_SIZE, clock=time.time):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.clock = clock
+        self.duplicates = 0
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, expires_at):
+        with self._lock:
+            self._seen[key] = expires_at
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.cache_size:
+                self._seen.popitem(last=False)
+
+    def _seen_recently(self, key, now):
+        with self._lock:
+            expires_at = self._seen.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= now:
+                del self._seen[key]
+                return False
+            return True
+
+    def claim(self, client, key):
+        """
+        Args:
+            client (object): boto3 DynamoDB client
+            key (str): id returned by event_key
+        Returns:
+            bool: True for the first delivery of the event, False for a duplicate
+
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb/client/put_item.html
+        """
+        # botocore is already loaded by the client
+        from botocore.exceptions import ClientError
+
+        now = int(self.clock())
+        expires_at = now + self.ttl
+        if self._seen_recently(key, now):
+            self.duplicates += 1
+            return False
+
+        if self.table_name:
+            try:
+                # DynamoDB deletes expired items lazily, so an expired marker may still exist
+                client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        'event_key': {'S': key},
+                        'expires_at': {'N': str(expires_at)}
+                    },
+                    ConditionExpression="attribute_not_exists(event_key) OR expires_at < :now",
+                    ExpressionAttributeValues={
+                        ':now': {'N': str(now)}
+                    }
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                self._remember(key, expires_at)
+                self.duplicates += 1
+                return False
+
+        self._remember(key, expires_at)
+        return True
+
+    def release(self, client, key):
+        """
+        Forget an event whose processing failed, so that a retry is processed.
+
+        Args:
+            client (object): boto3 DynamoDB client
+            key (str): id returned by event_key
+        """
+        with self._lock:
+            self._seen.pop(key, None)
+        if self.table_name:
+            client.delete_item(
+                TableName=self.table_name,
+                Key={'event_key': {'S': key}}
+            )
+
+
+def get_deduplicator():
+    """
+    Returns:
+        EventDeduplicator: deduplicator shared by all invocations of this container
+    """
+    global _deduplicator
+    if _deduplicator is None:
+        with _lock:
+            if _deduplicator is None:
+                _deduplicator = EventDeduplicator(table_name=DEDUPE_TABLE, ttl=DEDUPE_TTL, cache_size=DEDUPE_CACHE_SIZE)
+    return _deduplicator
+
+
+def reset_deduplicator():
+    """
+    Drop the shared deduplicator. The next get_deduplicator call creates a new one.
+    """
+    global _deduplicator
+    _deduplicator = None
@@ -0,0 +1,185 @@
+import logging
+import random
+import time
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+logger = logging.getLogger()
+
+# Service limits
+# https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/ServiceQuotas.html
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+TRANSACT_WRITE_LIMIT = 100
+
+# Cancellation reasons that are worth retrying with the same actions.
+RETRYABLE_CANCELLATION_CODES = ('TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded')
+
+
+def chunked(items, size):
+    """
+    Args:
+        items (list): items to split
+        size (int): maximum number of items per chunk
+    Returns:
+        generator: lists of at most `size` items, in order
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def backoff(attempt, base_delay=0.05, max_delay=1.0):
+    """
+    Sleep with exponential backoff and full jitter.
+
+    Args:
+        attempt (int): number of attempts made so far (1 for the first retry)
+        base_delay (float): delay in seconds of the first retry
+        max_delay (float): upper bound of the delay in seconds
+    """
+    time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** attempt))))
+
+
+def batch_write_items(client, table_name, items, max_attempts=5):
+    """
+    Write items with BatchWriteItem, 25 items per call, retrying unprocessed items.
+
+    Args:
+        client (object): boto3 DynamoDB client
+        table_name (str): name of the table
+        items (list): items in DynamoDB JSON format
+        max_attempts (int): number of calls made per chunk before giving up
+    Returns:
+        dict:
+            ok (bool): True if every item has been written.
+            unprocessed (list): items that could not be written after all retries.
+            calls (int): number of BatchWriteItem calls.
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb/client/batch_write_item.html
+    """
+    unprocessed = []
+    calls = 0
+    for chunk in chunked(items, BATCH_WRITE_LIMIT):
+        requests = [{'PutRequest': {'Item': item}} for item in chunk]
+        for attempt in range(max_attempts):
+            if attempt:
+                metrics.count('DynamoDBRetries')
+                backoff(attempt)
+            response = client.batch_write_item(RequestItems={table_name: requests})
+            calls += 1
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not requests:
+                break
+        unprocessed.extend(request['PutRequest']['Item'] for request in requests)
+
+    if unprocessed:
+        logger.error(f"BatchWriteItem left {len(unprocessed)} unprocessed items in {table_name}")
+
+    return {
+        'ok': not unprocessed,
+        'unprocessed': unprocessed,
+        'calls': calls
+    }
+
+
+def batch_get_items(client, table_name, keys, consistent_read=False, max_attempts=5):
+    """
+    Read items with BatchGetItem, 100 keys per call, retrying unprocessed keys.
+
+    Args:
+        client (object): boto3 DynamoDB client
+        table_name (str): name of the table
+        keys (list): primary keys in DynamoDB JSON format
+        consistent_read (bool): use strongly consistent reads
+        max_attempts (int): number of calls made per chunk before giving up
+    Returns:
+        dict:
+            ok (bool): True if every key has been read.
+            items (list): items found, in no particular order.
+            unprocessed (list): keys that could not be read after all retries.
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb/client/batch_get_item.html
+    """
+    items = []
+    unprocessed = []
+    for chunk in chunked(keys, BATCH_GET_LIMIT):
+        request = {'Keys': chunk, 'ConsistentRead': consistent_read}
+        for attempt in range(max_attempts):
+            if attempt:
+                metrics.count('DynamoDBRetries')
+                backoff(attempt)
+            response = client.batch_get_item(RequestItems={table_name: request})
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys', {}).get(table_name)
+            if not request or not request.get('Keys'):
+                request = None
+                break
+        if request:
+            unprocessed.extend(request['Keys'])
+
+    return {
+        'ok': not unprocessed,
+        'items': items,
+        'unprocessed': unprocessed
+    }
+
+
+def transact_write_items(client, actions, group_size=1, max_attempts=3):
+    """
+    Write actions with TransactWriteItems, 100 actions per call.
+
+    Actions are split into transactions without breaking up groups of
+    `group_size` consecutive actions, so related writes (e.g. a Messages put
+    and its UserCounts update) always commit or fail together.
+
+    Args:
+        client (object): boto3 DynamoDB client
+        actions (list): TransactItems entries, e.g. {'Put': {...}} or {'Update': {...}}
+        group_size (int): number of consecutive actions that must stay in the same transaction
+        max_attempts (int): number of calls made per transaction before giving up
+    Returns:
+        dict:
+            ok (bool): True if every transaction has been committed.
+            failed (list): actions of the transactions that were not committed.
+            errors (list): error code of each failed transaction.
+            calls (int): number of TransactWriteItems calls.
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb/client/transact_write_items.html
+    """
+    # botocore is already loaded by the client
+    from botocore.exceptions import ClientError
+
+    chunk_size = TRANSACT_WRITE_LIMIT - TRANSACT_WRITE_LIMIT % group_size
+    failed = []
+    errors = []
+    calls = 0
+    for chunk in chunked(actions, chunk_size):
+        for attempt in range(max_attempts):
+            if attempt:
+                metrics.count('DynamoDBRetries')
+                backoff(attempt)
+            try:
+                client.transact_write_items(TransactItems=chunk)
+                calls += 1
+                break
+            except ClientError as e:
+                calls += 1
+                code = e.response['Error']['Code']
+                reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+                retryable = code == 'TransactionCanceledException' and any(
+                    reason in RETRYABLE_CANCELLATION_CODES for reason in reasons)
+                if not retryable or attempt == max_attempts - 1:
+                    logger.error(f"TransactWriteItems failed: {code} {reasons}")
+                    failed.extend(chunk)
+                    errors.append(code)
+                    break
+
+    return {
+        'ok': not failed,
+        'failed': failed,
+        'errors': errors,
+        'calls': calls
+    }
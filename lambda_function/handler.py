@@ -1,24 +1,110 @@
 import json
 import logging
-import re
-import boto3
 import time
 import os
 
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
-
-import hmac
-import hashlib
+try:
+    from . import startup
+    from . import async_dispatch
+    from . import dedupe
+    from . import dynamodb_batch
+    from . import history
+    from . import leaderboard
+    from . import message_schema
+    from . import metrics
+    from . import outbox
+    from . import prefilter
+    from . import sharded_counter
+    from . import structured_log
+    from . import tokenizer
+    from . import user_cache
+except ImportError:
+    import startup
+    import async_dispatch
+    import dedupe
+    import dynamodb_batch
+    import history
+    import leaderboard
+    import message_schema
+    import metrics
+    import outbox
+    import prefilter
+    import sharded_counter
+    import structured_log
+    import tokenizer
+    import user_cache
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(structured_log.LOG_LEVEL)
 
-dynamodb = boto3.client('dynamodb')
+# Created on first use (see get_dynamodb) and kept for the lifetime of the container.
+dynamodb = None
 
 SLACK_TOKEN = os.environ['SLACK_TOKEN']
 SLACK_SIGNING_SECRET = os.environ['SLACK_SIGNING_SECRET']
 
+# How Messages and UserCounts are written.
+#   item     : one PutItem / UpdateItem per recipient
+#   batch    : Messages with BatchWriteItem, UserCounts with UpdateItem
+#   transact : Messages and UserCounts in TransactWriteItems, then one BatchGetItem for the new counts
+DYNAMODB_WRITE_MODE = os.environ.get('DYNAMODB_WRITE_MODE', 'item')
+
+# Number of threads used to overlap independent Slack and DynamoDB calls.
+# 0 runs every call one after another.
+IO_MAX_WORKERS = int(os.environ.get('IO_MAX_WORKERS', '0'))
+
+# Acknowledge Slack as soon as the request is verified and save the
+# message in an asynchronous invocation of this function.
+FAST_ACK = os.environ.get('FAST_ACK', '0') == '1'
+
+# Created on first use and kept for the lifetime of the container.
+_executor = None
+
+def get_dynamodb():
+    """
+    Returns:
+        object: boto3 DynamoDB client shared by all invocations of this container
+    """
+    global dynamodb
+    if dynamodb is None:
+        boto3 = startup.timed_import('boto3')
+        dynamodb = boto3.client('dynamodb')
+        dynamodb.meta.events.register('after-call.dynamodb', metrics.count_aws_calls('DynamoDB'))
+    return dynamodb
+
+def load_slack_client():
+    """
+    Returns:
+        module: slack_client, imported on first use as importing slack_sdk is slow
+    """
+    return startup.timed_import('slack_client', __package__)
+
+def warm_up():
+    """
+    Import the modules and create the clients and caches used by the handler,
+    without calling DynamoDB or Slack.
+
+    Returns:
+        dict: initialisation report, see startup.report
+    """
+    startup.timed_import('hmac')
+    startup.timed_import('hashlib')
+    get_dynamodb()
+    load_slack_client().get_client(SLACK_TOKEN)
+    dedupe.get_deduplicator()
+    leaderboard.get_cache()
+    history.get_cache()
+    if not user_cache.USER_CACHE_PRELOAD:
+        # the preload calls users.list, leave it to the first message
+        user_cache.get_cache()
+    outbox.get_outbox()
+    if IO_MAX_WORKERS > 0:
+        get_executor()
+    if FAST_ACK:
+        async_dispatch.get_client()
+    return startup.report()
+
+@metrics.instrumented('lambda_handler')
 def lambda_handler(event, context):
     """
     Args:
@@ -27,42 +113,323 @@ def lambda_handler(event, context):
     Returns:
         dict: status code
     """
-    
+
+    if startup.consume_cold_start():
+        logger.info(f"init: {startup.report()}")
+
+    if event.get('warmup'):
+        # scheduled event that keeps the container and its clients warm
+        return {
+            'statusCode': 200,
+            'warmup': warm_up()
+        }
+
+    if async_dispatch.is_worker_event(event):
+        return process_event(event['body'])
+
+    if prefilter.is_stale(event.get('headers')):
+        logger.error("Stale Request Error")
+        metrics.count('SkippedStale')
+        return
+
     if not verify_request(event, SLACK_SIGNING_SECRET):
         logger.error("Verify Request Error")
         return
 
-    logger.info(event['body'])
-    
-    body = json.loads(event['body'])
+    # most deliveries are neither increments nor commands
+    if not prefilter.has_marker(event['body']):
+        metrics.count('SkippedNoIncrement')
+        return {
+            'statusCode': 200,
+        }
+
+    with metrics.stage('parse'):
+        body = json.loads(event['body'])
+
+    reason = prefilter.skip_reason(body)
+    if reason:
+        metrics.count('Skipped' + reason)
+        return {
+            'statusCode': 200,
+        }
+
+    if FAST_ACK:
+        # Slack only waits 3 seconds for the response
+        async_dispatch.dispatch(body)
+        return {
+            'statusCode': 200,
+        }
+
+    # Slack is waiting for the response: do not wait long for a saturated channel
+    return process_event(body, post_max_wait=outbox.SLACK_REQUEST_POST_MAX_WAIT)
+
+
+def process_event(body, post_max_wait=None):
+    """
+    Args:
+        body (dict): request body sent by Slack
+        post_max_wait (float): seconds the reply waits for a saturated channel,
+                               SLACK_POST_MAX_WAIT by default
+    Returns:
+        dict: status code, and the result of chat.postMessage for a reaction message
+    """
+    structured_log.start_event(dedupe.event_key(body))
+    structured_log.debug('event received', event=body['event'])
+
     text = body['event']['text']
 
-    if is_reaction_message(text):
-        # get slack user id from request body
-        from_username = body['event']['user']
+    command = parse_command(text)
+    if command:
+        return answer_command(body['event']['channel'], command, post_max_wait)
+
+    user_map = parse_reaction_message(text)
+
+    if user_map:
+        metrics.set_recipient_count(len(user_map))
+        # Slack retries deliveries it considers slow or failed
+        key = dedupe.event_key(body)
+        deduplicator = dedupe.get_deduplicator()
+        if key is not None and not deduplicator.claim(get_dynamodb(), key):
+            structured_log.info('duplicate event is skipped', key=key)
+            metrics.count('DuplicateEvents')
+            return {
+                'statusCode': 200,
+            }
 
-        user_map = extract_data(text)
+        try:
+            # get slack user id from request body
+            from_username = body['event']['user']
 
-        new_user_count_map = save_data_to_dynamodb(from_username, user_map, text)
+            new_user_count_map = save_data_to_dynamodb(from_username, user_map, text)
 
-        # get channel id from request body
-        channel_id = body['event']['channel']
-        text = ""
-        for username, count in new_user_count_map.items():
-            text += f"{username}: {count}\n"
+            # get channel id from request body
+            channel_id = body['event']['channel']
+            # merged with the scores still pending in the channel, as in save_batch
+            res = post_message(channel_id, scores=new_user_count_map, max_wait=post_max_wait)
+        except Exception:
+            # let the retry of a failed event through
+            if key is not None:
+                deduplicator.release(get_dynamodb(), key)
+            raise
 
-        res = post_message(channel_id, text)
         return {
             'statusCode': 200,
             'ok' : res.get('ok')
         }
     else:
-        logger.info("reaction message is not detected")
+        structured_log.debug('reaction message is not detected')
         return {
             'statusCode': 200,
         }
 
 
+@metrics.instrumented('sqs_handler')
+def sqs_handler(event, context):
+    """
+    Save a batch of verified Slack events sent to SQS by dispatch (DISPATCH_QUEUE_URL).
+
+    The increments of all the reaction messages of the batch are added up, so
+    UserCounts gets one update per user per batch instead of one per message.
+    Other messages (commands) are processed one by one.
+
+    Args:
+        event (dict): records delivered by the SQS event source mapping
+        context (object): https://docs.aws.amazon.com/lambda/latest/dg/python-context.html
+    Returns:
+        dict: batchItemFailures, the SQS messages to deliver again
+
+    https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html#services-sqs-batchfailurereporting
+    """
+    if startup.consume_cold_start():
+        logger.info(f"init: {startup.report()}")
+
+    deduplicator = dedupe.get_deduplicator()
+    failures = []
+    reactions = []
+    for record in event['Records']:
+        try:
+            body = json.loads(record['body'])
+            text = body['event']['text']
+            user_map = None if parse_command(text) else parse_reaction_message(text)
+            if not user_map:
+                process_event(body)
+                continue
+
+            key = dedupe.event_key(body)
+            structured_log.start_event(key)
+            structured_log.debug('event received', event=body['event'])
+            if key is not None and not deduplicator.claim(get_dynamodb(), key):
+                structured_log.info('duplicate event is skipped', key=key)
+                metrics.count('DuplicateEvents')
+                continue
+            reactions.append({
+                'message_id': record['messageId'],
+                'body': body,
+                'user_map': user_map,
+                'key': key
+            })
+        except Exception:
+            logger.exception(f"Error processing SQS message {record['messageId']}")
+            failures.append(record['messageId'])
+
+    if reactions:
+        try:
+            failures.extend(save_batch(reactions))
+        except Exception:
+            # raised before any count was updated: as in process_event, let
+            # the redelivery of the whole batch through
+            logger.exception("Error saving the SQS batch")
+            for reaction in reactions:
+                if reaction['key'] is not None:
+                    deduplicator.release(get_dynamodb(), reaction['key'])
+                failures.append(reaction['message_id'])
+    metrics.count('Messages', len(event['Records']))
+    metrics.count('FailedMessages', len(failures))
+
+    return {
+        'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]
+    }
+
+
+def message_timestamp(slack_event):
+    """
+    Args:
+        slack_event (dict): `event` of the request body sent by Slack
+    Returns:
+        int: time of the message in milliseconds, from its Slack ts, so that
+             the Messages rows of a redelivered message have the same keys
+    """
+    ts = slack_event.get('ts')
+    if ts:
+        return int(float(ts) * 1000)
+    return int(time.time()*1000)
+
+
+def coalesce_user_maps(user_maps):
+    """
+    Args:
+        user_maps (list): mappings of usernames to their respective counts
+    Returns:
+        dict: mapping of usernames to the sum of their counts
+    """
+    totals = {}
+    for user_map in user_maps:
+        for username, count in user_map.items():
+            totals[username] = totals.get(username, 0) + count
+    return totals
+
+
+@metrics.stage('save_batch')
+def save_batch(reactions):
+    """
+    Write the Messages rows of several reaction messages with BatchWriteItem,
+    add up their increments into one UserCounts update per user, then post the
+    new counts of each message in its channel.
+
+    A message whose rows could not be written is not counted. A message with a
+    recipient whose update failed is delivered again; its other recipients may
+    then be counted twice, as with a failed single event.
+
+    Once the counts have been updated, nothing is raised: a message whose
+    counts were applied is not delivered again, even if its post failed.
+
+    Args:
+        reactions (list): dicts with message_id, body, user_map and key (dedupe key or None)
+    Returns:
+        list: message ids of the reactions to deliver again
+    """
+    all_items = []
+    for reaction in reactions:
+        slack_event = reaction['body']['event']
+        reaction['items'] = build_message_items(
+            slack_event['user'],
+            get_slack_username(slack_event['user']),
+            reaction['user_map'],
+            slack_event['text'],
+            message_timestamp(slack_event)
+        )
+        all_items.extend(reaction['items'])
+
+    response = dynamodb_batch.batch_write_items(get_dynamodb(), 'Messages', all_items)
+    unprocessed = {(item['username']['S'], item['time_to_username']['S']) for item in response['unprocessed']}
+
+    failed = []
+    saved = []
+    for reaction in reactions:
+        keys = {(item['username']['S'], item['time_to_username']['S']) for item in reaction['items']}
+        (failed if keys & unprocessed else saved).append(reaction)
+
+    new_counts = {}
+    failed_users = set()
+    for username, count in coalesce_user_maps([reaction['user_map'] for reaction in saved]).items():
+        try:
+            response = update_user_count(username, count)
+            new_counts[username] = int(response['Attributes']['total_num']['N'])
+        except Exception:
+            logger.exception(f"Error updating the count of {username}")
+            failed_users.add(username)
+
+    for reaction in saved:
+        if failed_users.intersection(reaction['user_map']):
+            failed.append(reaction)
+            continue
+        # the messages of a channel share one post with the latest totals
+        outbox.get_outbox().enqueue(
+            reaction['body']['event']['channel'],
+            scores={username: new_counts[username] for username in reaction['user_map']}
+        )
+    try:
+        flush_posts()
+    except Exception:
+        # the posts are dropped by the outbox; delivering the messages again
+        # would count them twice
+        logger.exception("Error posting the counts of the SQS batch")
+        metrics.count('Errors')
+
+    for reaction in failed:
+        # let the redelivery through
+        if reaction['key'] is not None:
+            dedupe.get_deduplicator().release(get_dynamodb(), reaction['key'])
+
+    structured_log.info('batch saved', messages=len(reactions), rows=len(all_items),
+                        count_updates=len(new_counts) + len(failed_users), failed=len(failed))
+    return [reaction['message_id'] for reaction in failed]
+
+
+def parse_command(text):
+    """
+    Args:
+        text (str): message posted on slack
+    Returns:
+        tuple: command of leaderboard.parse_command or history.parse_command,
+               or None if the message is not a command
+    """
+    return leaderboard.parse_command(text) or history.parse_command(text)
+
+
+@metrics.stage('answer_command')
+def answer_command(channel_id, command, post_max_wait=None):
+    """
+    Args:
+        channel_id (str): Slack channel ID
+        command (tuple): value returned by parse_command
+        post_max_wait (float): seconds the answer waits for a saturated channel,
+                               SLACK_POST_MAX_WAIT by default
+    Returns:
+        dict: status code, and the result of chat.postMessage
+    """
+    if command[0] == 'history':
+        text = history.answer(get_dynamodb(), command)
+    else:
+        text = leaderboard.answer(get_dynamodb(), command)
+    res = post_message(channel_id, text, max_wait=post_max_wait)
+    return {
+        'statusCode': 200,
+        'ok' : res.get('ok')
+    }
+
+
+@metrics.stage('verify_request')
 def verify_request(event, slack_signing_secret):
     """
     Args:
@@ -73,6 +440,9 @@ def verify_request(event, slack_signing_secret):
 
     https://api.slack.com/authentication/verifying-requests-from-slack
     """
+    hmac = startup.timed_import('hmac')
+    hashlib = startup.timed_import('hashlib')
+
     request_body = event['body']
     headers = event['headers']
     timestamp = headers['x-slack-request-timestamp']
@@ -93,6 +463,22 @@ def verify_request(event, slack_signing_secret):
         return False
 
 
+def build_message_items(from_username, display_name, user_map, msg, timestamp, version=None):
+    """
+    Args:
+        from_username (str): Slack user id of the sender
+        display_name (str): display name of the sender
+        user_map (dict): A mapping of usernames to their respective counts.
+                         Format: {username (str): count (int)}
+        msg (str): message posted on Slack
+        timestamp (int): time of the message in milliseconds
+        version (int): layout of the items, MESSAGES_SCHEMA_VERSION by default
+    Returns:
+        list: Messages items in DynamoDB JSON format, see message_schema
+    """
+    return message_schema.build_items(from_username, display_name, user_map, msg, timestamp, version)
+
+@metrics.stage('put_item_to_messages')
 def put_item_to_messages(from_username, user_map, msg):
     """
     Args:
@@ -112,25 +498,76 @@ def put_item_to_messages(from_username, user_map, msg):
     # get display name from 'from_username'
     display_name = get_slack_username(from_username)
 
+    items = build_message_items(from_username, display_name, user_map, msg, timestamp)
     result = []
-    for to_username, count in user_map.items():
-        time_to_username = str(timestamp) + '#' + to_username
-        
-        response = dynamodb.put_item(
+    for item in items:
+        response = get_dynamodb().put_item(
             TableName='Messages',
-            Item={
-                'username': {'S': from_username},
-                'time_to_username': {'S': time_to_username},
-                'to_username': {'S': to_username},
-                'from_username': {'S': display_name},
-                'message': {'S': msg},
-                'incr_num': {'N': str(count)}
-            }
+            Item=item
         )
         result.append(response['ResponseMetadata']['HTTPStatusCode'])
 
-    return {'ok' : result.count(200) == len(user_map)}
+    return {'ok' : result.count(200) == len(items)}
+
+@metrics.stage('batch_put_item_to_messages')
+def batch_put_item_to_messages(from_username, user_map, msg):
+    """
+    Same as put_item_to_messages, but writes all recipients with BatchWriteItem.
+
+    Args:
+        from_username (str): Slack user id
+        user_map (dict): A mapping of usernames to their respective counts.
+                         Format: {username (str): count (int)}
+        msg (str): message posted on Slack
+    Returns:
+        dict:
+            ok (bool): True if all items have been written.
+            unprocessed (list): recipients whose items could not be written.
+    """
+    timestamp = int(time.time()*1000)
+    display_name = get_slack_username(from_username)
+
+    items = build_message_items(from_username, display_name, user_map, msg, timestamp)
+    response = dynamodb_batch.batch_write_items(get_dynamodb(), 'Messages', items)
 
+    unprocessed = set()
+    for item in response['unprocessed']:
+        if message_schema.is_message_item(item):
+            # the message item is needed by all the recipients
+            unprocessed.update(user_map)
+        else:
+            unprocessed.add(item['to_username']['S'])
+
+    return {
+        'ok': response['ok'],
+        'unprocessed': [username for username in user_map if username in unprocessed]
+    }
+
+def update_user_count(username, count):
+    """
+    Args:
+        username (str): username whose count is incremented
+        count (int): increment
+    Returns:
+        dict: UpdateItem response with the new total_num in 'Attributes'
+    """
+    if sharded_counter.SHARDED_COUNTERS:
+        return sharded_counter.get_counters().increment(get_dynamodb(), username, count, leaderboard.BOARD)
+
+    return get_dynamodb().update_item(
+        TableName='UserCounts',
+        Key={
+            'username': {'S': username}
+        },
+        UpdateExpression="ADD total_num :incr SET board = :board",
+        ExpressionAttributeValues={
+            ':incr': {'N': str(count)},
+            ':board': {'S': leaderboard.BOARD}
+        },
+        ReturnValues="UPDATED_NEW"
+    )
+
+@metrics.stage('increment_count')
 def increment_count(user_map):
     """
     Args:
@@ -147,18 +584,7 @@ def increment_count(user_map):
     result = []
     new_user_count_map = {}
     for username, count in user_map.items():
-        
-        response = dynamodb.update_item(
-            TableName='UserCounts',
-            Key={
-                'username': {'S': username}
-            },
-            UpdateExpression="ADD total_num :incr",
-            ExpressionAttributeValues={
-                ':incr': {'N': str(count)}
-            },
-            ReturnValues="UPDATED_NEW"
-        )
+        response = update_user_count(username, count)
         new_user_count_map[username] = int(response['Attributes']['total_num']['N'])
         result.append(response['ResponseMetadata']['HTTPStatusCode'])
 
@@ -167,6 +593,146 @@ def increment_count(user_map):
         'new_user_count_map' : new_user_count_map
     }
 
+@metrics.stage('transact_save_data')
+def transact_save_data(from_username, user_map, msg):
+    """
+    Write the Messages items and the UserCounts increments of every recipient
+    with TransactWriteItems, then read the new counts with a single BatchGetItem.
+
+    The put and the increment of a recipient are always in the same transaction,
+    so a recipient is either fully saved or not saved at all. With the version 2
+    layout, the whole message is one transaction, as its message item lists
+    every recipient; a message with more recipients than a transaction can
+    hold is written in the version 1 layout.
+
+    Args:
+        from_username (str): Slack user id
+        user_map (dict): A mapping of usernames to their respective counts.
+                         Format: {username (str): count (int)}
+        msg (str): message posted on Slack
+    Returns:
+        dict:
+            ok (bool): True if all recipients have been saved and their counts read.
+            new_user_count_map (dict): A mapping of saved usernames to their respective counts.
+                                       Format: {username (str): count (int)}
+            failed (list): recipients that have not been saved.
+    """
+    timestamp = int(time.time()*1000)
+    display_name = get_slack_username(from_username)
+
+    version = message_schema.MESSAGES_SCHEMA_VERSION
+    if 1 + 2 * len(user_map) > dynamodb_batch.TRANSACT_WRITE_LIMIT:
+        version = 1
+
+    actions = []
+    for item in build_message_items(from_username, display_name, user_map, msg, timestamp, version):
+        actions.append({
+            'Put': {
+                'TableName': 'Messages',
+                'Item': item
+            }
+        })
+        if message_schema.is_message_item(item):
+            continue
+        if sharded_counter.SHARDED_COUNTERS:
+            update = sharded_counter.get_counters().update_action(
+                get_dynamodb(), item['to_username']['S'], item['incr_num']['N'], leaderboard.BOARD)
+        else:
+            update = {
+                'Key': {'username': item['to_username']},
+                'UpdateExpression': "ADD total_num :incr SET board = :board",
+                'ExpressionAttributeValues': {':incr': item['incr_num'], ':board': {'S': leaderboard.BOARD}}
+            }
+        actions.append({
+            'Update': {
+                'TableName': 'UserCounts',
+                **update
+            }
+        })
+
+    group_size = len(actions) if version == 2 else 2
+    response = dynamodb_batch.transact_write_items(get_dynamodb(), actions, group_size=group_size)
+    failed = [
+        sharded_counter.base_username(action['Update']['Key']['username']['S'])
+        for action in response['failed'] if 'Update' in action
+    ]
+    saved = [username for username in user_map if username not in failed]
+
+    if sharded_counter.SHARDED_COUNTERS:
+        new_user_count_map = sharded_counter.get_counters().read_totals(get_dynamodb(), saved)
+    else:
+        keys = [{'username': {'S': username}} for username in saved]
+        counts = dynamodb_batch.batch_get_items(get_dynamodb(), 'UserCounts', keys, consistent_read=True)
+        new_user_count_map = {
+            item['username']['S']: int(item['total_num']['N']) for item in counts['items']
+        }
+
+    return {
+        'ok': response['ok'] and len(new_user_count_map) == len(user_map),
+        'new_user_count_map': new_user_count_map,
+        'failed': failed
+    }
+
+def get_executor():
+    """
+    Returns:
+        ThreadPoolExecutor: thread pool shared by all invocations of this container
+    """
+    global _executor
+    if _executor is None:
+        futures = startup.timed_import('concurrent.futures')
+        _executor = futures.ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix='io')
+    return _executor
+
+@metrics.stage('concurrent_save_data')
+def concurrent_save_data(from_username, user_map, msg):
+    """
+    Same as put_item_to_messages followed by increment_count, but runs the calls
+    that do not depend on each other at the same time: the Messages writes run
+    together once the users.info lookup has returned, then the UserCounts
+    updates run together. As in the sequential path, no count is incremented
+    unless every Messages item has been written.
+
+    Args:
+        from_username (str): Slack user id
+        user_map (dict): A mapping of usernames to their respective counts.
+                         Format: {username (str): count (int)}
+        msg (str): message posted on Slack
+    Returns:
+        dict:
+            ok (bool): True if all items have been written and all counts incremented.
+            new_user_count_map (dict): A mapping of updated usernames to their respective counts.
+                                       Format: {username (str): count (int)}
+    """
+    executor = get_executor()
+    timestamp = int(time.time()*1000)
+
+    items = build_message_items(from_username, get_slack_username(from_username), user_map, msg, timestamp)
+    if DYNAMODB_WRITE_MODE == 'batch':
+        put_ok = dynamodb_batch.batch_write_items(get_dynamodb(), 'Messages', items)['ok']
+    else:
+        put_futures = [executor.submit(get_dynamodb().put_item, TableName='Messages', Item=item) for item in items]
+        result = [future.result()['ResponseMetadata']['HTTPStatusCode'] for future in put_futures]
+        put_ok = result.count(200) == len(items)
+    if not put_ok:
+        return {'ok': False, 'new_user_count_map': {}}
+
+    increment_futures = {
+        username: executor.submit(update_user_count, username, count)
+        for username, count in user_map.items()
+    }
+    result = []
+    new_user_count_map = {}
+    for username, future in increment_futures.items():
+        response = future.result()
+        new_user_count_map[username] = int(response['Attributes']['total_num']['N'])
+        result.append(response['ResponseMetadata']['HTTPStatusCode'])
+
+    return {
+        'ok': result.count(200) == len(user_map),
+        'new_user_count_map': new_user_count_map
+    }
+
 def save_data_to_dynamodb(from_username, user_map, msg):
     """
     Args:
@@ -179,13 +745,30 @@ def save_data_to_dynamodb(from_username, user_map, msg):
                                     Format: {username (str): count (int)}
     """
 
-    response = put_item_to_messages(from_username, user_map, msg)
-    logger.info(response)
+    if DYNAMODB_WRITE_MODE == 'transact':
+        response = transact_save_data(from_username, user_map, msg)
+        structured_log.debug('data saved', response=response)
+        if not response['ok']:
+            return {'ok': False}
+        return response['new_user_count_map']
+
+    if IO_MAX_WORKERS > 0:
+        response = concurrent_save_data(from_username, user_map, msg)
+        structured_log.debug('data saved', response=response)
+        if not response['ok']:
+            return {'ok': False}
+        return response['new_user_count_map']
+
+    if DYNAMODB_WRITE_MODE == 'batch':
+        response = batch_put_item_to_messages(from_username, user_map, msg)
+    else:
+        response = put_item_to_messages(from_username, user_map, msg)
+    structured_log.debug('messages saved', response=response)
     if not response['ok']:
         return {'ok': False}
 
     response = increment_count(user_map)
-    logger.info(response)
+    structured_log.debug('counts incremented', response=response)
     if not response['ok']:
         return {'ok': False}
 
@@ -193,33 +776,60 @@ def save_data_to_dynamodb(from_username, user_map, msg):
 
     return new_user_count_map
 
-def post_message(channel_id, text, username="++Bot"):
+@metrics.stage('post_message')
+def post_message(channel_id, text=None, username="++Bot", scores=None, max_wait=None):
     """
+    Post a message through the outbox, which keeps to the rate limit of the
+    channel and waits for its Retry-After.
+
     Args:
         channel_id (str): Slack channel ID
         text (str): message that will be posted to Slack
         username (str): username of Slack bot
+        scores (dict): new totals posted instead of text, one user per line, merged
+                       with the scores still pending in the channel
+                       Format: {username (str): count (int)}
+        max_wait (float): seconds to wait for a saturated channel, SLACK_POST_MAX_WAIT by default
     Returns:
-        (object): Slack API response
-    
-    https://api.slack.com/methods/chat.postMessage
+        (object): Slack API response, or outbox.DROPPED_RESPONSE if the channel stayed saturated
     """
-    # Create a Slack client with your token
-    client = WebClient(token=SLACK_TOKEN)
+    post = outbox.get_outbox().enqueue(channel_id, text=text, scores=scores, username=username)
+    outbox.get_outbox().flush(send_message, max_wait)
+    return outbox.response_of(post)
 
-    try:
-        # Call the chat.postMessage method using the WebClient
-        response = client.chat_postMessage(
-            channel = channel_id,
-            text = text,
-            username = username
-        )
-        logger.info(response)
-        return response
-    except SlackApiError as e:
-        logger.error(f"Error posting message: {e}")
-        return e.response
+@metrics.stage('post_message')
+def flush_posts():
+    """
+    Send the posts queued in the outbox, e.g. the scores of a batch.
+    """
+    outbox.get_outbox().flush(send_message)
+
+def send_message(channel_id, text, username="++Bot"):
+    """
+    Args:
+        channel_id (str): Slack channel ID
+        text (str): message that will be posted to Slack
+        username (str): username of Slack bot
+    Returns:
+        (object): Slack API response
+    Raises:
+        SlackApiError: if Slack answers with an error, e.g. 429 when the channel is rate limited
 
+    https://api.slack.com/methods/chat.postMessage
+    """
+    # Slack client shared by warm invocations
+    client = load_slack_client().get_client(SLACK_TOKEN)
+
+    # Call the chat.postMessage method using the WebClient
+    response = client.chat_postMessage(
+        channel = channel_id,
+        text = text,
+        username = username
+    )
+    structured_log.debug('message posted', channel=channel_id, ok=response.get('ok'))
+    return response
+
+@metrics.stage('get_slack_username')
 def get_slack_username(user_id):
     """
     Args:
@@ -229,7 +839,14 @@ def get_slack_username(user_id):
 
     https://api.slack.com/methods/users.info
     """
-    client = WebClient(token=SLACK_TOKEN)
+    slack_client = load_slack_client()
+    client = slack_client.get_client(SLACK_TOKEN)
+
+    # display names of recent senders are kept by warm containers
+    cache = user_cache.get_cache(client)
+    display_name = cache.get(user_id)
+    if display_name is not None:
+        return display_name
 
     try:
         response = client.users_info(user=user_id)
@@ -239,15 +856,30 @@ def get_slack_username(user_id):
             display_name = response['user']['profile']['display_name']
             # real_name
             real_name = response['user']['profile']['real_name']
-            logger.info(f"display name:{display_name}, real name:{real_name}")
+            structured_log.debug('user fetched', user=user_id, display_name=display_name, real_name=real_name)
+            cache.put(user_id, display_name)
+            user_cache.save_snapshot(cache)
+            structured_log.debug('user cache', stats=cache.stats)
             return display_name
         else:
             logger.error(f"users_info response: {response}")
             return ""
-    except SlackApiError as e:
+    except slack_client.SlackApiError as e:
         logger.error(f"Error fetching user info: {e.response['error']}")
         return ""
 
+@metrics.stage('parse')
+def parse_reaction_message(text):
+    """
+    Args:
+        text (str): message posted on slack
+    Returns:
+        dict: mapping of usernames to their respective frequencies of occurrence,
+              or None if the message is not in {username}++ format
+    """
+    is_reaction, user_map = tokenizer.parse(text)
+    return user_map if is_reaction else None
+
 def is_reaction_message(text):
     """
     Args:
@@ -256,8 +888,7 @@ def is_reaction_message(text):
     Returns:
         bool: {username}++ format or not
     """
-    pattern = r'(\w+\+\+ *)+\s*.*'
-    return bool(re.match(pattern, text))
+    return tokenizer.parse(text)[0]
 
 def extract_data(text):
     """
@@ -266,13 +897,9 @@ def extract_data(text):
     Returns:
         dict: mapping of usernames to their respective frequencies of occurrence
     """
-    # search the pattern like 'username++'
-    pattern = r'(\w+)\+\+'
-    usernames = re.findall(pattern, text)
+    return tokenizer.parse(text)[1]
 
-    # count the occurrence frequency of each username
-    user_map = {}
-    for user in usernames:
-        user_map[user] = 1 + user_map.get(user, 0)
+if not startup.LAZY_INIT:
+    warm_up()
 
-    return user_map
\ No newline at end of file
+startup.init_done()
@@ -0,0 +1,212 @@
+import base64
+import datetime
+import json
+import os
+import re
+
+try:
+    from . import dynamodb_batch
+    from . import leaderboard
+    from . import message_schema
+except ImportError:
+    import dynamodb_batch
+    import leaderboard
+    import message_schema
+
+# Index of Messages by recipient (to_username), sorted by time_to_username,
+# whose millisecond timestamp prefix sorts the messages by time.
+HISTORY_INDEX = os.environ.get('HISTORY_INDEX', 'history')
+# Seconds a page of history is answered from memory.
+HISTORY_CACHE_TTL = float(os.environ.get('HISTORY_CACHE_TTL', '10'))
+# Messages listed by `++history`.
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '10'))
+HISTORY_MAX_PAGE_SIZE = 100
+# Characters of a message shown by `++history`.
+HISTORY_TEXT_MAX = 80
+
+# `++history alice`, `++history <@U123>`, `++history alice <cursor>`
+COMMAND_PATTERN = re.compile(r'\+\+history\s+(\S+)(?:\s+(\S+))?\s*', re.IGNORECASE)
+
+# Created on first use and kept for the lifetime of the container.
+_cache = None
+
+
+def parse_command(text):
+    """
+    Args:
+        text (str): message posted on slack
+    Returns:
+        tuple: ('history', (to_username, cursor)), or None if the message is not a history command
+    """
+    match = COMMAND_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+    return 'history', (leaderboard.counter_name(match.group(1)), match.group(2))
+
+
+def encode_cursor(last_evaluated_key):
+    """
+    Args:
+        last_evaluated_key (dict): LastEvaluatedKey of a history Query
+    Returns:
+        str: opaque token of the next page, or None if there is no next page
+    """
+    if not last_evaluated_key:
+        return None
+    position = [last_evaluated_key['username']['S'], last_evaluated_key['time_to_username']['S']]
+    data = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, to_username):
+    """
+    Args:
+        cursor (str): token returned by encode_cursor
+        to_username (str): recipient whose history is read
+    Returns:
+        dict: ExclusiveStartKey of the next Query
+    Raises:
+        ValueError: if the token is malformed or belongs to the history of another user
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        username, time_to_username = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    if not isinstance(time_to_username, str) or not time_to_username.endswith('#' + to_username):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return {
+        'username': {'S': username},
+        'time_to_username': {'S': time_to_username},
+        'to_username': {'S': to_username}
+    }
+
+
+def query_page(client, to_username, limit=HISTORY_PAGE_SIZE, cursor=None):
+    """
+    Read the most recent messages received by a user, newest first.
+
+    The text of a version 2 recipient item is read from its message item,
+    with one BatchGetItem for the page.
+
+    Args:
+        client (object): boto3 DynamoDB client
+        to_username (str): recipient
+        limit (int): messages per page
+        cursor (str): token of the page to read, None for the first page
+    Returns:
+        dict:
+            entries (list): dicts with timestamp (ms), username (sender id),
+                            from_username (display name), incr_num and message
+            cursor (str): token of the next page, or None on the last page
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb/client/query.html
+    """
+    request = {
+        'TableName': 'Messages',
+        'IndexName': HISTORY_INDEX,
+        'KeyConditionExpression': 'to_username = :to_username',
+        'ExpressionAttributeValues': {':to_username': {'S': to_username}},
+        'ScanIndexForward': False,
+        'Limit': min(limit, HISTORY_MAX_PAGE_SIZE)
+    }
+    if cursor:
+        request['ExclusiveStartKey'] = decode_cursor(cursor, to_username)
+    response = client.query(**request)
+    items = response['Items']
+
+    message_keys = {}
+    for item in items:
+        if message_schema.is_recipient_item(item):
+            key = (item['username']['S'], item['time_to_username']['S'].split('#', 1)[0])
+            message_keys[key] = {'username': {'S': key[0]}, 'time_to_username': {'S': key[1]}}
+    messages = {}
+    if message_keys:
+        found = dynamodb_batch.batch_get_items(client, 'Messages', list(message_keys.values()))
+        messages = {(item['username']['S'], item['time_to_username']['S']): item for item in found['items']}
+
+    entries = []
+    for item in items:
+        timestamp = item['time_to_username']['S'].split('#', 1)[0]
+        source = messages.get((item['username']['S'], timestamp), item)
+        entries.append({
+            'timestamp': int(timestamp),
+            'username': item['username']['S'],
+            'from_username': source.get('from_username', {}).get('S', ''),
+            'incr_num': int(item['incr_num']['N']),
+            'message': message_schema.decode_text(source) or ''
+        })
+
+    return {
+        'entries': entries,
+        'cursor': encode_cursor(response.get('LastEvaluatedKey'))
+    }
+
+
+def iter_history(client, to_username, page_size=HISTORY_PAGE_SIZE, cursor=None):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        to_username (str): recipient
+        page_size (int): messages read per Query
+        cursor (str): token of the first page to read, None to start from the newest message
+    Returns:
+        generator: entries of query_page, newest first, reading the next page when needed
+    """
+    while True:
+        page = query_page(client, to_username, page_size, cursor)
+        yield from page['entries']
+        cursor = page['cursor']
+        if cursor is None:
+            return
+
+
+def answer(client, command):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        command (tuple): value returned by parse_command
+    Returns:
+        str: message posted in reply to the command
+    """
+    to_username, cursor = command[1]
+    try:
+        page = get_cache().get_or_load(
+            ('history', to_username, HISTORY_PAGE_SIZE, cursor),
+            lambda: query_page(client, to_username, HISTORY_PAGE_SIZE, cursor)
+        )
+    except ValueError:
+        return f"The cursor {cursor} is not one of {to_username}'s history.\n"
+
+    if not page['entries']:
+        return f"{to_username} has not received ++ yet.\n"
+
+    text = ""
+    for entry in page['entries']:
+        time = datetime.datetime.fromtimestamp(entry['timestamp'] / 1000, datetime.timezone.utc)
+        message = entry['message']
+        if len(message) > HISTORY_TEXT_MAX:
+            message = message[:HISTORY_TEXT_MAX] + '...'
+        text += f"{time:%Y-%m-%d %H:%M} {entry['from_username']} +{entry['incr_num']}: {message}\n"
+    if page['cursor']:
+        text += f"more: ++history {to_username} {page['cursor']}\n"
+    return text
+
+
+def get_cache():
+    """
+    Returns:
+        ReadCache: cache of the history pages shared by all invocations of this container
+    """
+    global _cache
+    if _cache is None:
+        _cache = leaderboard.ReadCache(ttl=HISTORY_CACHE_TTL)
+    return _cache
+
+
+def reset_cache():
+    """
+    Forget the cached pages, e.g. between tests.
+    """
+    global _cache
+    _cache = None
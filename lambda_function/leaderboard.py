@@ -0,0 +1,196 @@
+import os
+import re
+import threading
+import time
+
+try:
+    from . import sharded_counter
+    from . import tokenizer
+except ImportError:
+    import sharded_counter
+    import tokenizer
+
+# Index of UserCounts sorted by total_num: every item has the same `board`
+# partition, so one Query returns the leaderboard in order.
+LEADERBOARD_INDEX = os.environ.get('LEADERBOARD_INDEX', 'leaderboard')
+BOARD = 'all'
+# Seconds a leaderboard or a score is answered from memory.
+LEADERBOARD_CACHE_TTL = float(os.environ.get('LEADERBOARD_CACHE_TTL', '10'))
+# Entries of `++top` without a number, and the most a command can ask for.
+LEADERBOARD_DEFAULT_SIZE = 10
+LEADERBOARD_MAX_SIZE = 50
+
+# `++top`, `++top 10`, `++score alice`, `++score <@U123>`
+COMMAND_PATTERN = re.compile(r'\+\+(top|score)(?:\s+(\S+))?\s*', re.IGNORECASE)
+
+# Created on first use and kept for the lifetime of the container.
+_cache = None
+
+
+class ReadCache:
+    """
+    Results of the leaderboard reads, kept for a few seconds.
+    """
+
+    def __init__(self, ttl=LEADERBOARD_CACHE_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load):
+        """
+        Args:
+            key (tuple): what is read, e.g. ('top', 10)
+            load (function): called without arguments to read the value when it is not cached
+        Returns:
+            object: cached or loaded value
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = load()
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (value, now + self.ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def parse_command(text):
+    """
+    Args:
+        text (str): message posted on slack
+    Returns:
+        tuple: ('top', size) or ('score', username), or None if the message is not a command
+    """
+    match = COMMAND_PATTERN.fullmatch(text.strip())
+    if match is None:
+        return None
+
+    command, argument = match.group(1).lower(), match.group(2)
+    if command == 'top':
+        if argument is None:
+            return 'top', LEADERBOARD_DEFAULT_SIZE
+        if not argument.isdigit() or int(argument) == 0:
+            return None
+        return 'top', min(int(argument), LEADERBOARD_MAX_SIZE)
+
+    if argument is None:
+        return None
+    return 'score', counter_name(argument)
+
+
+def counter_name(argument):
+    """
+    Args:
+        argument (str): user named in a command, e.g. alice, alice++ or <@U123>
+    Returns:
+        str: name of the user's counter, which is also the to_username of its messages
+    """
+    mention = tokenizer.MENTION_PATTERN.fullmatch(argument)
+    if mention:
+        # counters of mentioned users are named <@U123>
+        return f"<@{mention.group(1)}>"
+    return argument.rstrip('+')
+
+
+def query_top(client, size):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        size (int): number of users
+    Returns:
+        list: [(username, total_num)] by decreasing total_num
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb/client/query.html
+    """
+    sharded = []
+    if sharded_counter.SHARDED_COUNTERS:
+        sharded = sharded_counter.get_counters().registered(client)
+
+    response = client.query(
+        TableName='UserCounts',
+        IndexName=LEADERBOARD_INDEX,
+        KeyConditionExpression='board = :board',
+        ExpressionAttributeValues={':board': {'S': BOARD}},
+        ScanIndexForward=False,
+        # the index only has the unsharded part of a sharded user's total: read
+        # enough users to still have `size` exact ones if every sharded user is in
+        Limit=size + len(sharded)
+    )
+    top = [(item['username']['S'], int(item['total_num']['N'])) for item in response['Items']]
+    if not sharded:
+        return top
+
+    totals = dict(top)
+    totals.update(sharded_counter.get_counters().read_totals(client, sharded, consistent_read=False))
+    return sorted(totals.items(), key=lambda entry: (-entry[1], entry[0]))[:size]
+
+
+def get_score(client, username):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        username (str): name of the counter
+    Returns:
+        int: total_num of the user, 0 if the user has never been incremented
+    """
+    if sharded_counter.SHARDED_COUNTERS:
+        return sharded_counter.get_counters().read_totals(client, [username], consistent_read=False).get(username, 0)
+
+    response = client.get_item(
+        TableName='UserCounts',
+        Key={'username': {'S': username}}
+    )
+    item = response.get('Item')
+    return int(item['total_num']['N']) if item else 0
+
+
+def answer(client, command):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        command (tuple): value returned by parse_command
+    Returns:
+        str: message posted in reply to the command
+    """
+    cache = get_cache()
+    name, argument = command
+    if name == 'top':
+        top = cache.get_or_load(('top', argument), lambda: query_top(client, argument))
+        if not top:
+            return "No one has received ++ yet."
+        return ''.join(f"{rank}. {username}: {total}\n" for rank, (username, total) in enumerate(top, 1))
+
+    total = cache.get_or_load(('score', argument), lambda: get_score(client, argument))
+    return f"{argument}: {total}\n"
+
+
+def get_cache():
+    """
+    Returns:
+        ReadCache: cache shared by all invocations of this container
+    """
+    global _cache
+    if _cache is None:
+        _cache = ReadCache()
+    return _cache
+
+
+def reset_cache():
+    """
+    Forget the cached reads, e.g. between tests.
+    """
+    global _cache
+    _cache = None
@@ -0,0 +1,160 @@
+"""
+Layouts of the Messages table.
+
+Version 1 writes one item per recipient, each holding the whole message:
+
+    username | time_to_username | to_username, from_username, message, incr_num
+
+Version 2 writes the message once, plus one small item per recipient sharing
+its partition key and the `{timestamp}` prefix of its sort key:
+
+    username | {timestamp}             | from_username, message or message_z, recipients
+    username | {timestamp}#{recipient} | to_username, incr_num
+
+`message_z` holds the zlib compressed text of the messages longer than
+MESSAGE_COMPRESS_THRESHOLD bytes, `recipients` the increment of every
+recipient, so that a reader of the message item does not need its recipient
+items. Both layouts can be found in the same table.
+
+Also used by the Firehose transform, which gets a copy of this file.
+"""
+import base64
+import os
+import zlib
+
+# Layout of the Messages items written by the Slack App function (1 or 2).
+MESSAGES_SCHEMA_VERSION = int(os.environ.get('MESSAGES_SCHEMA_VERSION', '1'))
+# Messages longer than this many bytes are stored compressed (version 2 only). 0 never compresses.
+MESSAGE_COMPRESS_THRESHOLD = int(os.environ.get('MESSAGE_COMPRESS_THRESHOLD', '1024'))
+
+
+def build_items(from_username, display_name, user_map, msg, timestamp, version=None):
+    """
+    Args:
+        from_username (str): Slack user id of the sender
+        display_name (str): display name of the sender
+        user_map (dict): A mapping of usernames to their respective counts.
+                         Format: {username (str): count (int)}
+        msg (str): message posted on Slack
+        timestamp (int): time of the message in milliseconds
+        version (int): layout, MESSAGES_SCHEMA_VERSION by default
+    Returns:
+        list: Messages items in DynamoDB JSON format; with version 2 the message item comes first
+    """
+    version = MESSAGES_SCHEMA_VERSION if version is None else version
+    if version == 2:
+        return build_v2_items(from_username, display_name, user_map, msg, timestamp)
+    return build_v1_items(from_username, display_name, user_map, msg, timestamp)
+
+
+def build_v1_items(from_username, display_name, user_map, msg, timestamp):
+    items = []
+    for to_username, count in user_map.items():
+        time_to_username = str(timestamp) + '#' + to_username
+        items.append({
+            'username': {'S': from_username},
+            'time_to_username': {'S': time_to_username},
+            'to_username': {'S': to_username},
+            'from_username': {'S': display_name},
+            'message': {'S': msg},
+            'incr_num': {'N': str(count)}
+        })
+    return items
+
+
+def build_v2_items(from_username, display_name, user_map, msg, timestamp):
+    message_item = {
+        'username': {'S': from_username},
+        'time_to_username': {'S': str(timestamp)},
+        'from_username': {'S': display_name},
+        'recipients': {'M': {to_username: {'N': str(count)} for to_username, count in user_map.items()}},
+        **encode_text(msg)
+    }
+    items = [message_item]
+    for to_username, count in user_map.items():
+        items.append({
+            'username': {'S': from_username},
+            'time_to_username': {'S': str(timestamp) + '#' + to_username},
+            'to_username': {'S': to_username},
+            'incr_num': {'N': str(count)}
+        })
+    return items
+
+
+def encode_text(msg, threshold=None):
+    """
+    Args:
+        msg (str): message posted on Slack
+        threshold (int): size in bytes above which the text is compressed, MESSAGE_COMPRESS_THRESHOLD by default
+    Returns:
+        dict: `message` attribute, or `message_z` if compressing makes the text smaller
+    """
+    threshold = MESSAGE_COMPRESS_THRESHOLD if threshold is None else threshold
+    data = msg.encode('utf-8')
+    if threshold and len(data) > threshold:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return {'message_z': {'B': compressed}}
+    return {'message': {'S': msg}}
+
+
+def decode_text(image):
+    """
+    Args:
+        image (dict): Messages item, as returned by boto3 or found in a change record
+    Returns:
+        str: message text, or None if the item has none (recipient item)
+    """
+    if 'message' in image:
+        return image['message']['S']
+    if 'message_z' in image:
+        data = image['message_z']['B']
+        if isinstance(data, str):
+            # change records carry binary values in base64
+            data = base64.b64decode(data)
+        return zlib.decompress(data).decode('utf-8')
+    return None
+
+
+def is_message_item(image):
+    """
+    Returns:
+        bool: True for the message item of the version 2 layout
+    """
+    return 'recipients' in image
+
+
+def is_recipient_item(image):
+    """
+    Returns:
+        bool: True for a recipient item of the version 2 layout
+    """
+    return 'to_username' in image and 'message' not in image and 'message_z' not in image
+
+
+def expand(image):
+    """
+    Args:
+        image (dict): Messages item of either layout, in DynamoDB JSON format
+    Returns:
+        list: items in the version 1 layout; one per recipient for a version 2
+              message item, none for a version 2 recipient item
+    """
+    if is_recipient_item(image):
+        return []
+    if not is_message_item(image):
+        return [image]
+
+    text = decode_text(image)
+    timestamp = image['time_to_username']['S']
+    return [
+        {
+            'username': image['username'],
+            'time_to_username': {'S': timestamp + '#' + to_username},
+            'to_username': {'S': to_username},
+            'from_username': image['from_username'],
+            'message': {'S': text},
+            'incr_num': count
+        }
+        for to_username, count in image['recipients']['M'].items()
+    ]
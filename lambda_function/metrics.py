@@ -0,0 +1,207 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Namespace of the metrics in CloudWatch.
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SlackBot')
+# Write one Embedded Metric Format line per invocation.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Dimension sets of the metrics. Every dimension value is a string.
+DIMENSION_SETS = [['Handler', 'ColdStart'], ['Handler', 'RecipientCount']]
+# Recipient counts from this value up share one dimension value, to bound the number of metrics.
+MAX_RECIPIENT_BUCKET = 5
+
+# Metrics of the invocation in progress. Lambda runs one invocation at a time
+# per container, so a module variable is enough; the lock protects it from
+# the threads of the handler.
+_current = None
+_invocations = 0
+
+
+class Recorder:
+    """
+    Stage durations, counters and dimensions of one invocation.
+    """
+
+    def __init__(self, handler_name, cold_start, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock()
+        self.stages = {}
+        self.counters = {}
+        self.dimensions = {
+            'Handler': handler_name,
+            'ColdStart': 'true' if cold_start else 'false',
+            'RecipientCount': '0',
+        }
+        self._lock = threading.Lock()
+
+    def add_duration(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_emf(self, timestamp_ms=None):
+        """
+        Returns:
+            dict: Embedded Metric Format document of the invocation
+
+        https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+        """
+        with self._lock:
+            stages = {name: round(ms, 3) for name, ms in self.stages.items()}
+            stages['total'] = round((self.clock() - self.start) * 1000, 3)
+            counters = dict(self.counters)
+
+        definitions = [{'Name': name, 'Unit': 'Milliseconds'} for name in stages]
+        definitions += [{'Name': name, 'Unit': 'Count'} for name in counters]
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000) if timestamp_ms is None else timestamp_ms,
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': DIMENSION_SETS,
+                    'Metrics': definitions,
+                }],
+            },
+            **self.dimensions,
+            **stages,
+            **counters,
+        }
+
+
+def start(handler_name):
+    """
+    Start recording the metrics of an invocation.
+
+    Args:
+        handler_name (str): name of the entry point, used as the Handler dimension
+    Returns:
+        Recorder: recorder of the invocation
+    """
+    global _current, _invocations
+    _current = Recorder(handler_name, cold_start=_invocations == 0)
+    _invocations += 1
+    return _current
+
+
+def flush():
+    """
+    Write the metrics of the invocation to stdout as one EMF line, where
+    CloudWatch Logs extracts them. Nothing is written for an invocation
+    without any stage or counter, e.g. a warm-up event.
+    """
+    global _current
+    recorder, _current = _current, None
+    if recorder is None or not METRICS_ENABLED:
+        return
+    if not recorder.stages and not recorder.counters:
+        return
+    sys.stdout.write(json.dumps(recorder.to_emf(), separators=(',', ':')) + '\n')
+    sys.stdout.flush()
+
+
+def instrumented(handler_name):
+    """
+    Decorator of a Lambda entry point: records and flushes the metrics of each invocation.
+
+    Args:
+        handler_name (str): name used as the Handler dimension
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start(handler_name)
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                count('Errors')
+                raise
+            finally:
+                flush()
+        return wrapper
+    return decorator
+
+
+class stage:
+    """
+    Context manager and decorator that adds the time spent in a stage to the
+    current invocation. A stage entered several times is summed.
+
+        with metrics.stage('parse'):
+            ...
+
+        @metrics.stage('post_message')
+        def post_message(...):
+            ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        recorder = _current
+        if recorder is not None:
+            recorder.add_duration(self.name, time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder = _current
+                if recorder is not None:
+                    recorder.add_duration(self.name, time.perf_counter() - start_time)
+        return wrapper
+
+
+def count(name, value=1):
+    """
+    Args:
+        name (str): counter, e.g. DynamoDBCalls
+        value (int): amount added to the counter
+    """
+    recorder = _current
+    if recorder is not None:
+        recorder.count(name, value)
+
+
+def set_recipient_count(recipients):
+    """
+    Args:
+        recipients (int): number of users incremented by the message
+    """
+    recorder = _current
+    if recorder is not None:
+        bucket = str(recipients) if recipients < MAX_RECIPIENT_BUCKET else f"{MAX_RECIPIENT_BUCKET}+"
+        recorder.dimensions['RecipientCount'] = bucket
+
+
+def count_aws_calls(service):
+    """
+    Args:
+        service (str): prefix of the counters, e.g. DynamoDB
+    Returns:
+        function: botocore `after-call` handler counting the API calls and the retries made by botocore
+
+    https://boto3.amazonaws.com/v1/documentation/api/latest/guide/events.html
+    """
+    def after_call(parsed=None, **kwargs):
+        count(f"{service}Calls")
+        retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            count(f"{service}Retries", retries)
+    return after_call
@@ -0,0 +1,300 @@
+import logging
+import os
+import threading
+import time
+
+try:
+    from . import metrics
+    from . import structured_log
+except ImportError:
+    import metrics
+    import structured_log
+
+logger = logging.getLogger()
+
+# Posts per second and burst of posts to one channel. Slack allows about one
+# message per second per channel. 0 does not limit the rate.
+SLACK_CHANNEL_RATE = float(os.environ.get('SLACK_CHANNEL_RATE', '1'))
+SLACK_CHANNEL_BURST = int(os.environ.get('SLACK_CHANNEL_BURST', '3'))
+# Seconds a flush waits for a saturated channel; the posts still pending are dropped.
+SLACK_POST_MAX_WAIT = float(os.environ.get('SLACK_POST_MAX_WAIT', '2'))
+# The same, for the posts made while Slack waits for the response to the request
+# (FAST_ACK=0): Slack delivers again a request not answered within 3 seconds.
+SLACK_REQUEST_POST_MAX_WAIT = float(os.environ.get('SLACK_REQUEST_POST_MAX_WAIT', '0.5'))
+# Posts pending per channel, beyond which the oldest are dropped.
+SLACK_MAX_PENDING_POSTS = 20
+# Seconds a channel is paused after a 429 without Retry-After.
+DEFAULT_RETRY_AFTER = 1.0
+
+# Response of a post that has not been sent.
+DROPPED_RESPONSE = {'ok': False, 'error': 'dropped'}
+
+# Created on first use and kept for the lifetime of the container.
+_outbox = None
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Posts allowed to one channel: `burst` at once, then `rate` per second,
+    none until the end of a Retry-After.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def wait_time(self):
+        """
+        Returns:
+            float: seconds until a post can be sent, 0 if one can be sent now
+        """
+        now = self.clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """
+        Use the token of a post, after wait_time returned 0.
+        """
+        if self.rate:
+            self.tokens -= 1
+
+    def block(self, seconds):
+        """
+        Args:
+            seconds (float): Retry-After of a 429 response
+        """
+        self.blocked_until = self.clock() + seconds
+        # one post when the wait is over, then the rate
+        self.tokens = 1.0
+        self.updated = self.blocked_until
+
+
+def retry_after(error):
+    """
+    Args:
+        error (Exception): error raised by chat.postMessage
+    Returns:
+        float: seconds to wait before posting to the channel again, or None if the call was not rate limited
+    """
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) != 429:
+        return None
+    for name, value in (getattr(response, 'headers', None) or {}).items():
+        if name.lower() == 'retry-after':
+            if isinstance(value, list):
+                value = value[0]
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                break
+    return DEFAULT_RETRY_AFTER
+
+
+def score_text(scores):
+    """
+    Args:
+        scores (dict): new total of each user, {username (str): total (int)}
+    Returns:
+        str: message posted with the new totals, one user per line
+    """
+    return "".join(f"{username}: {total}\n" for username, total in scores.items())
+
+
+class Outbox:
+    """
+    Posts waiting for their channel, sent at the rate Slack accepts.
+
+    A score post that is still pending when another one is queued for the same
+    channel takes the new totals instead, so a busy channel gets one message
+    with the latest totals of every user rather than one message per `++`.
+    """
+
+    def __init__(self, rate=None, burst=None, max_wait=None, max_pending=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate (float): posts per second to one channel, SLACK_CHANNEL_RATE by default
+            burst (int): posts at once to one channel, SLACK_CHANNEL_BURST by default
+            max_wait (float): seconds a flush waits, SLACK_POST_MAX_WAIT by default
+            max_pending (int): posts pending per channel, SLACK_MAX_PENDING_POSTS by default
+            clock (function): returns the current time in seconds
+            sleep (function): waits for a number of seconds
+        """
+        self.rate = SLACK_CHANNEL_RATE if rate is None else rate
+        self.burst = SLACK_CHANNEL_BURST if burst is None else burst
+        self.max_wait = SLACK_POST_MAX_WAIT if max_wait is None else max_wait
+        self.max_pending = SLACK_MAX_PENDING_POSTS if max_pending is None else max_pending
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, channel_id):
+        if channel_id not in self.buckets:
+            self.buckets[channel_id] = TokenBucket(self.rate, self.burst, self.clock)
+        return self.buckets[channel_id]
+
+    def enqueue(self, channel_id, text=None, scores=None, username="++Bot"):
+        """
+        Args:
+            channel_id (str): Slack channel ID
+            text (str): message posted as is
+            scores (dict): new totals, merged into the score post pending in the channel if any
+            username (str): username of Slack bot
+        Returns:
+            dict: the pending post; its `response` is set by flush
+        """
+        with self._lock:
+            queue = self.pending.setdefault(channel_id, [])
+            if scores is not None:
+                for post in queue:
+                    if post['scores'] is not None and post['username'] == username:
+                        post['scores'].update(scores)
+                        metrics.count('SlackPostsMerged')
+                        return post
+
+            post = {'scores': None if scores is None else dict(scores), 'text': text,
+                    'username': username, 'response': None}
+            queue.append(post)
+            metrics.count('SlackPostsQueued')
+            if len(queue) > self.max_pending:
+                self._drop(channel_id, [queue.pop(0)])
+            return post
+
+    def _drop(self, channel_id, posts):
+        for post in posts:
+            post['response'] = DROPPED_RESPONSE
+        metrics.count('SlackPostsDropped', len(posts))
+        structured_log.warning('posts dropped', channel=channel_id, posts=len(posts))
+
+    def _drop_pending(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        for channel_id, posts in pending.items():
+            if posts:
+                self._drop(channel_id, posts)
+
+    def _next(self):
+        """
+        Returns:
+            tuple: (channel_id, post) of a post that can be sent now, or
+                   (None, wait) with the seconds until one can, None if nothing is pending
+        """
+        wait = None
+        with self._lock:
+            for channel_id, queue in list(self.pending.items()):
+                if not queue:
+                    del self.pending[channel_id]
+                    continue
+                bucket = self._bucket(channel_id)
+                seconds = bucket.wait_time()
+                if seconds == 0:
+                    bucket.take()
+                    return channel_id, queue.pop(0)
+                wait = seconds if wait is None else min(wait, seconds)
+        return None, wait
+
+    def _requeue(self, channel_id, post):
+        with self._lock:
+            queue = self.pending.setdefault(channel_id, [])
+            if post['scores'] is not None:
+                for pending in queue:
+                    if pending['scores'] is not None and pending['username'] == post['username']:
+                        # the pending post has the newer totals
+                        post['scores'] = {**post['scores'], **pending['scores']}
+                        queue.remove(pending)
+                        # both callers read the response of the post that is sent
+                        pending['merged_into'] = post
+                        metrics.count('SlackPostsMerged')
+                        break
+            queue.insert(0, post)
+
+    def flush(self, send, max_wait=None):
+        """
+        Send the pending posts, waiting for the channels that are saturated
+        for at most max_wait seconds. The posts that could not be sent by
+        then, or when a connection error is raised, are dropped.
+
+        Args:
+            send (function): send(channel_id, text, username) posts a message and returns
+                             the Slack API response, raising SlackApiError on failure
+            max_wait (float): seconds to wait, the max_wait of the outbox by default
+        """
+        deadline = self.clock() + (self.max_wait if max_wait is None else max_wait)
+        while True:
+            channel_id, post = self._next()
+            if channel_id is None:
+                wait = post
+                if wait is None:
+                    return
+                if self.clock() + wait > deadline:
+                    self._drop_pending()
+                    return
+                self.sleep(wait)
+                continue
+
+            text = score_text(post['scores']) if post['scores'] is not None else post['text']
+            try:
+                post['response'] = send(channel_id, text, post['username'])
+            except Exception as e:
+                seconds = retry_after(e)
+                if seconds is not None:
+                    metrics.count('SlackPostsThrottled')
+                    with self._lock:
+                        self._bucket(channel_id).block(seconds)
+                    self._requeue(channel_id, post)
+                elif getattr(e, 'response', None) is not None:
+                    logger.error(f"Error posting message: {e}")
+                    post['response'] = e.response
+                else:
+                    # connection errors are raised as before; the posts left
+                    # would otherwise be sent by an unrelated invocation
+                    self._drop_pending()
+                    raise
+
+
+def response_of(post):
+    """
+    Args:
+        post (dict): value returned by Outbox.enqueue, after flush
+    Returns:
+        object: Slack API response of the message that carried the post
+    """
+    while 'merged_into' in post:
+        post = post['merged_into']
+    return post['response']
+
+
+def get_outbox():
+    """
+    Returns:
+        Outbox: posts of all invocations of this container
+    """
+    global _outbox
+    if _outbox is None:
+        with _lock:
+            if _outbox is None:
+                _outbox = Outbox()
+    return _outbox
+
+
+def reset_outbox():
+    """
+    Forget the pending posts and the channel rates, e.g. between tests.
+    """
+    global _outbox
+    _outbox = None
@@ -0,0 +1,67 @@
+import os
+import time
+
+# Requests whose X-Slack-Request-Timestamp is older than this many seconds are
+# rejected before their signature is computed, to refuse replayed requests.
+MAX_REQUEST_AGE = int(os.environ.get('MAX_REQUEST_AGE', '300'))
+# Comma separated Slack user ids whose messages are never counted, e.g. the bot user of this app.
+IGNORED_USER_IDS = frozenset(filter(None, os.environ.get('IGNORED_USER_IDS', '').split(',')))
+
+# Every increment and every command contains it.
+MARKER = '++'
+# Event types that can carry an increment or a command.
+ACTIONABLE_TYPES = frozenset({'message', 'app_mention'})
+# Message subtypes posted by people. Edits, deletions, joins and bot messages are not.
+ACTIONABLE_SUBTYPES = frozenset({None, 'thread_broadcast', 'file_share', 'me_message'})
+
+
+def is_stale(headers, now=None):
+    """
+    Args:
+        headers (dict): http request header from Slack
+        now (float): current time in seconds, time.time() by default
+    Returns:
+        bool: True if the request was signed more than MAX_REQUEST_AGE seconds ago.
+              A missing or malformed timestamp is left to verify_request.
+
+    https://api.slack.com/authentication/verifying-requests-from-slack
+    """
+    timestamp = (headers or {}).get('x-slack-request-timestamp')
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        return False
+    now = time.time() if now is None else now
+    return abs(now - timestamp) > MAX_REQUEST_AGE
+
+
+def has_marker(raw_body):
+    """
+    Args:
+        raw_body (str): request body before it is decoded
+    Returns:
+        bool: False if the body cannot contain an increment or a command
+    """
+    return MARKER in raw_body
+
+
+def skip_reason(body):
+    """
+    Args:
+        body (dict): request body sent by Slack
+    Returns:
+        str: why the event is not processed, used in the Skipped<reason> counter,
+             or None if it is an increment or a command to process
+    """
+    event = body.get('event')
+    if not isinstance(event, dict):
+        return 'NoEvent'
+    if event.get('type') not in ACTIONABLE_TYPES:
+        return 'EventType'
+    if event.get('subtype') not in ACTIONABLE_SUBTYPES:
+        return 'Subtype'
+    if event.get('bot_id') or event.get('user') in IGNORED_USER_IDS:
+        return 'Bot'
+    if not isinstance(event.get('text'), str) or MARKER not in event['text'] or not event.get('user'):
+        return 'NoIncrement'
+    return None
@@ -0,0 +1,252 @@
+import os
+import random
+import threading
+import time
+
+try:
+    from . import dynamodb_batch
+except ImportError:
+    import dynamodb_batch
+
+# Spread the increments of hot users over several UserCounts items.
+SHARDED_COUNTERS = os.environ.get('SHARDED_COUNTERS', '0') == '1'
+# Number of `username#shard-N` items of a sharded user.
+COUNTER_SHARDS = int(os.environ.get('COUNTER_SHARDS', '8'))
+# Increments per second of one user, seen by one container, above which the user is sharded.
+SHARD_PROMOTE_RATE = float(os.environ.get('SHARD_PROMOTE_RATE', '2'))
+# Seconds over which the rate is measured.
+SHARD_RATE_WINDOW = float(os.environ.get('SHARD_RATE_WINDOW', '10'))
+
+SHARD_SEPARATOR = '#shard-'
+# UserCounts item listing the sharded users, read by the leaderboard.
+REGISTRY_KEY = '#sharded'
+
+# Created on first use and kept for the lifetime of the container.
+_counters = None
+
+
+def shard_key(username, shard):
+    """
+    Args:
+        username (str): name of the counter
+        shard (int): shard number, from 0 to shard_count - 1
+    Returns:
+        str: key of the UserCounts item of the shard
+    """
+    return f"{username}{SHARD_SEPARATOR}{shard}"
+
+
+def base_username(key):
+    """
+    Args:
+        key (str): key of a UserCounts item, a user or one of its shards
+    Returns:
+        str: name of the counter the item belongs to
+    """
+    return key.rsplit(SHARD_SEPARATOR, 1)[0]
+
+
+class RateTracker:
+    """
+    Number of increments per user in the current window.
+    """
+
+    def __init__(self, window=SHARD_RATE_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._window_start = clock()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def observe(self, username):
+        """
+        Args:
+            username (str): name of the counter being incremented
+        Returns:
+            float: increments per second of the user in the current window
+        """
+        now = self.clock()
+        with self._lock:
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._counts = {}
+            count = self._counts.get(username, 0) + 1
+            self._counts[username] = count
+        return count / self.window
+
+
+class ShardedCounters:
+    """
+    UserCounts counters that are split into shards once they get hot.
+
+    A user starts with a single item. When one container sees more than
+    `promote_rate` increments per second for a user, `shard_count` is set on
+    the user's item and the user is added to the registry item; from then on
+    increments go to a random `username#shard-N` item. The total of a user is
+    the total_num of its item plus the total_num of its shards, so only the
+    sharded users pay for the extra reads.
+    """
+
+    def __init__(self, shard_count=COUNTER_SHARDS, promote_rate=SHARD_PROMOTE_RATE, rate_tracker=None):
+        self.shard_count = shard_count
+        self.promote_rate = promote_rate
+        self.rate_tracker = rate_tracker or RateTracker()
+        # shard_count of the users known to be sharded
+        self.sharded = {}
+        self.promotions = 0
+
+    def promote(self, client, username):
+        """
+        Mark a user as sharded. Idempotent, another container may have done it first.
+
+        Args:
+            client (object): boto3 DynamoDB client
+            username (str): name of the counter
+        Returns:
+            int: shard count of the user
+        """
+        response = client.update_item(
+            TableName='UserCounts',
+            Key={'username': {'S': username}},
+            UpdateExpression="SET shard_count = if_not_exists(shard_count, :shards)",
+            ExpressionAttributeValues={':shards': {'N': str(self.shard_count)}},
+            ReturnValues="ALL_NEW"
+        )
+        client.update_item(
+            TableName='UserCounts',
+            Key={'username': {'S': REGISTRY_KEY}},
+            UpdateExpression="ADD usernames :username",
+            ExpressionAttributeValues={':username': {'SS': [username]}}
+        )
+        shards = int(response['Attributes']['shard_count']['N'])
+        self.sharded[username] = shards
+        self.promotions += 1
+        return shards
+
+    def target(self, client, username):
+        """
+        Pick the item an increment of the user is written to, promoting the user if it is hot.
+
+        Args:
+            client (object): boto3 DynamoDB client
+            username (str): name of the counter
+        Returns:
+            str: key of the UserCounts item, the user itself or one of its shards
+        """
+        rate = self.rate_tracker.observe(username)
+        shards = self.sharded.get(username)
+        if shards is None and self.shard_count > 1 and rate > self.promote_rate:
+            shards = self.promote(client, username)
+        if shards is None:
+            return username
+        return shard_key(username, random.randrange(shards))
+
+    def update_action(self, client, username, count, board):
+        """
+        Args:
+            client (object): boto3 DynamoDB client
+            username (str): name of the counter
+            count (int): increment
+            board (str): leaderboard partition, only set on the user's own item
+        Returns:
+            dict: Key, UpdateExpression and ExpressionAttributeValues of the increment
+        """
+        key = self.target(client, username)
+        if key == username:
+            return {
+                'Key': {'username': {'S': key}},
+                'UpdateExpression': "ADD total_num :incr SET board = :board",
+                'ExpressionAttributeValues': {':incr': {'N': str(count)}, ':board': {'S': board}}
+            }
+        # shards stay out of the leaderboard index
+        return {
+            'Key': {'username': {'S': key}},
+            'UpdateExpression': "ADD total_num :incr",
+            'ExpressionAttributeValues': {':incr': {'N': str(count)}}
+        }
+
+    def increment(self, client, username, count, board):
+        """
+        Args:
+            client (object): boto3 DynamoDB client
+            username (str): name of the counter
+            count (int): increment
+            board (str): leaderboard partition
+        Returns:
+            dict: UpdateItem response, with the total of the user in Attributes.total_num
+        """
+        action = self.update_action(client, username, count, board)
+        response = client.update_item(TableName='UserCounts', ReturnValues="ALL_NEW", **action)
+
+        attributes = response['Attributes']
+        if 'shard_count' in attributes:
+            # sharded by another container
+            self.sharded[username] = int(attributes['shard_count']['N'])
+        if username in self.sharded:
+            total = self.read_totals(client, [username])[username]
+            response['Attributes'] = {'total_num': {'N': str(total)}}
+        return response
+
+    def read_totals(self, client, usernames, consistent_read=True):
+        """
+        Read the totals of several users: one BatchGetItem for their items,
+        and one more for the shards of the sharded ones.
+
+        Args:
+            client (object): boto3 DynamoDB client
+            usernames (list): names of the counters
+            consistent_read (bool): use strongly consistent reads
+        Returns:
+            dict: {username: total}, for the users that have a UserCounts item
+        """
+        keys = [{'username': {'S': username}} for username in usernames]
+        response = dynamodb_batch.batch_get_items(client, 'UserCounts', keys, consistent_read=consistent_read)
+
+        totals = {}
+        shard_keys = []
+        for item in response['items']:
+            username = item['username']['S']
+            totals[username] = int(item.get('total_num', {'N': '0'})['N'])
+            if 'shard_count' in item:
+                shards = int(item['shard_count']['N'])
+                self.sharded[username] = shards
+                shard_keys.extend({'username': {'S': shard_key(username, shard)}} for shard in range(shards))
+
+        if shard_keys:
+            response = dynamodb_batch.batch_get_items(client, 'UserCounts', shard_keys, consistent_read=consistent_read)
+            for item in response['items']:
+                username = base_username(item['username']['S'])
+                totals[username] = totals.get(username, 0) + int(item['total_num']['N'])
+        return totals
+
+    def registered(self, client):
+        """
+        Args:
+            client (object): boto3 DynamoDB client
+        Returns:
+            list: names of every sharded user, from the registry item
+        """
+        response = client.get_item(
+            TableName='UserCounts',
+            Key={'username': {'S': REGISTRY_KEY}}
+        )
+        return sorted(response.get('Item', {}).get('usernames', {}).get('SS', []))
+
+
+def get_counters():
+    """
+    Returns:
+        ShardedCounters: counters shared by all invocations of this container
+    """
+    global _counters
+    if _counters is None:
+        _counters = ShardedCounters()
+    return _counters
+
+
+def reset_counters():
+    """
+    Forget the sharded users and the rates, e.g. between tests.
+    """
+    global _counters
+    _counters = None
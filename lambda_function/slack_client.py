@@ -0,0 +1,204 @@
+import http.client
+import os
+import ssl
+import threading
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError  # noqa: F401 (used by the handler)
+from slack_sdk.http_retry.builtin_handlers import ConnectionErrorRetryHandler, RateLimitErrorRetryHandler
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Seconds to wait for Slack to accept the connection and to answer.
+SLACK_TIMEOUT = int(os.environ.get('SLACK_TIMEOUT', '3'))
+# Retries after a 429 response (waits for Retry-After) and after a connection error.
+SLACK_RATE_LIMIT_RETRIES = int(os.environ.get('SLACK_RATE_LIMIT_RETRIES', '1'))
+SLACK_CONNECTION_RETRIES = int(os.environ.get('SLACK_CONNECTION_RETRIES', '2'))
+
+# Methods whose 429 responses are left to the caller: the outbox waits for the
+# Retry-After of chat.postMessage itself, and would otherwise wait twice.
+CALLER_RATE_LIMITED_METHODS = ('chat.postMessage',)
+
+# Created on first use and kept for the lifetime of the container.
+_client = None
+_lock = threading.Lock()
+
+
+class KeepAliveWebClient(WebClient):
+    """
+    WebClient that keeps its HTTPS connection to Slack open between API calls.
+
+    The stock WebClient opens a new connection (and TLS session) with urlopen
+    for every call. This client keeps one connection per thread, so it can be
+    shared by the threads of the handler and reused by warm invocations.
+    Requests through a proxy fall back to the stock transport.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.ssl is None:
+            self.ssl = ssl.create_default_context()
+        self._local = threading.local()
+
+    def _connection(self, scheme, netloc):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.origin == (scheme, netloc):
+            return connection, True
+
+        self.close()
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(netloc, timeout=self.timeout, context=self.ssl)
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        self._local.connection = connection
+        self._local.origin = (scheme, netloc)
+        return connection, False
+
+    def close(self):
+        """
+        Close the connection of the calling thread.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+
+    def _send(self, url, req):
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        connection, reused = self._connection(parts.scheme, parts.netloc)
+        try:
+            connection.request(req.get_method(), path, body=req.data, headers=dict(req.header_items()))
+            return connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            self.close()
+            if not reused:
+                raise
+        except (http.client.HTTPException, OSError):
+            self.close()
+            raise
+        # Slack closed the idle connection: send again on a new one.
+        metrics.count('SlackReconnects')
+        connection, _ = self._connection(parts.scheme, parts.netloc)
+        connection.request(req.get_method(), path, body=req.data, headers=dict(req.header_items()))
+        return connection.getresponse()
+
+    def _perform_urllib_http_request(self, *, url, args):
+        # one API call, whatever the number of attempts made by the retry handlers
+        metrics.count('SlackCalls')
+        self._local.attempts = 0
+        return super()._perform_urllib_http_request(url=url, args=args)
+
+    def _perform_urllib_http_request_internal(self, url, req):
+        self._local.attempts = getattr(self._local, 'attempts', 0) + 1
+        if self._local.attempts > 1:
+            metrics.count('SlackRetries')
+
+        if self.proxy is not None or not url.lower().startswith('http'):
+            return super()._perform_urllib_http_request_internal(url, req)
+
+        resp = self._send(url, req)
+        body = resp.read()
+        if resp.will_close:
+            self.close()
+
+        # Same contract as urlopen: errors are raised as HTTPError so that
+        # the retry handlers see 429 and 5xx responses.
+        if resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, _BodyReader(body))
+        if resp.headers.get_content_type() == 'application/gzip':
+            return {'status': resp.status, 'headers': resp.headers, 'body': body}
+        charset = resp.headers.get_content_charset() or 'utf-8'
+        return {'status': resp.status, 'headers': resp.headers, 'body': body.decode(charset)}
+
+
+class RateLimitRetryHandler(RateLimitErrorRetryHandler):
+    """
+    RateLimitErrorRetryHandler that does not retry the methods whose callers
+    handle rate limiting, which get the 429 as a SlackApiError.
+    """
+
+    def __init__(self, skipped_methods=CALLER_RATE_LIMITED_METHODS, **kwargs):
+        super().__init__(**kwargs)
+        self.skipped_methods = skipped_methods
+
+    def _can_retry(self, *, state, request, response=None, error=None):
+        if urlsplit(request.url).path.rsplit('/', 1)[-1] in self.skipped_methods:
+            return False
+        return super()._can_retry(state=state, request=request, response=response, error=error)
+
+
+class _BodyReader:
+    """File-like wrapper of a response body that has already been read."""
+
+    def __init__(self, body):
+        self._body = body
+
+    def read(self, *args):
+        body, self._body = self._body, b''
+        return body
+
+    def close(self):
+        pass
+
+
+def create_client(token, timeout=None, base_url=WebClient.BASE_URL):
+    """
+    Args:
+        token (str): Slack bot token
+        timeout (int): seconds to wait for Slack, SLACK_TIMEOUT by default
+        base_url (str): Slack API base URL
+    Returns:
+        KeepAliveWebClient: client that retries connection errors, and rate limited calls
+                            except CALLER_RATE_LIMITED_METHODS
+    """
+    return KeepAliveWebClient(
+        token=token,
+        base_url=base_url,
+        timeout=SLACK_TIMEOUT if timeout is None else timeout,
+        retry_handlers=[
+            RateLimitRetryHandler(max_retry_count=SLACK_RATE_LIMIT_RETRIES),
+            ConnectionErrorRetryHandler(max_retry_count=SLACK_CONNECTION_RETRIES),
+        ]
+    )
+
+
+def get_client(token):
+    """
+    Args:
+        token (str): Slack bot token, used when the client is created
+    Returns:
+        WebClient: client shared by all invocations of this container
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = create_client(token)
+    return _client
+
+
+def set_client(client):
+    """
+    Replace the shared client, e.g. with a fake in tests.
+
+    Args:
+        client (object): object with the WebClient methods used by the bot
+    """
+    global _client
+    _client = client
+
+
+def reset_client():
+    """
+    Drop the shared client. The next get_client call creates a new one.
+    """
+    global _client
+    if isinstance(_client, KeepAliveWebClient):
+        _client.close()
+    _client = None
@@ -0,0 +1,69 @@
+import importlib
+import os
+import time
+
+# Import the modules and create the clients while the function is initialised
+# instead of on first use. Useful with provisioned concurrency, where the
+# initialisation happens before any request arrives.
+LAZY_INIT = os.environ.get('LAZY_INIT', '1') == '1'
+
+# Start of the initialisation of this container.
+_init_start = time.perf_counter()
+_init_ms = None
+# Duration of each import done through timed_import, in milliseconds.
+_import_ms = {}
+_cold_start = True
+
+
+def timed_import(name, package=None):
+    """
+    Import a module on first use and record how long the import took.
+
+    Args:
+        name (str): module name, relative to `package` if given
+        package (str): package of the calling module (its __package__); empty or None for top-level modules
+    Returns:
+        module: the imported module
+    """
+    module_name = '.' + name if package else name
+    if name in _import_ms:
+        return importlib.import_module(module_name, package or None)
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name, package or None)
+    _import_ms[name] = round((time.perf_counter() - start) * 1000, 3)
+    return module
+
+
+def init_done():
+    """
+    Record the end of the initialisation. Called once the handler module has been imported.
+    """
+    global _init_ms
+    if _init_ms is None:
+        _init_ms = round((time.perf_counter() - _init_start) * 1000, 3)
+
+
+def consume_cold_start():
+    """
+    Returns:
+        bool: True for the first invocation of this container, False afterwards
+    """
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    return cold_start
+
+
+def report():
+    """
+    Returns:
+        dict:
+            init_ms (float): duration of the initialisation of the handler module
+            imports_ms (dict): duration of each import done through timed_import
+            lazy_init (bool): whether imports are deferred to first use
+    """
+    return {
+        'init_ms': _init_ms,
+        'imports_ms': dict(_import_ms),
+        'lazy_init': LAZY_INIT
+    }
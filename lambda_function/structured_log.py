@@ -0,0 +1,127 @@
+"""
+JSON log lines with a configurable level, sampled detail and redacted message bodies.
+
+Detail lines (`debug`) are written for every event when LOG_LEVEL is DEBUG,
+and otherwise only for the events picked by `is_sampled`, so that all the
+detail lines of a sampled event are kept together. The fields of a line are
+only formatted when the line is written: a field given as a callable is
+called at that time.
+
+Also used by the Firehose transform, which gets a copy of this file.
+"""
+import json
+import logging
+import os
+import zlib
+
+# Level of the lines written by the functions (DEBUG, INFO, WARNING, ERROR).
+LOG_LEVEL = logging.getLevelName(os.environ.get('LOG_LEVEL', 'INFO').upper())
+# Fraction of the events (0 to 1) whose detail lines are written at INFO.
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0'))
+# Characters of a message body kept in the logs. 0 replaces the body with its length.
+LOG_BODY_MAX = int(os.environ.get('LOG_BODY_MAX', '0'))
+
+# Fields holding what people wrote in Slack.
+BODY_FIELDS = frozenset({'text', 'message', 'body'})
+
+logger = logging.getLogger()
+
+# Whether the detail lines of the event in progress are written.
+_sampled = False
+
+
+def is_sampled(key, rate=None):
+    """
+    Args:
+        key (str): id of the event or record, e.g. the dedupe key of a Slack event
+        rate (float): fraction of the ids that are sampled, LOG_SAMPLE_RATE by default
+    Returns:
+        bool: the same answer for the same id in every container, so that every
+              delivery of a sampled event is logged
+    """
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    if rate <= 0 or key is None:
+        return False
+    if rate >= 1:
+        return True
+    return zlib.crc32(key.encode('utf-8')) < rate * 2**32
+
+
+def start_event(key):
+    """
+    Decide whether the detail lines of the event in progress are written.
+
+    Args:
+        key (str): id of the event, or None to not sample it
+    Returns:
+        bool: True if the event is sampled
+    """
+    global _sampled
+    _sampled = is_sampled(key)
+    return _sampled
+
+
+def redact(value, body_max=None):
+    """
+    Args:
+        value (object): field of a log line
+        body_max (int): characters kept of a message body, LOG_BODY_MAX by default
+    Returns:
+        object: the value, with the strings of BODY_FIELDS truncated or replaced by their length
+    """
+    body_max = LOG_BODY_MAX if body_max is None else body_max
+    if isinstance(value, dict):
+        return {
+            key: _redact_body(item, body_max) if key in BODY_FIELDS else redact(item, body_max)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, body_max) for item in value]
+    return value
+
+
+def _redact_body(value, body_max):
+    if isinstance(value, dict) and 'S' in value:
+        # attribute value in DynamoDB JSON
+        return {'S': _redact_body(value['S'], body_max)}
+    if not isinstance(value, str):
+        return redact(value, body_max)
+    if body_max <= 0:
+        return f"<{len(value)} chars>"
+    if len(value) > body_max:
+        return value[:body_max] + '...'
+    return value
+
+
+def log(level, message, **fields):
+    """
+    Write one JSON line, if the logger is enabled for the level.
+
+    Args:
+        level (int): logging level, e.g. logging.INFO
+        message (str): what happened
+        fields: values attached to the line; callables are called only if the line is written
+    """
+    if not logger.isEnabledFor(level):
+        return
+    values = {name: value() if callable(value) else value for name, value in fields.items()}
+    logger.log(level, json.dumps({'message': message, **redact(values)}, ensure_ascii=False, default=str))
+
+
+def debug(message, **fields):
+    """
+    Write a detail line: at DEBUG, or at INFO if the event in progress is sampled.
+    """
+    log(logging.INFO if _sampled else logging.DEBUG, message, **fields)
+
+
+def info(message, **fields):
+    log(logging.INFO, message, **fields)
+
+
+def warning(message, **fields):
+    log(logging.WARNING, message, **fields)
+
+
+def error(message, **fields):
+    log(logging.ERROR, message, **fields)
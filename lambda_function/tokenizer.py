@@ -0,0 +1,72 @@
+import re
+
+INCREMENT = '++'
+
+# Slack user mention, with the optional label Slack adds to some of them: <@U123> or <@U123|alice>
+MENTION_PATTERN = re.compile(r'<@([A-Za-z0-9]+)(?:\|[^<>]*)?>')
+
+
+def is_word_char(c):
+    """
+    Args:
+        c (str): single character
+    Returns:
+        bool: True for the characters matched by \\w in Python's re module
+    """
+    return c.isalnum() or c == '_'
+
+
+def tokenize(text):
+    """
+    Find every `name++` and `<@U123>++` token of a message in one linear pass.
+
+    Each `++` is located with str.find and the name is read backwards from it.
+    A name cannot contain '+', so no character is read back past the previous
+    `++`, and every character of the text is looked at a bounded number of times.
+
+    Args:
+        text (str): message posted on slack
+    Returns:
+        list: (start, name) of each token, in order. Mentions are named `<@U123>`.
+    """
+    tokens = []
+    lower = 0
+    pos = text.find(INCREMENT)
+    while pos != -1:
+        start = pos
+        while start > lower and is_word_char(text[start - 1]):
+            start -= 1
+
+        if start < pos:
+            tokens.append((start, text[start:pos]))
+        elif pos > lower and text[pos - 1] == '>':
+            mention_start = text.rfind('<@', lower, pos)
+            if mention_start != -1:
+                match = MENTION_PATTERN.fullmatch(text, mention_start, pos)
+                if match:
+                    tokens.append((mention_start, f"<@{match.group(1)}>"))
+
+        lower = pos + 1
+        pos = text.find(INCREMENT, lower)
+    return tokens
+
+
+def parse(text):
+    """
+    Args:
+        text (str): message posted on slack
+    Returns:
+        tuple:
+            bool: True if the message starts with a token ({username}++ format)
+            dict: mapping of usernames to their respective frequencies of occurrence
+    """
+    # most messages are not increments at all
+    if INCREMENT not in text:
+        return False, {}
+
+    user_map = {}
+    tokens = tokenize(text)
+    for _, name in tokens:
+        user_map[name] = 1 + user_map.get(name, 0)
+
+    return bool(tokens) and tokens[0][0] == 0, user_map
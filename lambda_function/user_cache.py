@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# Number of users kept in memory. 0 disables the cache.
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1000'))
+# Seconds a display name is used before users.info is called again.
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '3600'))
+# File the cache is saved to and loaded from, e.g. /tmp/slack_users.json.
+# /tmp is private to an execution environment; point this at a shared mount
+# (e.g. EFS) to let new containers start with a warm cache.
+USER_CACHE_SNAPSHOT = os.environ.get('USER_CACHE_SNAPSHOT', '')
+# Load the whole workspace with users.list when the cache is created.
+USER_CACHE_PRELOAD = os.environ.get('USER_CACHE_PRELOAD', '0') == '1'
+
+# Created on first use and kept for the lifetime of the container.
+_cache = None
+_lock = threading.Lock()
+
+
+class UserDirectoryCache:
+    """
+    Display names of Slack users, keyed by user id, with TTL expiry and LRU eviction.
+    """
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        """
+        Args:
+            user_id (str): Slack user id
+        Returns:
+            str: display name, or None if the user is not cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            display_name, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return display_name
+
+    def put(self, user_id, display_name, expires_at=None):
+        """
+        Args:
+            user_id (str): Slack user id
+            display_name (str): display name of the user
+            expires_at (float): epoch seconds after which the entry expires, now + ttl by default
+        """
+        if self.max_size <= 0:
+            return
+        if expires_at is None:
+            expires_at = self.clock() + self.ttl
+        with self._lock:
+            self._entries[user_id] = (display_name, expires_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses, evictions, expirations and current size
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self._entries)
+        }
+
+    def preload(self, client, page_size=200, max_pages=50):
+        """
+        Fill the cache with every active member of the workspace.
+
+        Args:
+            client (object): Slack WebClient
+            page_size (int): members requested per users.list call
+            max_pages (int): maximum number of users.list calls
+        Returns:
+            int: number of users loaded
+
+        https://api.slack.com/methods/users.list
+        """
+        loaded = 0
+        cursor = None
+        for _ in range(max_pages):
+            response = client.users_list(limit=page_size, cursor=cursor)
+            for member in response['members']:
+                if member.get('deleted'):
+                    continue
+                self.put(member['id'], member['profile']['display_name'])
+                loaded += 1
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                break
+        return loaded
+
+    def save_snapshot(self, path):
+        """
+        Args:
+            path (str): file the entries are written to
+        """
+        with self._lock:
+            entries = dict(self._entries)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path):
+        """
+        Args:
+            path (str): file written by save_snapshot
+        Returns:
+            int: number of entries loaded. Expired entries are skipped.
+        """
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        now = self.clock()
+        loaded = 0
+        for user_id, (display_name, expires_at) in entries.items():
+            if expires_at > now:
+                self.put(user_id, display_name, expires_at)
+                loaded += 1
+        return loaded
+
+
+def get_cache(client=None):
+    """
+    Args:
+        client (object): Slack WebClient used to preload the cache when it is created
+    Returns:
+        UserDirectoryCache: cache shared by all invocations of this container
+    """
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                cache = UserDirectoryCache()
+                if USER_CACHE_SNAPSHOT:
+                    logger.info(f"user cache snapshot: {cache.load_snapshot(USER_CACHE_SNAPSHOT)} users")
+                if USER_CACHE_PRELOAD and client is not None and len(cache) == 0:
+                    try:
+                        logger.info(f"user cache preload: {cache.preload(client)} users")
+                        save_snapshot(cache)
+                    except Exception as e:
+                        logger.error(f"Error preloading user cache: {e}")
+                _cache = cache
+    return _cache
+
+
+def save_snapshot(cache):
+    """
+    Save the cache to USER_CACHE_SNAPSHOT, if set.
+
+    Args:
+        cache (UserDirectoryCache): cache to save
+    """
+    if not USER_CACHE_SNAPSHOT:
+        return
+    try:
+        cache.save_snapshot(USER_CACHE_SNAPSHOT)
+    except OSError as e:
+        logger.error(f"Error saving user cache snapshot: {e}")
+
+
+def set_cache(cache):
+    """
+    Replace the shared cache, e.g. with a pre-filled one in tests.
+
+    Args:
+        cache (UserDirectoryCache): cache to use
+    """
+    global _cache
+    _cache = cache
+
+
+def reset_cache():
+    """
+    Drop the shared cache. The next get_cache call creates a new one.
+    """
+    global _cache
+    _cache = None
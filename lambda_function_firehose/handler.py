@@ -1,41 +1,423 @@
 import base64
+import binascii
+import functools
 import json
+import logging
+import os
+import random
+import time
+import zlib
+from collections import Counter
 
-print('Loading function')
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def lambda_handler(event, context):
-    output = []
-    
-    print(f"event: {event}")
-
-    for record in event['records']:
-        print(f"recordId: {record['recordId']}")
-        payload = base64.b64decode(record['data']).decode('utf-8')
-        json_value = json.loads(payload)
-
-        # Do custom processing on the payload here
-        print(f"json_value:{json_value}")
-        data = {}
-        data['eventID']                     = json_value['eventID']
-        data['eventName']                   = json_value['eventName']
-        data['ApproximateCreationDateTime'] = json_value['dynamodb']['ApproximateCreationDateTime']
-        data['to_username']                 = json_value["dynamodb"]["NewImage"]["to_username"]["S"]
-        data['from_username']               = json_value["dynamodb"]["NewImage"]["from_username"]["S"]
-        data['message']                     = json_value["dynamodb"]["NewImage"]["message"]["S"]
-        data['username']                    = json_value["dynamodb"]["NewImage"]["username"]["S"]
-        data['incr_num']                    = json_value["dynamodb"]["NewImage"]["incr_num"]["N"]
-        data['time_to_username']            = json_value["dynamodb"]["NewImage"]["time_to_username"]["S"]
-
-        # Add line break as suffix to each record
-        record_json_with_newline = json.dumps(data) + '\n'
-
-        output_record = {
+try:
+    from lambda_function import message_schema
+    from lambda_function import structured_log
+except ImportError:
+    # copied next to this file by build-lambda.sh
+    import message_schema
+    import structured_log
+
+logger = logging.getLogger()
+logger.setLevel(structured_log.LOG_LEVEL)
+
+# Fraction of the records whose transformed content is logged (0 to 1),
+# picked by record id. The message bodies are redacted (LOG_BODY_MAX).
+LOG_SAMPLE_RATE = structured_log.LOG_SAMPLE_RATE
+# Format of the records written to S3:
+#   json    : the values as found in the change record
+#   parquet : typed values, converted to Parquet by Firehose with the PARQUET_COLUMNS schema
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'json')
+# Largest response of the transform. Lambda returns at most 6 MB to Firehose;
+# the records that do not fit are put back to the source stream.
+MAX_RESPONSE_BYTES = int(os.environ.get('MAX_RESPONSE_BYTES', str(6 * 1024 * 1024 - 64 * 1024)))
+# Bytes of an output record in the response besides its recordId and data,
+# and of the partition keys of an Ok record.
+RECORD_OVERHEAD_BYTES = 64
+PARTITION_KEYS_BYTES = 96
+# Records and bytes of one Kinesis PutRecords call.
+PUT_RECORDS_LIMIT = 500
+PUT_RECORDS_MAX_BYTES = 4 * 1024 * 1024
+
+# Number of to_username hash buckets of the S3 prefix, 0 for none. Keep in sync
+# with analytics_partition_buckets in tf-assets/main.tf.
+PARTITION_BUCKETS = int(os.environ.get('PARTITION_BUCKETS', '0'))
+# Bucket of the records whose rows have recipients in several buckets
+# (version 2 messages), as a record goes to one S3 prefix.
+MIXED_BUCKET = 'mixed'
+
+# Created on first use and kept for the lifetime of the container.
+kinesis = None
+
+# Columns of the Glue table that Firehose uses to convert the records to Parquet.
+# Keep in sync with aws_glue_catalog_table.messages_parquet in tf-assets/main.tf.
+PARQUET_COLUMNS = {
+    'eventID':                     'string',
+    'eventName':                   'string',
+    'ApproximateCreationDateTime': 'timestamp',
+    'to_username':                 'string',
+    'from_username':               'string',
+    'message':                     'string',
+    'username':                    'string',
+    'incr_num':                    'int',
+    'time_to_username':            'string',
+}
+
+
+def loads(payload):
+    """
+    Args:
+        payload (bytes): JSON document
+    Returns:
+        object: decoded document, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def dumps_line(data):
+    """
+    Args:
+        data (dict): record to write to S3
+    Returns:
+        bytes: compact JSON document followed by a line break
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def transform(json_value):
+    """
+    Args:
+        json_value (dict): DynamoDB change record of the Messages table
+    Returns:
+        dict: record written to S3
+    """
+    new_image = json_value["dynamodb"]["NewImage"]
+    return {
+        'eventID':                     json_value['eventID'],
+        'eventName':                   json_value['eventName'],
+        'ApproximateCreationDateTime': json_value['dynamodb']['ApproximateCreationDateTime'],
+        'to_username':                 new_image["to_username"]["S"],
+        'from_username':               new_image["from_username"]["S"],
+        'message':                     new_image["message"]["S"],
+        'username':                    new_image["username"]["S"],
+        'incr_num':                    new_image["incr_num"]["N"],
+        'time_to_username':            new_image["time_to_username"]["S"],
+    }
+
+
+def transform_rows(json_value):
+    """
+    Args:
+        json_value (dict): DynamoDB change record of the Messages table, in either layout
+    Returns:
+        list: records written to S3: one per recipient of a version 2 message item,
+              none for a version 2 recipient item (its message item has its row)
+    """
+    new_image = json_value['dynamodb']['NewImage']
+    if not message_schema.is_message_item(new_image) and not message_schema.is_recipient_item(new_image):
+        return [transform(json_value)]
+    return [
+        transform({**json_value, 'dynamodb': {**json_value['dynamodb'], 'NewImage': image}})
+        for image in message_schema.expand(new_image)
+    ]
+
+
+def to_typed(data):
+    """
+    Give the values of a transformed record the types of PARQUET_COLUMNS.
+
+    ApproximateCreationDateTime stays in epoch milliseconds, which Firehose
+    reads as a timestamp with the "millis" timestamp format.
+
+    Args:
+        data (dict): record returned by transform
+    Returns:
+        dict: the same record, with integer incr_num and ApproximateCreationDateTime
+    """
+    data['incr_num'] = int(data['incr_num'])
+    data['ApproximateCreationDateTime'] = int(data['ApproximateCreationDateTime'])
+    return data
+
+
+def partition_bucket(to_username, buckets=None):
+    """
+    Args:
+        to_username (str): recipient of the row
+        buckets (int): number of buckets, PARTITION_BUCKETS by default
+    Returns:
+        str: zero-padded bucket number, the same in every invocation
+    """
+    return _partition_bucket(to_username, PARTITION_BUCKETS if buckets is None else buckets)
+
+
+@functools.lru_cache(maxsize=4096)
+def _partition_bucket(to_username, buckets):
+    width = len(str(buckets - 1))
+    return f"{zlib.crc32(to_username.encode('utf-8')) % buckets:0{width}d}"
+
+
+def partition_keys(change, rows, record):
+    """
+    Keys of the S3 prefix of a record with dynamic partitioning: the time the
+    item was written (ApproximateCreationDateTime, UTC), not the time the
+    record reached Firehose, and the bucket of its recipients.
+
+    Args:
+        change (dict): DynamoDB change record
+        rows (list): rows of the output record, see transform_rows
+        record (dict): record of the Firehose event
+    Returns:
+        dict: year, month, day and hour, and bucket if PARTITION_BUCKETS is set
+
+    https://docs.aws.amazon.com/firehose/latest/dev/dynamic-partitioning.html
+    """
+    timestamp_ms = change['dynamodb'].get('ApproximateCreationDateTime')
+    if not isinstance(timestamp_ms, (int, float)):
+        timestamp_ms = record.get('approximateArrivalTimestamp') or time.time() * 1000
+    keys = hour_keys(int(timestamp_ms // 3600000))
+    if PARTITION_BUCKETS:
+        bucket = partition_bucket(rows[0]['to_username'])
+        if any(partition_bucket(row['to_username']) != bucket for row in rows[1:]):
+            bucket = MIXED_BUCKET
+        keys = {**keys, 'bucket': bucket}
+    return keys
+
+
+@functools.lru_cache(maxsize=64)
+def hour_keys(hour):
+    """
+    Args:
+        hour (int): hours since the epoch
+    Returns:
+        dict: year, month, day and hour (UTC), shared by the records of the hour: do not modify
+    """
+    created = time.gmtime(hour * 3600)
+    return {
+        'year': f"{created.tm_year:04d}",
+        'month': f"{created.tm_mon:02d}",
+        'day': f"{created.tm_mday:02d}",
+        'hour': f"{created.tm_hour:02d}",
+    }
+
+
+def get_kinesis():
+    """
+    Returns:
+        object: boto3 Kinesis client shared by all invocations of this container
+    """
+    global kinesis
+    if kinesis is None:
+        import boto3
+        kinesis = boto3.client('kinesis')
+    return kinesis
+
+
+def transform_record(record, errors):
+    """
+    Transform one record, without letting a bad record fail the batch.
+
+    Args:
+        record (dict): record of the Firehose event
+        errors (Counter): number of ProcessingFailed records by error type, updated
+    Returns:
+        dict: output record for Firehose:
+              Ok with one line per row and the partitionKeys of its S3 prefix,
+              Dropped for a deleted item or a version 2 recipient item,
+              ProcessingFailed with the input data for a record that cannot be transformed,
+              which Firehose writes under the error prefix of the bucket
+    """
+    try:
+        # binascii directly: base64.b64decode and b64encode only add checks of
+        # the argument types, which cost as much as the conversion of a record
+        change = loads(binascii.a2b_base64(record['data']))
+        if change.get('eventName') == 'REMOVE':
+            rows = []
+        else:
+            rows = transform_rows(change)
+            if rows:
+                keys = partition_keys(change, rows, record)
+            if OUTPUT_FORMAT == 'parquet':
+                rows = [to_typed(data) for data in rows]
+    except Exception as e:
+        errors[type(e).__name__] += 1
+        structured_log.warning('record failed', recordId=record['recordId'], error=type(e).__name__,
+                               detail=lambda: str(e)[:200])
+        return {
             'recordId': record['recordId'],
-            'result': 'Ok',
-            'data': base64.b64encode(record_json_with_newline.encode('utf-8')).decode('utf-8')
+            'result': 'ProcessingFailed',
+            'data': record['data']
         }
-        output.append(output_record)
 
-    print('Successfully processed {} records.'.format(len(event['records'])))
+    if not rows:
+        return {
+            'recordId': record['recordId'],
+            'result': 'Dropped',
+            'data': ''
+        }
+
+    if structured_log.is_sampled(record['recordId'], LOG_SAMPLE_RATE):
+        for data in rows:
+            structured_log.info('record sample', recordId=record['recordId'], data=data)
+
+    return {
+        'recordId': record['recordId'],
+        'result': 'Ok',
+        'data': binascii.b2a_base64(b''.join(map(dumps_line, rows)), newline=False).decode('ascii'),
+        'metadata': {'partitionKeys': keys}
+    }
+
+
+def process_records(records, outcomes=None, overflow=None):
+    """
+    Transform the records one by one.
+
+    Only one decoded record is alive at a time, and each input record is
+    released from `records` as soon as its output has been built, so memory
+    does not hold the input and the output of the whole batch at once.
+
+    The output of a version 2 message item holds one line per recipient;
+    version 2 recipient items are dropped.
+
+    Once the outputs reach MAX_RESPONSE_BYTES, the following records are
+    returned as Dropped and added to `overflow`, to be put back to the stream.
+    A record whose output does not fit even in an empty response would
+    overflow again in every invocation: it is returned as ProcessingFailed.
+
+    Args:
+        records (list): records of the Firehose event
+        outcomes (Counter): number of records by result (Ok, Dropped, ProcessingFailed,
+                            Reingested) and by error type (error:<type>), updated
+        overflow (list): input records that did not fit in the response, appended to
+    Returns:
+        generator: output records for Firehose, in the same order
+    """
+    outcomes = Counter() if outcomes is None else outcomes
+    overflow = [] if overflow is None else overflow
+    errors = Counter()
+    # counted in a plain dict and added to `outcomes` at the end, which costs
+    # less per record than updating the Counter
+    results = dict.fromkeys(('Ok', 'Dropped', 'ProcessingFailed', 'Reingested'), 0)
+    # room for every record returned as Dropped, without data
+    size = empty_size = sum(len(record['recordId']) + RECORD_OVERHEAD_BYTES for record in records)
+    for i, record in enumerate(records):
+        output = transform_record(record, errors)
+        data_size = len(output['data']) + (PARTITION_KEYS_BYTES if 'metadata' in output else 0)
+        if size + data_size > MAX_RESPONSE_BYTES and size == empty_size:
+            errors['RecordTooLarge'] += 1
+            structured_log.warning('record failed', recordId=record['recordId'], error='RecordTooLarge',
+                                   detail=lambda: f"{data_size} bytes")
+            output = {
+                'recordId': record['recordId'],
+                'result': 'ProcessingFailed',
+                'data': record['data']
+            }
+            results['ProcessingFailed'] += 1
+            size += len(record['data'])
+        elif size + data_size > MAX_RESPONSE_BYTES:
+            overflow.append(record)
+            results['Reingested'] += 1
+            output = {
+                'recordId': record['recordId'],
+                'result': 'Dropped',
+                'data': ''
+            }
+        else:
+            results[output['result']] += 1
+            size += data_size
+
+        yield output
+        records[i] = None
+
+    outcomes.update({result: count for result, count in results.items() if count})
+    for error, count in errors.items():
+        outcomes['error:' + error] += count
+
+
+def reingest(event, records, max_attempts=3):
+    """
+    Put records back to the Kinesis stream the delivery stream reads, so that
+    Firehose transforms them in a later invocation.
+
+    The change records are marked with `reingested`, the number of times they
+    have been put back, for the other consumers of the stream to skip them.
+    A record that is not a valid change record is put back unchanged.
+
+    Args:
+        event (dict): Firehose event, whose source stream is sourceKinesisStreamArn
+        records (list): input records that did not fit in the response
+        max_attempts (int): number of calls made for a record before giving up
+    Raises:
+        RuntimeError: if a record could not be put back; Firehose then retries the whole batch
+
+    https://docs.aws.amazon.com/firehose/latest/dev/data-transformation.html
+    https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/kinesis/client/put_records.html
+    """
+    stream_arn = event.get('sourceKinesisStreamArn')
+    if not stream_arn:
+        raise RuntimeError(f"{len(records)} records do not fit in the response and the source is not a Kinesis stream")
+
+    entries = []
+    for record in records:
+        data = base64.b64decode(record['data'])
+        try:
+            change = loads(data)
+            change['reingested'] = change.get('reingested', 0) + 1
+            data = dumps_line(change)
+        except Exception:
+            # returned as ProcessingFailed by the invocation it fits in
+            pass
+        entries.append({
+            'Data': data,
+            'PartitionKey': record.get('kinesisRecordMetadata', {}).get('partitionKey') or record['recordId']
+        })
+
+    chunks = [[]]
+    chunk_bytes = 0
+    for entry in entries:
+        entry_bytes = len(entry['Data']) + len(entry['PartitionKey'])
+        if chunks[-1] and (len(chunks[-1]) == PUT_RECORDS_LIMIT or chunk_bytes + entry_bytes > PUT_RECORDS_MAX_BYTES):
+            chunks.append([])
+            chunk_bytes = 0
+        chunks[-1].append(entry)
+        chunk_bytes += entry_bytes
+
+    for pending in chunks:
+        for attempt in range(max_attempts):
+            if attempt:
+                time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+            response = get_kinesis().put_records(StreamARN=stream_arn, Records=pending)
+            pending = [entry for entry, result in zip(pending, response['Records']) if 'ErrorCode' in result]
+            if not pending:
+                break
+        if pending:
+            raise RuntimeError(f"{len(pending)} records could not be put back to {stream_arn}")
+
+
+def lambda_handler(event, context):
+    """
+    Args:
+        event (dict): records delivered by Kinesis Data Firehose
+        context (object): https://docs.aws.amazon.com/lambda/latest/dg/python-context.html
+    Returns:
+        dict: transformed records
+
+    https://docs.aws.amazon.com/firehose/latest/dev/data-transformation.html
+    """
+    outcomes = Counter()
+    overflow = []
+    output = list(process_records(event['records'], outcomes, overflow))
+    if overflow:
+        reingest(event, overflow)
+
+    structured_log.info('Successfully processed records.', records=len(output), codec='orjson' if orjson else 'json',
+                        output_format=OUTPUT_FORMAT, outcomes=dict(outcomes))
 
-    return {'records': output}
\ No newline at end of file
+    return {'records': output}
@@ -0,0 +1,115 @@
+import base64
+import json
+import logging
+import os
+import time
+
+try:
+    from . import rollup
+except ImportError:
+    import rollup
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Table of the rollup counters and top-N items.
+ROLLUP_TABLE = os.environ.get('ROLLUP_TABLE', 'Rollups')
+# Number of entries kept in the top-N of each period.
+ROLLUP_TOP_SIZE = int(os.environ.get('ROLLUP_TOP_SIZE', '10'))
+# Days the hourly rollups are kept, 0 to keep them forever.
+ROLLUP_HOUR_RETENTION_DAYS = int(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', '30'))
+
+# Created on first use and kept for the lifetime of the container.
+_backend = None
+
+
+def get_backend():
+    """
+    Returns:
+        object: rollup backend shared by all invocations of this container
+    """
+    global _backend
+    if _backend is None:
+        import boto3
+        _backend = rollup.DynamoDBBackend(
+            boto3.client('dynamodb'),
+            ROLLUP_TABLE,
+            top_size=ROLLUP_TOP_SIZE,
+            hour_retention_days=ROLLUP_HOUR_RETENTION_DAYS
+        )
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Args:
+        backend (object): backend used instead of DynamoDB, e.g. rollup.InMemoryBackend
+    """
+    global _backend
+    _backend = backend
+
+
+def reset_backend():
+    """
+    Go back to the DynamoDB backend.
+    """
+    global _backend
+    _backend = None
+
+
+def parse_record(record):
+    """
+    Args:
+        record (dict): Kinesis record holding a DynamoDB change record of the Messages table
+    Returns:
+        tuple: (timestamp_ms, to_username, incr_num), or None if the record is not a new message
+    """
+    change = json.loads(base64.b64decode(record['kinesis']['data']))
+    if change.get('eventName') != 'INSERT':
+        return None
+    if change.get('reingested'):
+        # put back to the stream by the Firehose transform, already counted
+        return None
+
+    new_image = change['dynamodb'].get('NewImage', {})
+    if 'to_username' not in new_image or 'incr_num' not in new_image:
+        return None
+
+    timestamp_ms = change['dynamodb'].get('ApproximateCreationDateTime')
+    if not isinstance(timestamp_ms, (int, float)):
+        timestamp_ms = time.time() * 1000
+    return int(timestamp_ms), new_image['to_username']['S'], int(new_image['incr_num']['N'])
+
+
+def lambda_handler(event, context):
+    """
+    Add the messages of a Kinesis batch to the hourly, daily, weekly and monthly rollups.
+
+    A batch that fails is retried by the event source mapping as a whole, so
+    the rollups count at least once.
+
+    Args:
+        event (dict): records delivered by the Kinesis event source mapping
+        context (object): https://docs.aws.amazon.com/lambda/latest/dg/python-context.html
+    Returns:
+        dict: number of records, of messages and of counters updated
+
+    https://docs.aws.amazon.com/lambda/latest/dg/with-kinesis.html
+    """
+    rows = [row for row in map(parse_record, event['Records']) if row is not None]
+    increments = rollup.aggregate(rows)
+    get_backend().apply(increments)
+
+    counters = sum(len(counts) for counts in increments.values())
+    logger.info(json.dumps({
+        'message': 'Rollups updated.',
+        'records': len(event['Records']),
+        'messages': len(rows),
+        'counters': counters
+    }))
+
+    return {
+        'records': len(event['Records']),
+        'messages': len(rows),
+        'counters': counters
+    }
@@ -0,0 +1,271 @@
+import datetime
+import logging
+import random
+import time
+
+logger = logging.getLogger()
+
+# Rollup periods, from the shortest to the longest.
+PERIODS = ('hour', 'day', 'week', 'month')
+# Sort key of the item holding the top-N of a period.
+TOP_KEY = '#top'
+
+
+def period_keys(timestamp_ms):
+    """
+    Args:
+        timestamp_ms (int): epoch milliseconds of the message
+    Returns:
+        dict: key of each period containing the timestamp (UTC), e.g.
+            {'hour': 'hour#2023-09-03T14', 'day': 'day#2023-09-03',
+             'week': 'week#2023-W35', 'month': 'month#2023-09'}
+    """
+    t = datetime.datetime.fromtimestamp(timestamp_ms / 1000, tz=datetime.timezone.utc)
+    iso_year, iso_week, _ = t.isocalendar()
+    return {
+        'hour': t.strftime('hour#%Y-%m-%dT%H'),
+        'day': t.strftime('day#%Y-%m-%d'),
+        'week': f'week#{iso_year}-W{iso_week:02d}',
+        'month': t.strftime('month#%Y-%m'),
+    }
+
+
+def aggregate(rows):
+    """
+    Sum the increments of a batch per period and user, so that each counter is
+    written once per batch whatever the number of messages.
+
+    Args:
+        rows (iterable): (timestamp_ms, to_username, incr_num) tuples
+    Returns:
+        dict: {period_key: {to_username: increment}}
+    """
+    increments = {}
+    for timestamp_ms, to_username, incr_num in rows:
+        for period_key in period_keys(timestamp_ms).values():
+            counts = increments.setdefault(period_key, {})
+            counts[to_username] = counts.get(to_username, 0) + incr_num
+    return increments
+
+
+def merge_top(top, totals, size):
+    """
+    Merge new totals into a top-N.
+
+    Counters only grow, so a user outside of the top-N can only enter it
+    when its own counter is updated: the new totals of the updated users are
+    enough to keep the top-N exact.
+
+    Concurrent invocations can merge their totals out of order, so the
+    larger total of a user is kept rather than the last one merged.
+
+    Args:
+        top (list): [(username, total)] sorted by total
+        totals (dict): {username: new total}
+        size (int): number of entries kept
+    Returns:
+        list: [(username, total)] by decreasing total, then username
+    """
+    merged = dict(top)
+    for username, total in totals.items():
+        merged[username] = max(merged.get(username, 0), total)
+    return sorted(merged.items(), key=lambda entry: (-entry[1], entry[0]))[:size]
+
+
+class InMemoryBackend:
+    """
+    Rollups kept in memory, for tests and local runs.
+    """
+
+    def __init__(self, top_size=10):
+        self.top_size = top_size
+        self.counters = {}
+        self.tops = {}
+
+    def apply(self, increments):
+        """
+        Args:
+            increments (dict): {period_key: {to_username: increment}}, see aggregate
+        """
+        for period_key, counts in increments.items():
+            counters = self.counters.setdefault(period_key, {})
+            for username, count in counts.items():
+                counters[username] = counters.get(username, 0) + count
+            totals = {username: counters[username] for username in counts}
+            self.tops[period_key] = merge_top(self.tops.get(period_key, []), totals, self.top_size)
+
+    def get_top(self, period_key, limit=None):
+        """
+        Args:
+            period_key (str): key returned by period_keys
+            limit (int): number of entries returned, all of the top-N if None
+        Returns:
+            list: [(username, total)] by decreasing total
+        """
+        return list(self.tops.get(period_key, []))[:limit]
+
+    def get_count(self, period_key, username):
+        """
+        Args:
+            period_key (str): key returned by period_keys
+            username (str): display name of the user
+        Returns:
+            int: number of ++ received by the user in the period
+        """
+        return self.counters.get(period_key, {}).get(username, 0)
+
+
+class DynamoDBBackend:
+    """
+    Rollups kept in the Rollups table.
+
+    Each counter is an item (period, username) with total_num. The top-N of a
+    period is the item (period, '#top'), so a ranking is one GetItem.
+    The top-N item is written with a version condition, because the shards of
+    the stream are processed by concurrent invocations.
+    """
+
+    def __init__(self, client, table_name, top_size=10, hour_retention_days=30, max_attempts=5):
+        """
+        Args:
+            client (object): boto3 DynamoDB client
+            table_name (str): name of the Rollups table
+            top_size (int): number of entries of each top-N
+            hour_retention_days (int): days the hourly items are kept (expires_at), 0 to keep them
+            max_attempts (int): attempts to write a top-N item modified concurrently
+        """
+        self.client = client
+        self.table_name = table_name
+        self.top_size = top_size
+        self.hour_retention_days = hour_retention_days
+        self.max_attempts = max_attempts
+
+    def expires_at(self, period_key):
+        """
+        Args:
+            period_key (str): key returned by period_keys
+        Returns:
+            int: epoch seconds the items of the period can be deleted at, None to keep them
+        """
+        if period_key.startswith('hour#') and self.hour_retention_days:
+            return int(time.time()) + self.hour_retention_days * 86400
+        return None
+
+    def apply(self, increments):
+        """
+        Args:
+            increments (dict): {period_key: {to_username: increment}}, see aggregate
+        """
+        for period_key, counts in increments.items():
+            expires_at = self.expires_at(period_key)
+            totals = {
+                username: self.add(period_key, username, count, expires_at)
+                for username, count in counts.items()
+            }
+            self.update_top(period_key, totals, expires_at)
+
+    def add(self, period_key, username, count, expires_at=None):
+        """
+        Returns:
+            int: new total of the counter
+        """
+        update_expression = 'ADD total_num :incr'
+        values = {':incr': {'N': str(count)}}
+        if expires_at is not None:
+            update_expression += ' SET expires_at = :expires_at'
+            values[':expires_at'] = {'N': str(expires_at)}
+
+        response = self.client.update_item(
+            TableName=self.table_name,
+            Key={'period': {'S': period_key}, 'username': {'S': username}},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values,
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['total_num']['N'])
+
+    def read_top(self, period_key):
+        """
+        Returns:
+            tuple: ([(username, total)], version), version is 0 if the item does not exist
+        """
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={'period': {'S': period_key}, 'username': {'S': TOP_KEY}},
+            ConsistentRead=True
+        )
+        item = response.get('Item')
+        if not item:
+            return [], 0
+        top = [(entry['M']['username']['S'], int(entry['M']['total_num']['N'])) for entry in item['top']['L']]
+        return top, int(item['version']['N'])
+
+    def update_top(self, period_key, totals, expires_at=None):
+        """
+        Merge new totals into the top-N item, retrying when another invocation wrote it first.
+
+        Returns:
+            bool: True if the top-N item has been written
+        """
+        # botocore is already loaded by the client
+        from botocore.exceptions import ClientError
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(random.uniform(0, min(1.0, 0.05 * (2 ** attempt))))
+            top, version = self.read_top(period_key)
+            merged = merge_top(top, totals, self.top_size)
+            if merged == top:
+                return True
+
+            item = {
+                'period': {'S': period_key},
+                'username': {'S': TOP_KEY},
+                'top': {'L': [
+                    {'M': {'username': {'S': username}, 'total_num': {'N': str(total)}}}
+                    for username, total in merged
+                ]},
+                'version': {'N': str(version + 1)},
+            }
+            if expires_at is not None:
+                item['expires_at'] = {'N': str(expires_at)}
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item=item,
+                    ConditionExpression='attribute_not_exists(version) OR version = :version',
+                    ExpressionAttributeValues={':version': {'N': str(version)}}
+                )
+                return True
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+        logger.error(f"Could not update the top of {period_key} after {self.max_attempts} attempts")
+        return False
+
+    def get_top(self, period_key, limit=None):
+        """
+        Args:
+            period_key (str): key returned by period_keys
+            limit (int): number of entries returned, all of the top-N if None
+        Returns:
+            list: [(username, total)] by decreasing total
+        """
+        top, _ = self.read_top(period_key)
+        return top[:limit]
+
+    def get_count(self, period_key, username):
+        """
+        Args:
+            period_key (str): key returned by period_keys
+            username (str): display name of the user
+        Returns:
+            int: number of ++ received by the user in the period
+        """
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={'period': {'S': period_key}, 'username': {'S': username}}
+        )
+        item = response.get('Item')
+        return int(item['total_num']['N']) if item else 0
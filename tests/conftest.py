@@ -0,0 +1,8 @@
+import os
+
+# The handlers read these when they are imported. Set them here rather than
+# relying on another test module (e.g. the benchmark one) to set them first;
+# the values exported as in the README take precedence.
+os.environ.setdefault('SLACK_TOKEN', 'xoxb-test')
+os.environ.setdefault('SLACK_SIGNING_SECRET', 'test-signing-secret')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
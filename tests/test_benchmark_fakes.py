@@ -0,0 +1,124 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import unittest
+from botocore.exceptions import ClientError
+from fakes import FakeDynamoDB, FakeSlackClient
+from bench_end_to_end import signed_event, make_body, percentile
+from lambda_function.dedupe import EventDeduplicator
+from lambda_function.handler import verify_request, SLACK_SIGNING_SECRET
+import random
+
+class TestSignedEvent(unittest.TestCase):
+
+    def test_signature_is_accepted(self):
+        event = signed_event(make_body(0, random.Random(1)), SLACK_SIGNING_SECRET)
+        self.assertTrue(verify_request(event, SLACK_SIGNING_SECRET))
+
+    def test_signature_with_another_secret_is_rejected(self):
+        event = signed_event(make_body(0, random.Random(1)), 'another-secret')
+        self.assertFalse(verify_request(event, SLACK_SIGNING_SECRET))
+
+class TestFakeDynamoDB(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeDynamoDB()
+
+    def test_update_expressions(self):
+        key = {'username': {'S': 'alice'}}
+        self.client.update_item(TableName='UserCounts', Key=key,
+                                UpdateExpression="ADD total_num :incr SET board = :board",
+                                ExpressionAttributeValues={':incr': {'N': '2'}, ':board': {'S': 'all'}})
+        response = self.client.update_item(TableName='UserCounts', Key=key,
+                                           UpdateExpression="ADD total_num :incr",
+                                           ExpressionAttributeValues={':incr': {'N': '3'}},
+                                           ReturnValues="UPDATED_NEW")
+        self.assertEqual(response['Attributes'], {'total_num': {'N': '5'}})
+
+        response = self.client.update_item(TableName='UserCounts', Key=key,
+                                           UpdateExpression="SET shard_count = if_not_exists(shard_count, :shards)",
+                                           ExpressionAttributeValues={':shards': {'N': '4'}},
+                                           ReturnValues="ALL_NEW")
+        self.assertEqual(response['Attributes']['shard_count'], {'N': '4'})
+        self.assertEqual(response['Attributes']['board'], {'S': 'all'})
+
+    def test_dedupe_condition(self):
+        now = [1000]
+        deduplicator = EventDeduplicator(table_name='ProcessedEvents', ttl=60, clock=lambda: now[0])
+        self.assertTrue(deduplicator.claim(self.client, 'msg#1'))
+        self.assertFalse(EventDeduplicator(table_name='ProcessedEvents', ttl=60, clock=lambda: now[0])
+                         .claim(self.client, 'msg#1'))
+        now[0] = 2000
+        self.assertTrue(EventDeduplicator(table_name='ProcessedEvents', ttl=60, clock=lambda: now[0])
+                        .claim(self.client, 'msg#1'))
+
+    def test_failed_transaction_is_rolled_back(self):
+        actions = [
+            {'Update': {'TableName': 'UserCounts', 'Key': {'username': {'S': 'alice'}},
+                        'UpdateExpression': "ADD total_num :incr",
+                        'ExpressionAttributeValues': {':incr': {'N': '1'}}}},
+            {'Put': {'TableName': 'ProcessedEvents', 'Item': {'event_key': {'S': 'k'}},
+                     'ConditionExpression': "attribute_not_exists(event_key)"}},
+        ]
+        self.client.transact_write_items(TransactItems=actions)
+        with self.assertRaises(ClientError) as context:
+            self.client.transact_write_items(TransactItems=actions)
+
+        self.assertEqual(context.exception.response['Error']['Code'], 'TransactionCanceledException')
+        item = self.client.get_item(TableName='UserCounts', Key={'username': {'S': 'alice'}})['Item']
+        self.assertEqual(item['total_num'], {'N': '1'})
+
+    def test_query_index_in_order(self):
+        for username, total in (('alice', 3), ('bob', 5), ('carol', 1)):
+            self.client.put_item(TableName='UserCounts', Item={
+                'username': {'S': username}, 'total_num': {'N': str(total)}, 'board': {'S': 'all'}})
+        self.client.put_item(TableName='UserCounts', Item={'username': {'S': 'dave#shard-0'}, 'total_num': {'N': '9'}})
+
+        response = self.client.query(TableName='UserCounts', IndexName='leaderboard',
+                                     KeyConditionExpression='board = :board',
+                                     ExpressionAttributeValues={':board': {'S': 'all'}},
+                                     ScanIndexForward=False, Limit=2)
+
+        self.assertEqual([item['username']['S'] for item in response['Items']], ['bob', 'alice'])
+        self.assertEqual(self.client.calls['PutItem'], 4)
+
+    def test_segments_of_a_scan_cover_the_table_once(self):
+        for i in range(50):
+            self.client.put_item(TableName='UserCounts', Item={'username': {'S': f"user{i}"}, 'total_num': {'N': '1'}})
+
+        names = []
+        for segment in range(4):
+            request = {'TableName': 'UserCounts', 'Segment': segment, 'TotalSegments': 4,
+                       'Limit': 5, 'ProjectionExpression': 'username'}
+            while True:
+                response = self.client.scan(**request)
+                names.extend(item['username']['S'] for item in response['Items'])
+                self.assertTrue(all('total_num' not in item for item in response['Items']))
+                if 'LastEvaluatedKey' not in response:
+                    break
+                request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        self.assertEqual(sorted(names), sorted(f"user{i}" for i in range(50)))
+
+class TestFakeSlackClient(unittest.TestCase):
+
+    def test_calls_are_counted(self):
+        client = FakeSlackClient(users={'U1': 'John'})
+        self.assertEqual(client.users_info(user='U1')['user']['profile']['display_name'], 'John')
+        self.assertTrue(client.chat_postMessage(channel='C1', text='hi').get('ok'))
+        self.assertEqual(client.posted, [('C1', 'hi')])
+        self.assertEqual(dict(client.calls), {'users.info': 1, 'chat.postMessage': 1})
+
+class TestPercentile(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+if __name__ == '__main__':
+    unittest.main()
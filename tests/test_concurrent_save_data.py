@@ -0,0 +1,99 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import unittest
+from unittest.mock import patch
+from lambda_function.handler import concurrent_save_data, save_data_to_dynamodb
+
+class InFlight:
+    """
+    Calls that only return once `parties` of them are running at the same
+    time, which fails with BrokenBarrierError if they are made one by one.
+    """
+
+    def __init__(self, parties, value):
+        self.value = value
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            self.barrier.wait()
+        finally:
+            with self.lock:
+                self.running -= 1
+        return self.value
+
+@patch('lambda_function.handler._executor', None)
+@patch('lambda_function.handler.IO_MAX_WORKERS', 8)
+class TestConcurrentSaveData(unittest.TestCase):
+
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb')
+    def test_concurrent_save_data_overlaps_calls(self, mock_dynamodb, mock_get_slack_username):
+        puts = InFlight(4, {'ResponseMetadata': {'HTTPStatusCode': 200}})
+        updates = InFlight(4, {
+            'ResponseMetadata': {'HTTPStatusCode': 200},
+            'Attributes': {'total_num': {'N': '7'}}
+        })
+        mock_dynamodb.put_item.side_effect = puts
+        mock_dynamodb.update_item.side_effect = updates
+        user_map = {'alice': 1, 'bob': 1, 'carol': 1, 'dave': 1}
+
+        response = concurrent_save_data("johndoe", user_map, "alice++ bob++ carol++ dave++")
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['new_user_count_map'], {'alice': 7, 'bob': 7, 'carol': 7, 'dave': 7})
+        self.assertEqual(mock_dynamodb.put_item.call_count, 4)
+        self.assertEqual(mock_dynamodb.update_item.call_count, 4)
+        # the 4 puts, then the 4 updates, ran at the same time
+        self.assertEqual(puts.max_running, 4)
+        self.assertEqual(updates.max_running, 4)
+        item = mock_dynamodb.put_item.call_args.kwargs['Item']
+        self.assertEqual(item['from_username'], {'S': 'John'})
+
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb')
+    def test_save_data_to_dynamodb_failure(self, mock_dynamodb, mock_get_slack_username):
+        mock_dynamodb.put_item.return_value = {'ResponseMetadata': {'HTTPStatusCode': 400}}
+        mock_dynamodb.update_item.return_value = {
+            'ResponseMetadata': {'HTTPStatusCode': 200},
+            'Attributes': {'total_num': {'N': '1'}}
+        }
+
+        result = save_data_to_dynamodb("johndoe", {'alice': 1}, "alice++")
+
+        self.assertEqual(result, {'ok': False})
+        # as in the sequential path, nothing is counted for a message that was not saved
+        mock_dynamodb.update_item.assert_not_called()
+
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb')
+    def test_no_increment_when_a_put_raises(self, mock_dynamodb, mock_get_slack_username):
+        mock_dynamodb.put_item.side_effect = [{'ResponseMetadata': {'HTTPStatusCode': 200}}, ConnectionError()]
+
+        with self.assertRaises(ConnectionError):
+            concurrent_save_data("johndoe", {'alice': 1, 'bob': 1}, "alice++ bob++")
+
+        mock_dynamodb.update_item.assert_not_called()
+
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb')
+    def test_concurrent_save_data_raises_errors(self, mock_dynamodb, mock_get_slack_username):
+        mock_dynamodb.put_item.return_value = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        mock_dynamodb.update_item.return_value = {'ResponseMetadata': {'HTTPStatusCode': 400}}
+
+        # Same as increment_count: a response without 'Attributes' raises KeyError
+        with self.assertRaises(KeyError):
+            concurrent_save_data("johndoe", {'alice': 1}, "alice++")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+from lambda_function import dedupe
+from lambda_function.dedupe import EventDeduplicator, event_key
+from lambda_function.handler import lambda_handler
+
+def conditional_check_failed():
+    return ClientError(
+        {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'exists'}},
+        'PutItem'
+    )
+
+class TestEventKey(unittest.TestCase):
+
+    def test_prefers_client_msg_id(self):
+        body = {'event_id': 'Ev1', 'event': {'client_msg_id': 'abc'}}
+        self.assertEqual(event_key(body), 'msg#abc')
+
+    def test_falls_back_to_event_id(self):
+        self.assertEqual(event_key({'event_id': 'Ev1', 'event': {}}), 'event#Ev1')
+
+    def test_no_id(self):
+        self.assertIsNone(event_key({'event': {}}))
+
+class TestEventDeduplicator(unittest.TestCase):
+
+    def test_memory_only(self):
+        deduplicator = EventDeduplicator(table_name='')
+        client = MagicMock()
+
+        self.assertTrue(deduplicator.claim(client, 'msg#abc'))
+        self.assertFalse(deduplicator.claim(client, 'msg#abc'))
+        client.put_item.assert_not_called()
+
+    def test_marker_written_once(self):
+        deduplicator = EventDeduplicator(table_name='ProcessedEvents')
+        client = MagicMock()
+
+        self.assertTrue(deduplicator.claim(client, 'msg#abc'))
+        # the second delivery is caught in memory without a write
+        self.assertFalse(deduplicator.claim(client, 'msg#abc'))
+        client.put_item.assert_called_once()
+        self.assertEqual(client.put_item.call_args.kwargs['Item']['event_key'], {'S': 'msg#abc'})
+
+    def test_marker_written_by_another_container(self):
+        deduplicator = EventDeduplicator(table_name='ProcessedEvents')
+        client = MagicMock()
+        client.put_item.side_effect = conditional_check_failed()
+
+        self.assertFalse(deduplicator.claim(client, 'msg#abc'))
+        self.assertEqual(deduplicator.duplicates, 1)
+
+    def test_memory_entries_expire(self):
+        now = [1000]
+        deduplicator = EventDeduplicator(table_name='', ttl=60, clock=lambda: now[0])
+        client = MagicMock()
+
+        deduplicator.claim(client, 'msg#abc')
+        now[0] += 61
+
+        self.assertTrue(deduplicator.claim(client, 'msg#abc'))
+
+    def test_release(self):
+        deduplicator = EventDeduplicator(table_name='ProcessedEvents')
+        client = MagicMock()
+
+        deduplicator.claim(client, 'msg#abc')
+        deduplicator.release(client, 'msg#abc')
+
+        client.delete_item.assert_called_once()
+        self.assertTrue(deduplicator.claim(client, 'msg#abc'))
+
+class TestLambdaHandlerDedupe(unittest.TestCase):
+
+    def setUp(self):
+        body = {"event_id": "Ev1", "event": {"type": "message", "client_msg_id": "abc", "text": "alice++", "user": "U1", "channel": "C1"}}
+        self.event = {'body': json.dumps(body)}
+        dedupe.reset_deduplicator()
+
+    def tearDown(self):
+        dedupe.reset_deduplicator()
+
+    @patch('lambda_function.dedupe.DEDUPE_TABLE', '')
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb', return_value={"alice": 2})
+    @patch('lambda_function.handler.post_message', return_value={'ok': True})
+    def test_duplicate_delivery_is_dropped(self, mock_post, mock_save, mock_verify):
+        first = lambda_handler(self.event, {})
+        retry = lambda_handler(self.event, {})
+
+        self.assertEqual(first, {'statusCode': 200, 'ok': True})
+        self.assertEqual(retry, {'statusCode': 200})
+        mock_save.assert_called_once()
+        mock_post.assert_called_once()
+
+    @patch('lambda_function.dedupe.DEDUPE_TABLE', '')
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb', side_effect=[RuntimeError("boom"), {"alice": 2}])
+    @patch('lambda_function.handler.post_message', return_value={'ok': True})
+    def test_failed_event_can_be_retried(self, mock_post, mock_save, mock_verify):
+        with self.assertRaises(RuntimeError):
+            lambda_handler(self.event, {})
+
+        retry = lambda_handler(self.event, {})
+
+        self.assertEqual(retry, {'statusCode': 200, 'ok': True})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+from lambda_function import dynamodb_batch
+
+def make_items(n):
+    return [{'username': {'S': f"user{i}"}} for i in range(n)]
+
+def cancelled(reason):
+    return ClientError(
+        {
+            'Error': {'Code': 'TransactionCanceledException', 'Message': 'cancelled'},
+            'CancellationReasons': [{'Code': reason}]
+        },
+        'TransactWriteItems'
+    )
+
+@patch('lambda_function.dynamodb_batch.backoff')
+class TestBatchWriteItems(unittest.TestCase):
+
+    def test_chunks_by_25(self, mock_backoff):
+        client = MagicMock()
+        client.batch_write_item.return_value = {'UnprocessedItems': {}}
+
+        response = dynamodb_batch.batch_write_items(client, 'Messages', make_items(60))
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['calls'], 3)
+        sizes = [len(c.kwargs['RequestItems']['Messages']) for c in client.batch_write_item.call_args_list]
+        self.assertEqual(sizes, [25, 25, 10])
+
+    def test_retries_unprocessed_items(self, mock_backoff):
+        items = make_items(3)
+        client = MagicMock()
+        client.batch_write_item.side_effect = [
+            {'UnprocessedItems': {'Messages': [{'PutRequest': {'Item': items[2]}}]}},
+            {'UnprocessedItems': {}}
+        ]
+
+        response = dynamodb_batch.batch_write_items(client, 'Messages', items)
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['calls'], 2)
+        retried = client.batch_write_item.call_args_list[1].kwargs['RequestItems']['Messages']
+        self.assertEqual(retried, [{'PutRequest': {'Item': items[2]}}])
+
+    def test_reports_items_left_unprocessed(self, mock_backoff):
+        items = make_items(2)
+        client = MagicMock()
+        client.batch_write_item.return_value = {
+            'UnprocessedItems': {'Messages': [{'PutRequest': {'Item': items[0]}}]}
+        }
+
+        response = dynamodb_batch.batch_write_items(client, 'Messages', items, max_attempts=3)
+
+        self.assertFalse(response['ok'])
+        self.assertEqual(response['unprocessed'], [items[0]])
+        self.assertEqual(client.batch_write_item.call_count, 3)
+
+
+@patch('lambda_function.dynamodb_batch.backoff')
+class TestBatchGetItems(unittest.TestCase):
+
+    def test_retries_unprocessed_keys(self, mock_backoff):
+        keys = make_items(2)
+        client = MagicMock()
+        client.batch_get_item.side_effect = [
+            {'Responses': {'UserCounts': [keys[0]]}, 'UnprocessedKeys': {'UserCounts': {'Keys': [keys[1]]}}},
+            {'Responses': {'UserCounts': [keys[1]]}, 'UnprocessedKeys': {}}
+        ]
+
+        response = dynamodb_batch.batch_get_items(client, 'UserCounts', keys)
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['items'], keys)
+
+
+@patch('lambda_function.dynamodb_batch.backoff')
+class TestTransactWriteItems(unittest.TestCase):
+
+    def test_keeps_groups_in_the_same_transaction(self, mock_backoff):
+        client = MagicMock()
+        actions = [{'Put': {'n': i}} for i in range(150)]
+
+        response = dynamodb_batch.transact_write_items(client, actions, group_size=3)
+
+        self.assertTrue(response['ok'])
+        sizes = [len(c.kwargs['TransactItems']) for c in client.transact_write_items.call_args_list]
+        self.assertEqual(sizes, [99, 51])
+
+    def test_retries_conflicts(self, mock_backoff):
+        client = MagicMock()
+        client.transact_write_items.side_effect = [cancelled('TransactionConflict'), {}]
+
+        response = dynamodb_batch.transact_write_items(client, [{'Put': {}}])
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['calls'], 2)
+
+    def test_reports_failed_transactions(self, mock_backoff):
+        client = MagicMock()
+        client.transact_write_items.side_effect = cancelled('ConditionalCheckFailed')
+        actions = [{'Put': {}}]
+
+        response = dynamodb_batch.transact_write_items(client, actions)
+
+        self.assertFalse(response['ok'])
+        self.assertEqual(response['failed'], actions)
+        self.assertEqual(response['errors'], ['TransactionCanceledException'])
+        self.assertEqual(client.transact_write_items.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
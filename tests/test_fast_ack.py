@@ -0,0 +1,65 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import unittest
+from unittest.mock import patch
+from lambda_function import async_dispatch
+from lambda_function.handler import lambda_handler
+
+class TestFastAck(unittest.TestCase):
+
+    def setUp(self):
+        self.body = {"event": {"type": "message", "text": "alice++", "user": "some_user", "channel": "some_channel"}}
+        self.event = {'body': json.dumps(self.body)}
+        self.dispatcher = async_dispatch.InProcessDispatcher()
+        async_dispatch.set_dispatcher(self.dispatcher)
+
+    def tearDown(self):
+        async_dispatch.reset_dispatcher()
+
+    @patch('lambda_function.handler.FAST_ACK', True)
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb', return_value={"alice": 2})
+    @patch('lambda_function.handler.post_message', return_value={'ok': True})
+    def test_acknowledges_before_processing(self, mock_post, mock_save, mock_verify):
+        response = lambda_handler(self.event, {})
+
+        self.assertEqual(response, {'statusCode': 200})
+        mock_save.assert_not_called()
+        self.assertEqual(len(self.dispatcher.events), 1)
+
+        results = self.dispatcher.drain(lambda_handler)
+
+        self.assertEqual(results, [{'statusCode': 200, 'ok': True}])
+        mock_save.assert_called_once_with("some_user", {"alice": 1}, "alice++")
+        mock_post.assert_called_once_with("some_channel", scores={"alice": 2}, max_wait=None)
+        # the worker event is not a Slack request and is not verified again
+        mock_verify.assert_called_once()
+
+    @patch('lambda_function.handler.FAST_ACK', True)
+    @patch('lambda_function.handler.verify_request', return_value=False)
+    def test_does_not_dispatch_unverified_requests(self, mock_verify):
+        response = lambda_handler(self.event, {})
+
+        self.assertIsNone(response)
+        self.assertEqual(self.dispatcher.events, [])
+
+class TestInvokeSelf(unittest.TestCase):
+
+    @patch.dict(os.environ, {'AWS_LAMBDA_FUNCTION_NAME': 'slack_bot'})
+    @patch('lambda_function.async_dispatch._lambda_client')
+    def test_dispatch_invokes_function_asynchronously(self, mock_lambda_client):
+        mock_lambda_client.invoke.return_value = {'StatusCode': 202}
+
+        async_dispatch.dispatch({"event": {}})
+
+        kwargs = mock_lambda_client.invoke.call_args.kwargs
+        self.assertEqual(kwargs['FunctionName'], 'slack_bot')
+        self.assertEqual(kwargs['InvocationType'], 'Event')
+        self.assertTrue(async_dispatch.is_worker_event(json.loads(kwargs['Payload'])))
+
+if __name__ == '__main__':
+    unittest.main()
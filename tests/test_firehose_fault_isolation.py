@@ -0,0 +1,150 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import base64
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from lambda_function_firehose.handler import lambda_handler
+
+STREAM_ARN = 'arn:aws:kinesis:ap-northeast-1:123456789012:stream/slack_assignment_data_stream'
+
+def change(event_name='INSERT', to_username='alice', message='alice++'):
+    record = {
+        'eventID': f"id-{to_username}",
+        'eventName': event_name,
+        'dynamodb': {'ApproximateCreationDateTime': 1700000000123}
+    }
+    if event_name != 'REMOVE':
+        record['dynamodb']['NewImage'] = {
+            'to_username': {'S': to_username},
+            'from_username': {'S': 'John'},
+            'message': {'S': message},
+            'username': {'S': 'U1'},
+            'incr_num': {'N': '1'},
+            'time_to_username': {'S': f'1700000000000#{to_username}'}
+        }
+    return record
+
+def encode(data):
+    if not isinstance(data, bytes):
+        data = json.dumps(data).encode('utf-8')
+    return base64.b64encode(data).decode('ascii')
+
+def firehose_event(*records):
+    return {
+        'sourceKinesisStreamArn': STREAM_ARN,
+        'records': [
+            {'recordId': f"rec{i}", 'data': encode(data), 'kinesisRecordMetadata': {'partitionKey': f"pk{i}"}}
+            for i, data in enumerate(records)
+        ]
+    }
+
+class TestFaultIsolation(unittest.TestCase):
+
+    def test_bad_records_do_not_fail_the_batch(self):
+        malformed = change()
+        del malformed['dynamodb']['NewImage']['incr_num']
+        event = firehose_event(change(), change('REMOVE'), b'{not json', malformed, change(to_username='bob'))
+        inputs = [record['data'] for record in event['records']]
+
+        with self.assertLogs(level='INFO') as logs:
+            response = lambda_handler(event, {})
+
+        results = [record['result'] for record in response['records']]
+        self.assertEqual(results, ['Ok', 'Dropped', 'ProcessingFailed', 'ProcessingFailed', 'Ok'])
+        # failed records keep their data for the error output
+        self.assertEqual(response['records'][2]['data'], inputs[2])
+        self.assertEqual(json.loads(base64.b64decode(response['records'][4]['data']))['to_username'], 'bob')
+
+        summary = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(summary['outcomes'], {
+            'Ok': 2, 'Dropped': 1, 'ProcessingFailed': 2, 'error:JSONDecodeError': 1, 'error:KeyError': 1})
+        failures = [json.loads(r.getMessage()) for r in logs.records if 'record failed' in r.getMessage()]
+        self.assertEqual([failure['error'] for failure in failures], ['JSONDecodeError', 'KeyError'])
+
+class TestResponseSize(unittest.TestCase):
+
+    def setUp(self):
+        self.event = firehose_event(*[change(to_username=f"user{i}", message='x' * 300) for i in range(10)])
+        self.kinesis = MagicMock()
+        self.kinesis.put_records.side_effect = lambda StreamARN, Records: {
+            'FailedRecordCount': 0, 'Records': [{'SequenceNumber': '1'} for _ in Records]}
+
+    def test_overflow_is_put_back_to_the_stream(self):
+        with patch('lambda_function_firehose.handler.MAX_RESPONSE_BYTES', 2000), \
+                patch('lambda_function_firehose.handler.kinesis', self.kinesis):
+            response = lambda_handler(self.event, {})
+
+        records = response['records']
+        ok = [record for record in records if record['result'] == 'Ok']
+        self.assertTrue(0 < len(ok) < 10)
+        self.assertLessEqual(len(json.dumps(response)), 2000)
+        overflow = records[len(ok):]
+        self.assertTrue(all(record['result'] == 'Dropped' and record['data'] == '' for record in overflow))
+
+        entries = self.kinesis.put_records.call_args.kwargs['Records']
+        self.assertEqual(self.kinesis.put_records.call_args.kwargs['StreamARN'], STREAM_ARN)
+        self.assertEqual([entry['PartitionKey'] for entry in entries], [record['recordId'].replace('rec', 'pk') for record in overflow])
+        put_back = json.loads(entries[0]['Data'])
+        self.assertEqual(put_back['reingested'], 1)
+        self.assertEqual(put_back['dynamodb']['NewImage']['to_username']['S'], f"user{len(ok)}")
+
+    def test_malformed_record_past_the_limit_is_put_back_as_is(self):
+        malformed = b'{not json ' + b'x' * 1000
+        event = firehose_event(change(), malformed)
+
+        with patch('lambda_function_firehose.handler.MAX_RESPONSE_BYTES', 900), \
+                patch('lambda_function_firehose.handler.kinesis', self.kinesis):
+            response = lambda_handler(event, {})
+
+        self.assertEqual([record['result'] for record in response['records']], ['Ok', 'Dropped'])
+        entries = self.kinesis.put_records.call_args.kwargs['Records']
+        self.assertEqual([entry['Data'] for entry in entries], [malformed])
+
+    def test_record_larger_than_the_response_fails(self):
+        event = firehose_event(change(message='x' * 3000), change())
+        data = event['records'][0]['data']
+
+        with patch('lambda_function_firehose.handler.MAX_RESPONSE_BYTES', 2000), \
+                patch('lambda_function_firehose.handler.kinesis', self.kinesis), \
+                self.assertLogs(level='INFO') as logs:
+            response = lambda_handler(event, {})
+
+        # written under the error prefix rather than put back again and again
+        self.assertEqual([record['result'] for record in response['records']], ['ProcessingFailed', 'Dropped'])
+        self.assertEqual(response['records'][0]['data'], data)
+        self.assertEqual([entry['PartitionKey'] for entry in self.kinesis.put_records.call_args.kwargs['Records']], ['pk1'])
+        summary = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(summary['outcomes'], {'ProcessingFailed': 1, 'Reingested': 1, 'error:RecordTooLarge': 1})
+
+    def test_failed_puts_are_retried(self):
+        calls = []
+        def put_records(StreamARN, Records):
+            calls.append(len(Records))
+            if len(calls) == 1:
+                return {'FailedRecordCount': 1, 'Records': [{'ErrorCode': 'ProvisionedThroughputExceededException'}] +
+                        [{'SequenceNumber': '1'} for _ in Records[1:]]}
+            return {'FailedRecordCount': 0, 'Records': [{'SequenceNumber': '1'} for _ in Records]}
+        self.kinesis.put_records.side_effect = put_records
+
+        with patch('lambda_function_firehose.handler.MAX_RESPONSE_BYTES', 2000), \
+                patch('lambda_function_firehose.handler.kinesis', self.kinesis), \
+                patch('lambda_function_firehose.handler.time.sleep'):
+            lambda_handler(self.event, {})
+
+        self.assertEqual(calls[1], 1)
+
+    def test_overflow_without_source_stream_fails_the_batch(self):
+        del self.event['sourceKinesisStreamArn']
+        with patch('lambda_function_firehose.handler.MAX_RESPONSE_BYTES', 2000), self.assertRaises(RuntimeError):
+            lambda_handler(self.event, {})
+
+    def test_records_fit_by_default(self):
+        response = lambda_handler(self.event, {})
+        self.assertTrue(all(record['result'] == 'Ok' for record in response['records']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import base64
+import json
+import unittest
+from unittest.mock import patch
+from lambda_function import message_schema
+from lambda_function_firehose import handler
+from lambda_function_firehose.handler import lambda_handler
+
+# 2023-09-03 14:05:00.123 UTC
+CREATED = 1693749900123
+# 2023-09-04 02:00 UTC, a backlog delivered half a day late
+ARRIVED = 1693792800000
+
+def change(image, created=CREATED):
+    image = json.loads(json.dumps(image, default=lambda data: base64.b64encode(data).decode('ascii')))
+    return {
+        'eventID': 'some_id',
+        'eventName': 'INSERT',
+        'dynamodb': {'ApproximateCreationDateTime': created, 'NewImage': image}
+    }
+
+def firehose_event(*records):
+    return {'records': [
+        {
+            'recordId': f"rec{i}",
+            'approximateArrivalTimestamp': ARRIVED,
+            'data': base64.b64encode(json.dumps(record).encode('utf-8')).decode('ascii')
+        }
+        for i, record in enumerate(records)
+    ]}
+
+def v1_item(to_username):
+    return message_schema.build_v1_items('U1', 'John', {to_username: 1}, f"{to_username}++", CREATED)[0]
+
+class TestPartitionKeys(unittest.TestCase):
+
+    def test_keys_are_the_time_the_item_was_written(self):
+        response = lambda_handler(firehose_event(change(v1_item('alice'))), {})
+
+        self.assertEqual(response['records'][0]['metadata'], {
+            'partitionKeys': {'year': '2023', 'month': '09', 'day': '03', 'hour': '14'}
+        })
+
+    def test_arrival_time_without_creation_time(self):
+        record = change(v1_item('alice'), created='some_date')
+
+        response = lambda_handler(firehose_event(record), {})
+
+        self.assertEqual(response['records'][0]['metadata']['partitionKeys']['day'], '04')
+        self.assertEqual(response['records'][0]['metadata']['partitionKeys']['hour'], '02')
+
+    def test_dropped_and_failed_records_have_no_keys(self):
+        remove = {'eventID': 'some_id', 'eventName': 'REMOVE', 'dynamodb': {'ApproximateCreationDateTime': CREATED}}
+        event = firehose_event(remove)
+        event['records'].append({'recordId': 'bad', 'data': base64.b64encode(b'{not json').decode('ascii')})
+
+        response = lambda_handler(event, {})
+
+        self.assertEqual([record['result'] for record in response['records']], ['Dropped', 'ProcessingFailed'])
+        self.assertTrue(all('metadata' not in record for record in response['records']))
+
+class TestPartitionBuckets(unittest.TestCase):
+
+    def test_partition_bucket(self):
+        self.assertEqual(handler.partition_bucket('alice', 16), handler.partition_bucket('alice', 16))
+        self.assertEqual(len(handler.partition_bucket('alice', 16)), 2)
+        self.assertEqual(len(handler.partition_bucket('alice', 10)), 1)
+        buckets = {handler.partition_bucket(f"user{i}", 4) for i in range(100)}
+        self.assertEqual(buckets, {'0', '1', '2', '3'})
+
+    def test_default_bucket_count_follows_the_setting(self):
+        with patch('lambda_function_firehose.handler.PARTITION_BUCKETS', 16):
+            self.assertEqual(handler.partition_bucket('alice'), handler.partition_bucket('alice', 16))
+        with patch('lambda_function_firehose.handler.PARTITION_BUCKETS', 100):
+            self.assertEqual(handler.partition_bucket('alice'), handler.partition_bucket('alice', 100))
+
+    @patch('lambda_function_firehose.handler.PARTITION_BUCKETS', 16)
+    def test_bucket_of_the_recipient(self):
+        response = lambda_handler(firehose_event(change(v1_item('alice')), change(v1_item('bob'))), {})
+
+        keys = [record['metadata']['partitionKeys'] for record in response['records']]
+        self.assertEqual(keys[0]['bucket'], handler.partition_bucket('alice', 16))
+        self.assertEqual(keys[1]['bucket'], handler.partition_bucket('bob', 16))
+        self.assertEqual(keys[0]['hour'], '14')
+
+    @patch('lambda_function_firehose.handler.PARTITION_BUCKETS', 16)
+    def test_message_with_recipients_in_several_buckets_is_mixed(self):
+        recipients = ['alice', 'bob', 'carol', 'dave']
+        self.assertGreater(len({handler.partition_bucket(name, 16) for name in recipients}), 1)
+        message_item = message_schema.build_v2_items('U1', 'John', {name: 1 for name in recipients}, '++', CREATED)[0]
+
+        response = lambda_handler(firehose_event(change(message_item)), {})
+
+        self.assertEqual(response['records'][0]['metadata']['partitionKeys']['bucket'], handler.MIXED_BUCKET)
+
+    def test_no_bucket_by_default(self):
+        response = lambda_handler(firehose_event(change(v1_item('alice'))), {})
+
+        self.assertNotIn('bucket', response['records'][0]['metadata']['partitionKeys'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,14 +4,19 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import MagicMock
+from lambda_function import slack_client
+from lambda_function import user_cache
 from lambda_function.handler import get_slack_username
 from slack_sdk.errors import SlackApiError
 
 class TestGetSlackUsername(unittest.TestCase):
 
-    @patch('lambda_function.handler.WebClient')  # Mock the WebClient
-    def test_get_slack_username_success(self, MockWebClient):
+    def tearDown(self):
+        slack_client.reset_client()
+        user_cache.reset_cache()
+
+    def test_get_slack_username_success(self):
 
         # Mocked response
         mock_response = {
@@ -27,14 +32,36 @@ class TestGetSlackUsername(unittest.TestCase):
         # Setting the mock client's users_info method to return our mocked response
         mock_client = MagicMock()
         mock_client.users_info.return_value = mock_response
-        MockWebClient.return_value = mock_client
+        slack_client.set_client(mock_client)
+
+        result = get_slack_username("some_user_id")
+
+        self.assertEqual(result, "test_display_name")
+
+    def test_get_slack_username_cached(self):
+
+        mock_response = {
+            "ok": True,
+            "user": {
+                "profile": {
+                    "display_name": "test_display_name",
+                    "real_name": "test_real_name"
+                }
+            }
+        }
+
+        mock_client = MagicMock()
+        mock_client.users_info.return_value = mock_response
+        slack_client.set_client(mock_client)
 
+        get_slack_username("some_user_id")
         result = get_slack_username("some_user_id")
 
         self.assertEqual(result, "test_display_name")
+        mock_client.users_info.assert_called_once()
+        self.assertEqual(user_cache.get_cache().stats()['hits'], 1)
 
-    @patch('lambda_function.handler.WebClient')
-    def test_get_slack_username_failure(self, MockWebClient):
+    def test_get_slack_username_failure(self):
 
         mock_response = {
             "ok": False,
@@ -43,14 +70,13 @@ class TestGetSlackUsername(unittest.TestCase):
 
         mock_client = MagicMock()
         mock_client.users_info.return_value = mock_response
-        MockWebClient.return_value = mock_client
+        slack_client.set_client(mock_client)
 
         result = get_slack_username("some_user_id")
 
         self.assertEqual(result, "")
 
-    @patch('lambda_function.handler.WebClient')
-    def test_get_slack_username_exception(self, MockWebClient):
+    def test_get_slack_username_exception(self):
 
         mock_error_response = {"ok": False, "error": "some_error"}
         mock_client = MagicMock()
@@ -58,7 +84,7 @@ class TestGetSlackUsername(unittest.TestCase):
             message="Error message",
             response=mock_error_response
         )
-        MockWebClient.return_value = mock_client
+        slack_client.set_client(mock_client)
 
         result = get_slack_username("some_user_id")
 
@@ -0,0 +1,120 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import json
+import unittest
+from unittest.mock import patch
+from fakes import FakeDynamoDB
+from lambda_function import history, message_schema, outbox
+from lambda_function.handler import lambda_handler
+
+# 2023-09-03 14:05 UTC
+START = 1693749900000
+
+class TestParseCommand(unittest.TestCase):
+
+    def test_parse_command(self):
+        self.assertEqual(history.parse_command("++history alice"), ('history', ('alice', None)))
+        self.assertEqual(history.parse_command("++History <@U123>"), ('history', ('<@U123>', None)))
+        self.assertEqual(history.parse_command("++history alice abc"), ('history', ('alice', 'abc')))
+        self.assertIsNone(history.parse_command("++history"))
+        self.assertIsNone(history.parse_command("alice++"))
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        key = {
+            'username': {'S': 'U1'},
+            'time_to_username': {'S': f'{START}#alice'},
+            'to_username': {'S': 'alice'}
+        }
+        cursor = history.encode_cursor(key)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(history.decode_cursor(cursor, 'alice'), key)
+        self.assertIsNone(history.encode_cursor(None))
+
+    def test_cursor_of_another_user_is_rejected(self):
+        cursor = history.encode_cursor({'username': {'S': 'U1'}, 'time_to_username': {'S': f'{START}#alice'}})
+        with self.assertRaises(ValueError):
+            history.decode_cursor(cursor, 'bob')
+        with self.assertRaises(ValueError):
+            history.decode_cursor('not-a-cursor', 'alice')
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeDynamoDB()
+        history.reset_cache()
+        # 5 messages to alice, alternating layouts, and one to bob
+        for i in range(5):
+            items = message_schema.build_items(f"U{i}", f"sender{i}", {'alice': i + 1, 'bob': 1} if i == 4 else {'alice': i + 1},
+                                               f"alice++ message {i}", START + i * 60000, version=1 + i % 2)
+            for item in items:
+                self.client.put_item(TableName='Messages', Item=item)
+
+    def tearDown(self):
+        history.reset_cache()
+
+    def test_pages_newest_first(self):
+        first = history.query_page(self.client, 'alice', limit=2)
+
+        self.assertEqual([entry['message'] for entry in first['entries']], ['alice++ message 4', 'alice++ message 3'])
+        self.assertEqual(first['entries'][1], {
+            'timestamp': START + 3 * 60000,
+            'username': 'U3',
+            'from_username': 'sender3',
+            'incr_num': 4,
+            'message': 'alice++ message 3'
+        })
+        self.assertIsNotNone(first['cursor'])
+        # the text of the version 2 message is read with one BatchGetItem
+        self.assertEqual(self.client.calls['BatchGetItem'], 1)
+
+        second = history.query_page(self.client, 'alice', limit=2, cursor=first['cursor'])
+        self.assertEqual([entry['username'] for entry in second['entries']], ['U2', 'U1'])
+
+    def test_iter_history_follows_cursors(self):
+        entries = list(history.iter_history(self.client, 'alice', page_size=2))
+
+        self.assertEqual([entry['username'] for entry in entries], ['U4', 'U3', 'U2', 'U1', 'U0'])
+        self.assertEqual(self.client.calls['Query'], 3)
+        self.assertEqual([entry['incr_num'] for entry in history.iter_history(self.client, 'bob')], [1])
+
+    @patch('lambda_function.history.HISTORY_PAGE_SIZE', 2)
+    def test_answer_is_cached(self):
+        text = history.answer(self.client, ('history', ('alice', None)))
+
+        lines = text.splitlines()
+        self.assertEqual(lines[0], "2023-09-03 14:09 sender4 +5: alice++ message 4")
+        self.assertTrue(lines[2].startswith("more: ++history alice "))
+        cursor = lines[2].split()[-1]
+
+        self.assertEqual(history.answer(self.client, ('history', ('alice', None))), text)
+        self.assertEqual(self.client.calls['Query'], 1)
+
+        next_page = history.answer(self.client, ('history', ('alice', cursor)))
+        self.assertTrue(next_page.startswith("2023-09-03 14:07 sender2 +3"))
+
+    def test_answer_unknown_user_and_bad_cursor(self):
+        self.assertEqual(history.answer(self.client, ('history', ('carol', None))), "carol has not received ++ yet.\n")
+        self.assertIn("is not one of alice's history", history.answer(self.client, ('history', ('alice', 'abc'))))
+
+class TestLambdaHandlerHistory(unittest.TestCase):
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.answer_command', return_value={'statusCode': 200, 'ok': True})
+    @patch('lambda_function.handler.save_data_to_dynamodb')
+    def test_history_command(self, mock_save, mock_answer, mock_verify):
+        body = {'event': {'type': 'message', 'text': '++history <@U123>', 'user': 'U1', 'channel': 'C1'}}
+
+        response = lambda_handler({'body': json.dumps(body)}, {})
+
+        self.assertEqual(response, {'statusCode': 200, 'ok': True})
+        mock_answer.assert_called_once_with('C1', ('history', ('<@U123>', None)), outbox.SLACK_REQUEST_POST_MAX_WAIT)
+        mock_save.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
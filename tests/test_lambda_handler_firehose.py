@@ -6,6 +6,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import unittest
 import base64
 import json
+from unittest.mock import patch
 from lambda_function_firehose.handler import lambda_handler
 
 class TestLambdaHandler(unittest.TestCase):
@@ -66,11 +67,37 @@ class TestLambdaHandler(unittest.TestCase):
         self._validate_record(response['records'][0], 'rec1')
         self._validate_record(response['records'][1], 'rec2')
 
+    @patch('lambda_function_firehose.handler.orjson', None)
+    def test_lambda_handler_without_orjson(self):
+        response = lambda_handler(self.single_event, self.context)
+        self._validate_record(response['records'][0], 'rec1')
+
+    def test_lambda_handler_releases_input_records(self):
+        lambda_handler(self.double_event, self.context)
+        self.assertEqual(self.double_event['records'], [None, None])
+
+    @patch('lambda_function_firehose.handler.LOG_SAMPLE_RATE', 0)
+    def test_lambda_handler_logs_one_line_per_batch(self):
+        with self.assertLogs(level='INFO') as logs:
+            lambda_handler(self.double_event, self.context)
+        self.assertEqual(len(logs.records), 1)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['records'], 2)
+
+    @patch('lambda_function_firehose.handler.LOG_SAMPLE_RATE', 1)
+    def test_lambda_handler_logs_sampled_records(self):
+        with self.assertLogs(level='INFO') as logs:
+            lambda_handler(self.double_event, self.context)
+        samples = [json.loads(r.getMessage()) for r in logs.records[:-1]]
+        self.assertEqual([sample['recordId'] for sample in samples], ['rec1', 'rec2'])
+        self.assertEqual(samples[0]['data']['to_username'], 'to_user')
+
     def _validate_record(self, record, record_id):
         self.assertEqual(record['recordId'], record_id)
         self.assertEqual(record['result'], 'Ok')
         
         decoded_data = base64.b64decode(record['data']).decode('utf-8')
+        self.assertTrue(decoded_data.endswith('\n'))
         record_json = json.loads(decoded_data)
         
         self.assertEqual(record_json['eventID'], 'some_id')
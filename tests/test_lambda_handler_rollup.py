@@ -0,0 +1,71 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import base64
+import json
+from lambda_function_rollup import handler
+from lambda_function_rollup.handler import lambda_handler
+from lambda_function_rollup.rollup import InMemoryBackend
+
+def kinesis_record(change):
+    return {'kinesis': {'data': base64.b64encode(json.dumps(change).encode('utf-8')).decode('utf-8')}}
+
+def message_change(to_username, incr_num, event_name='INSERT', timestamp_ms=1693751100000):
+    return {
+        'eventID': 'some_id',
+        'eventName': event_name,
+        'dynamodb': {
+            'ApproximateCreationDateTime': timestamp_ms,
+            'NewImage': {
+                'to_username': {'S': to_username},
+                'from_username': {'S': 'from_user'},
+                'message': {'S': f'{to_username}++'},
+                'username': {'S': 'U123'},
+                'incr_num': {'N': str(incr_num)},
+                'time_to_username': {'S': f'1693751100.000100#{to_username}'}
+            }
+        }
+    }
+
+class TestLambdaHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = InMemoryBackend(top_size=3)
+        handler.set_backend(self.backend)
+
+    def tearDown(self):
+        handler.reset_backend()
+
+    def test_messages_rolled_up(self):
+        event = {'Records': [
+            kinesis_record(message_change('alice', 2)),
+            kinesis_record(message_change('bob', 1)),
+            kinesis_record(message_change('alice', 1)),
+        ]}
+        response = lambda_handler(event, {})
+
+        self.assertEqual(response, {'records': 3, 'messages': 3, 'counters': 8})
+        self.assertEqual(self.backend.get_top('day#2023-09-03'), [('alice', 3), ('bob', 1)])
+        self.assertEqual(self.backend.get_top('week#2023-W35'), [('alice', 3), ('bob', 1)])
+
+    def test_other_records_skipped(self):
+        without_recipient = message_change('alice', 1)
+        del without_recipient['dynamodb']['NewImage']['to_username']
+        # put back to the stream by the Firehose transform
+        reingested = dict(message_change('alice', 1), reingested=1)
+        event = {'Records': [
+            kinesis_record(message_change('alice', 1, event_name='MODIFY')),
+            kinesis_record(message_change('alice', 1, event_name='REMOVE')),
+            kinesis_record(without_recipient),
+            kinesis_record(reingested),
+        ]}
+        response = lambda_handler(event, {})
+
+        self.assertEqual(response, {'records': 4, 'messages': 0, 'counters': 0})
+        self.assertEqual(self.backend.counters, {})
+
+if __name__ == '__main__':
+    unittest.main()
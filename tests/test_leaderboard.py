@@ -0,0 +1,109 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from lambda_function import leaderboard, outbox
+from lambda_function.leaderboard import parse_command, ReadCache
+from lambda_function.handler import lambda_handler
+
+def query_response(*entries):
+    return {'Items': [
+        {'username': {'S': username}, 'total_num': {'N': str(total)}, 'board': {'S': 'all'}}
+        for username, total in entries
+    ]}
+
+class TestParseCommand(unittest.TestCase):
+
+    def test_top(self):
+        self.assertEqual(parse_command('++top 3'), ('top', 3))
+        self.assertEqual(parse_command(' ++TOP '), ('top', leaderboard.LEADERBOARD_DEFAULT_SIZE))
+        self.assertEqual(parse_command('++top 1000'), ('top', leaderboard.LEADERBOARD_MAX_SIZE))
+
+    def test_score(self):
+        self.assertEqual(parse_command('++score alice'), ('score', 'alice'))
+        self.assertEqual(parse_command('++score alice++'), ('score', 'alice'))
+        self.assertEqual(parse_command('++score <@U123|alice>'), ('score', '<@U123>'))
+
+    def test_not_a_command(self):
+        self.assertIsNone(parse_command('alice++'))
+        self.assertIsNone(parse_command('++top ten'))
+        self.assertIsNone(parse_command('++top 0'))
+        self.assertIsNone(parse_command('++score'))
+        self.assertIsNone(parse_command('++topics are welcome'))
+
+class TestReadCache(unittest.TestCase):
+
+    def test_entries_expire(self):
+        now = [0]
+        cache = ReadCache(ttl=10, clock=lambda: now[0])
+        load = MagicMock(side_effect=[1, 2])
+
+        self.assertEqual(cache.get_or_load(('score', 'alice'), load), 1)
+        self.assertEqual(cache.get_or_load(('score', 'alice'), load), 1)
+        now[0] = 10
+        self.assertEqual(cache.get_or_load(('score', 'alice'), load), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+class TestAnswer(unittest.TestCase):
+
+    def setUp(self):
+        leaderboard.reset_cache()
+
+    def tearDown(self):
+        leaderboard.reset_cache()
+
+    def test_top_from_index(self):
+        client = MagicMock()
+        client.query.return_value = query_response(('alice', 5), ('bob', 3))
+
+        self.assertEqual(leaderboard.answer(client, ('top', 2)), "1. alice: 5\n2. bob: 3\n")
+        # answered from the cache
+        leaderboard.answer(client, ('top', 2))
+
+        client.query.assert_called_once()
+        kwargs = client.query.call_args.kwargs
+        self.assertEqual(kwargs['IndexName'], 'leaderboard')
+        self.assertFalse(kwargs['ScanIndexForward'])
+        self.assertEqual(kwargs['Limit'], 2)
+        client.scan.assert_not_called()
+
+    def test_empty_top(self):
+        client = MagicMock()
+        client.query.return_value = query_response()
+        self.assertEqual(leaderboard.answer(client, ('top', 10)), "No one has received ++ yet.")
+
+    def test_score(self):
+        client = MagicMock()
+        client.get_item.side_effect = [{'Item': {'username': {'S': 'alice'}, 'total_num': {'N': '7'}}}, {}]
+
+        self.assertEqual(leaderboard.answer(client, ('score', 'alice')), "alice: 7\n")
+        self.assertEqual(leaderboard.answer(client, ('score', 'nobody')), "nobody: 0\n")
+
+class TestLambdaHandlerCommand(unittest.TestCase):
+
+    def setUp(self):
+        leaderboard.reset_cache()
+
+    def tearDown(self):
+        leaderboard.reset_cache()
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb')
+    @patch('lambda_function.handler.post_message', return_value={'ok': True})
+    @patch('lambda_function.handler.dynamodb')
+    def test_top_command(self, mock_dynamodb, mock_post, mock_save, mock_verify):
+        mock_dynamodb.query.return_value = query_response(('alice', 5))
+        event = {'body': json.dumps({'event': {'type': 'message', 'text': '++top 5', 'user': 'U1', 'channel': 'C1'}})}
+
+        response = lambda_handler(event, {})
+
+        self.assertEqual(response, {'statusCode': 200, 'ok': True})
+        mock_post.assert_called_once_with('C1', "1. alice: 5\n", max_wait=outbox.SLACK_REQUEST_POST_MAX_WAIT)
+        mock_save.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
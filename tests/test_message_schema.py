@@ -0,0 +1,172 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import base64
+import json
+import unittest
+from unittest.mock import patch
+from lambda_function import message_schema
+from lambda_function.handler import put_item_to_messages, transact_save_data, batch_put_item_to_messages
+from lambda_function_firehose.handler import lambda_handler as firehose_handler
+
+def change_record(image, event_id='some_id'):
+    """
+    Change record of an item as found in the stream, binary values in base64.
+    """
+    image = json.loads(json.dumps(image, default=lambda data: base64.b64encode(data).decode('ascii')))
+    return {
+        'eventID': event_id,
+        'eventName': 'INSERT',
+        'dynamodb': {'ApproximateCreationDateTime': 1700000000123, 'NewImage': image}
+    }
+
+def firehose_event(*records):
+    return {'records': [
+        {'recordId': f"rec{i}", 'data': base64.b64encode(json.dumps(record).encode('utf-8')).decode('ascii')}
+        for i, record in enumerate(records)
+    ]}
+
+class TestBuildItems(unittest.TestCase):
+
+    def test_v1_item_per_recipient(self):
+        items = message_schema.build_items('U1', 'John', {'alice': 2, 'bob': 1}, 'alice++ alice++ bob++', 1000, version=1)
+        self.assertEqual([item['time_to_username']['S'] for item in items], ['1000#alice', '1000#bob'])
+        self.assertTrue(all(item['message']['S'] == 'alice++ alice++ bob++' for item in items))
+
+    def test_v2_message_item_and_recipient_items(self):
+        items = message_schema.build_items('U1', 'John', {'alice': 2, 'bob': 1}, 'alice++ alice++ bob++', 1000, version=2)
+
+        message_item, *recipient_items = items
+        self.assertEqual(message_item['time_to_username'], {'S': '1000'})
+        self.assertEqual(message_item['recipients'], {'M': {'alice': {'N': '2'}, 'bob': {'N': '1'}}})
+        self.assertEqual(message_item['from_username'], {'S': 'John'})
+        self.assertTrue(message_schema.is_message_item(message_item))
+        self.assertEqual(recipient_items[0], {
+            'username': {'S': 'U1'},
+            'time_to_username': {'S': '1000#alice'},
+            'to_username': {'S': 'alice'},
+            'incr_num': {'N': '2'}
+        })
+        self.assertTrue(all(message_schema.is_recipient_item(item) for item in recipient_items))
+
+    def test_long_text_is_compressed(self):
+        text = 'alice++ thanks for the review! ' * 100
+        attribute = message_schema.encode_text(text, threshold=1024)
+        self.assertIn('message_z', attribute)
+        self.assertLess(len(attribute['message_z']['B']), 1024)
+        self.assertEqual(message_schema.decode_text(attribute), text)
+        # as found in a change record
+        encoded = {'message_z': {'B': base64.b64encode(attribute['message_z']['B']).decode('ascii')}}
+        self.assertEqual(message_schema.decode_text(encoded), text)
+
+        self.assertEqual(message_schema.encode_text('alice++', threshold=1024), {'message': {'S': 'alice++'}})
+        self.assertIn('message', message_schema.encode_text(text, threshold=0))
+
+    def test_expand_gives_v1_items(self):
+        v1 = message_schema.build_items('U1', 'John', {'alice': 2, 'bob': 1}, 'alice++ alice++ bob++', 1000, version=1)
+        message_item, *recipient_items = message_schema.build_items(
+            'U1', 'John', {'alice': 2, 'bob': 1}, 'alice++ alice++ bob++', 1000, version=2)
+
+        self.assertEqual(message_schema.expand(message_item), v1)
+        self.assertEqual(message_schema.expand(recipient_items[0]), [])
+        self.assertEqual(message_schema.expand(v1[0]), [v1[0]])
+
+class TestHandlerV2(unittest.TestCase):
+
+    @patch('lambda_function.message_schema.MESSAGES_SCHEMA_VERSION', 2)
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb')
+    def test_put_item_to_messages(self, mock_dynamodb, mock_get_slack_username):
+        mock_dynamodb.put_item.return_value = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+        response = put_item_to_messages("U1", {'alice': 2, 'bob': 1}, "alice++ alice++ bob++")
+
+        self.assertTrue(response['ok'])
+        items = [call.kwargs['Item'] for call in mock_dynamodb.put_item.call_args_list]
+        self.assertEqual(len(items), 3)
+        self.assertEqual(sum('message' in item for item in items), 1)
+
+    @patch('lambda_function.message_schema.MESSAGES_SCHEMA_VERSION', 2)
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb_batch.batch_write_items')
+    @patch('lambda_function.handler.dynamodb')
+    def test_unprocessed_message_item_fails_every_recipient(self, mock_dynamodb, mock_batch, mock_get_slack_username):
+        def unprocess_message_item(client, table_name, items):
+            return {'ok': False, 'unprocessed': items[:1]}
+        mock_batch.side_effect = unprocess_message_item
+
+        response = batch_put_item_to_messages("U1", {'alice': 2, 'bob': 1}, "alice++ alice++ bob++")
+
+        self.assertEqual(response, {'ok': False, 'unprocessed': ['alice', 'bob']})
+
+    @patch('lambda_function.message_schema.MESSAGES_SCHEMA_VERSION', 2)
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb_batch.transact_write_items')
+    @patch('lambda_function.handler.dynamodb')
+    def test_transact_message_is_one_transaction(self, mock_dynamodb, mock_transact, mock_get_slack_username):
+        mock_transact.return_value = {'ok': True, 'failed': [], 'errors': [], 'calls': 1}
+        mock_dynamodb.batch_get_item.return_value = {
+            'Responses': {'UserCounts': [
+                {'username': {'S': 'alice'}, 'total_num': {'N': '5'}},
+                {'username': {'S': 'bob'}, 'total_num': {'N': '3'}}
+            ]}
+        }
+
+        response = transact_save_data("U1", {'alice': 2, 'bob': 1}, "alice++ alice++ bob++")
+
+        self.assertTrue(response['ok'])
+        actions = mock_transact.call_args.args[1]
+        self.assertEqual(len(actions), 5)
+        self.assertEqual(mock_transact.call_args.kwargs['group_size'], 5)
+        self.assertIn('recipients', actions[0]['Put']['Item'])
+        self.assertEqual(actions[2]['Update']['Key'], {'username': {'S': 'alice'}})
+
+    @patch('lambda_function.message_schema.MESSAGES_SCHEMA_VERSION', 2)
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb_batch.transact_write_items')
+    @patch('lambda_function.handler.dynamodb')
+    def test_transact_too_many_recipients_uses_v1(self, mock_dynamodb, mock_transact, mock_get_slack_username):
+        mock_transact.return_value = {'ok': True, 'failed': [], 'errors': [], 'calls': 2}
+        mock_dynamodb.batch_get_item.return_value = {'Responses': {'UserCounts': []}}
+        user_map = {f"user{i}": 1 for i in range(60)}
+
+        transact_save_data("U1", user_map, "++")
+
+        actions = mock_transact.call_args.args[1]
+        self.assertEqual(len(actions), 120)
+        self.assertEqual(mock_transact.call_args.kwargs['group_size'], 2)
+
+class TestFirehoseV2(unittest.TestCase):
+
+    def setUp(self):
+        self.items = message_schema.build_items(
+            'U1', 'John', {'alice': 2, 'bob': 1}, 'alice++ alice++ bob++ ' * 100, 1000, version=2)
+
+    @patch('lambda_function_firehose.handler.OUTPUT_FORMAT', 'json')
+    def test_message_item_is_expanded_and_recipient_items_dropped(self):
+        # longer than MESSAGE_COMPRESS_THRESHOLD
+        self.assertIn('message_z', self.items[0])
+
+        response = firehose_handler(firehose_event(*[change_record(item) for item in self.items]), {})
+
+        records = response['records']
+        self.assertEqual([record['result'] for record in records], ['Ok', 'Dropped', 'Dropped'])
+        lines = base64.b64decode(records[0]['data']).decode('utf-8').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['to_username'] for row in rows], ['alice', 'bob'])
+        self.assertEqual([row['incr_num'] for row in rows], ['2', '1'])
+        self.assertEqual(rows[1]['time_to_username'], '1000#bob')
+        self.assertEqual(rows[1]['message'], 'alice++ alice++ bob++ ' * 100)
+        self.assertEqual(rows[1]['from_username'], 'John')
+
+    @patch('lambda_function_firehose.handler.OUTPUT_FORMAT', 'parquet')
+    def test_parquet_rows_are_typed(self):
+        response = firehose_handler(firehose_event(change_record(self.items[0])), {})
+
+        lines = base64.b64decode(response['records'][0]['data']).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['incr_num'] for line in lines], [2, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+import boto3
+from botocore.stub import Stubber
+from lambda_function import metrics
+from lambda_function.handler import lambda_handler
+
+def emf_lines(output):
+    return [json.loads(line) for line in output.getvalue().splitlines() if line.startswith('{"_aws"')]
+
+class TestRecorder(unittest.TestCase):
+
+    def test_emf_document(self):
+        recorder = metrics.Recorder('lambda_handler', cold_start=True)
+        recorder.add_duration('parse', 0.002)
+        recorder.add_duration('parse', 0.001)
+        recorder.count('DynamoDBCalls', 3)
+
+        document = recorder.to_emf(timestamp_ms=1)
+
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(document['_aws']['Timestamp'], 1)
+        self.assertEqual(directive['Namespace'], metrics.METRICS_NAMESPACE)
+        self.assertEqual(directive['Dimensions'], metrics.DIMENSION_SETS)
+        units = {definition['Name']: definition['Unit'] for definition in directive['Metrics']}
+        self.assertEqual(units, {'parse': 'Milliseconds', 'total': 'Milliseconds', 'DynamoDBCalls': 'Count'})
+        self.assertAlmostEqual(document['parse'], 3.0)
+        self.assertEqual(document['DynamoDBCalls'], 3)
+        self.assertEqual(document['ColdStart'], 'true')
+        self.assertEqual(document['Handler'], 'lambda_handler')
+        # every dimension of the dimension sets has a value
+        for dimension_set in directive['Dimensions']:
+            for dimension in dimension_set:
+                self.assertIsInstance(document[dimension], str)
+
+    def test_recipient_buckets(self):
+        metrics.start('lambda_handler')
+        metrics.set_recipient_count(2)
+        self.assertEqual(metrics._current.dimensions['RecipientCount'], '2')
+        metrics.set_recipient_count(12)
+        self.assertEqual(metrics._current.dimensions['RecipientCount'], '5+')
+        metrics._current = None
+
+    def test_nothing_recorded_outside_invocation(self):
+        metrics.count('DynamoDBCalls')
+        with metrics.stage('parse'):
+            pass
+        output = io.StringIO()
+        with redirect_stdout(output):
+            metrics.flush()
+        self.assertEqual(output.getvalue(), '')
+
+    def test_aws_calls_counted(self):
+        client = boto3.client('dynamodb', region_name='ap-northeast-1',
+                              aws_access_key_id='x', aws_secret_access_key='y')
+        client.meta.events.register('after-call.dynamodb', metrics.count_aws_calls('DynamoDB'))
+        metrics.start('lambda_handler')
+        with Stubber(client) as stubber:
+            stubber.add_response('get_item', {'ResponseMetadata': {'RetryAttempts': 2}})
+            client.get_item(TableName='UserCounts', Key={'username': {'S': 'alice'}})
+
+        recorder, metrics._current = metrics._current, None
+        self.assertEqual(recorder.counters, {'DynamoDBCalls': 1, 'DynamoDBRetries': 2})
+
+class TestLambdaHandlerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.event = {
+            'body': '{"event": {"type": "message", "text": "alice++ bob++", "user": "some_user", "channel": "some_channel"}}'
+        }
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb', return_value={"alice": 2, "bob": 1})
+    @patch('lambda_function.handler.post_message', return_value={'ok': True})
+    def test_one_line_per_invocation(self, mock_post, mock_save, mock_verify):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            lambda_handler(self.event, {})
+            lambda_handler(self.event, {})
+
+        lines = emf_lines(output)
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['RecipientCount'], '2')
+        self.assertEqual(lines[0]['Handler'], 'lambda_handler')
+        self.assertEqual(lines[1]['ColdStart'], 'false')
+        self.assertIn('parse', lines[1])
+        self.assertGreaterEqual(lines[1]['total'], lines[1]['parse'])
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb', side_effect=RuntimeError('throttled'))
+    def test_errors_counted(self, mock_save, mock_verify):
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(RuntimeError):
+            lambda_handler(self.event, {})
+
+        self.assertEqual(emf_lines(output)[0]['Errors'], 1)
+
+    @patch('lambda_function.handler.warm_up', return_value={})
+    def test_warm_up_writes_nothing(self, mock_warm_up):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            lambda_handler({'warmup': True}, {})
+        self.assertEqual(emf_lines(output), [])
+
+if __name__ == '__main__':
+    unittest.main()
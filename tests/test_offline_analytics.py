@@ -0,0 +1,113 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from analytics import offline
+from lambda_function_firehose.handler import partition_bucket
+
+# 2023-09-03 14:05 UTC
+START = 1693749900000
+HOUR = 3600 * 1000
+
+def row(to_username, from_username='John', incr_num='1', created=START):
+    return {
+        'eventID': 'some_id',
+        'eventName': 'INSERT',
+        'ApproximateCreationDateTime': created,
+        'to_username': to_username,
+        'from_username': from_username,
+        'message': f"{to_username}++",
+        'username': 'U1',
+        'incr_num': incr_num,
+        'time_to_username': f"{created}#{to_username}"
+    }
+
+class TestOfflineAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.write('year=2023/month=09/day=03/hour=14/a', [row('alice'), row('bob', incr_num='2'), row('alice', 'Jane')])
+        self.write('year=2023/month=09/day=03/hour=15/b.gz', [row('alice', created=START + HOUR)], compress=True)
+        self.write('year=2023/month=09/day=04/hour=00/c', [row('bob', created=START + 10 * HOUR)])
+        self.write('year=2023/month=08/day=31/hour=23/d', [row('carol', created=START - 3 * 24 * HOUR)])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, rows, compress=False):
+        path = os.path.join(self.root, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = b''.join(json.dumps(data).encode('utf-8') + b'\n' for data in rows)
+        with open(path, 'wb') as f:
+            f.write(gzip.compress(data) if compress else data)
+
+    def files(self, **kwargs):
+        return [os.path.relpath(path, self.root) for path, _ in offline.iter_files(self.root, **kwargs)]
+
+    def test_partitions_outside_the_period_are_pruned(self):
+        self.assertEqual(len(self.files()), 4)
+        files = self.files(since=offline.parse_time('2023-09-03T15'), until=offline.parse_time('2023-09-04'))
+        self.assertEqual(files, [os.path.join('year=2023', 'month=09', 'day=03', 'hour=15', 'b.gz')])
+        self.assertEqual(len(self.files(since=offline.parse_time('2023-09-01'))), 3)
+
+    def test_rankings(self):
+        summary = offline.analyze(self.root, since=offline.parse_time('2023-09-01'), pairs=True, series='hour')
+        result = offline.report(summary, top=2, pairs=True)
+
+        self.assertEqual(result['top'], [
+            {'to_username': 'alice', 'total_incr_num': 3},
+            {'to_username': 'bob', 'total_incr_num': 3}
+        ])
+        self.assertEqual(result['pairs'], [
+            {'from_username': 'John', 'to_username': 'bob', 'total_incr_num': 3},
+            {'from_username': 'John', 'to_username': 'alice', 'total_incr_num': 2}
+        ])
+        self.assertEqual(result['series'], [
+            {'period': '2023-09-03T14', 'total_incr_num': 4},
+            {'period': '2023-09-03T15', 'total_incr_num': 1},
+            {'period': '2023-09-04T00', 'total_incr_num': 1}
+        ])
+        self.assertEqual(result['stats'], {'files': 3, 'rows': 5, 'counted': 5})
+
+    def test_invalid_lines_are_counted(self):
+        with open(os.path.join(self.root, 'year=2023', 'month=09', 'day=03', 'hour=14', 'a'), 'ab') as f:
+            f.write(b'{not json\n{"to_username": "alice"}\n')
+
+        summary = offline.analyze(self.root, user='alice')
+
+        self.assertEqual(summary['stats']['invalid'], 2)
+        self.assertEqual(summary['totals'], {'alice': 3})
+
+    def test_process_pool_gives_the_same_result(self):
+        expected = offline.analyze(self.root, series='day')
+        self.assertEqual(offline.analyze(self.root, series='day', workers=2), expected)
+
+    def test_buckets_of_other_users_are_pruned(self):
+        alice = partition_bucket('alice', 4)
+        other = next(bucket for bucket in ('0', '1', '2', '3') if bucket != alice)
+        self.write(f"year=2023/month=10/day=01/hour=00/bucket={alice}/e", [row('alice', created=START + 28 * 24 * HOUR)])
+        self.write(f"year=2023/month=10/day=01/hour=00/bucket={other}/f", [row('dave', created=START + 28 * 24 * HOUR)])
+        self.write("year=2023/month=10/day=01/hour=00/bucket=mixed/g", [row('alice', created=START + 28 * 24 * HOUR)])
+
+        summary = offline.analyze(self.root, since=offline.parse_time('2023-10-01'), user='alice', buckets=4)
+
+        self.assertEqual(summary['stats']['files'], 2)
+        self.assertEqual(summary['totals'], {'alice': 2})
+
+    def test_main_prints_json(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            offline.main([self.root, '--until', '2023-09-01', '--workers', '0', '--json'])
+
+        self.assertEqual(json.loads(output.getvalue())['top'], [{'to_username': 'carol', 'total_incr_num': 1}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+from lambda_function import metrics, outbox, slack_client
+from lambda_function.handler import post_message
+
+def rate_limited(retry_after='3'):
+    response = SlackResponse(client=None, http_verb='POST', api_url='https://slack.com/api/chat.postMessage',
+                             req_args={}, data={'ok': False, 'error': 'ratelimited'},
+                             headers={'retry-after': retry_after}, status_code=429)
+    return SlackApiError('ratelimited', response)
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.outbox = outbox.Outbox(rate=1, burst=2, max_wait=5, max_pending=3, clock=self.clock, sleep=self.clock.sleep)
+        self.sent = []
+        self.recorder = metrics.start('sqs_handler')
+
+    def tearDown(self):
+        metrics._current = None
+
+    def send(self, channel_id, text, username):
+        self.sent.append((self.clock.now, channel_id, text))
+        return {'ok': True}
+
+    def test_channel_rate_and_burst(self):
+        for i in range(3):
+            self.outbox.enqueue('C1', text=f"post {i}")
+        post = self.outbox.enqueue('C2', text="other channel")
+
+        self.outbox.flush(self.send)
+
+        self.assertEqual([(now, channel) for now, channel, _ in self.sent],
+                         [(0.0, 'C1'), (0.0, 'C1'), (0.0, 'C2'), (1.0, 'C1')])
+        self.assertEqual(post['response'], {'ok': True})
+        self.assertEqual(self.recorder.counters['SlackPostsQueued'], 4)
+
+    def test_pending_scores_are_merged(self):
+        first = self.outbox.enqueue('C1', scores={'alice': 1, 'bob': 1})
+        second = self.outbox.enqueue('C1', scores={'alice': 2})
+        self.outbox.enqueue('C2', scores={'alice': 3})
+
+        self.outbox.flush(self.send)
+
+        self.assertIs(first, second)
+        self.assertEqual([text for _, _, text in self.sent], ["alice: 2\nbob: 1\n", "alice: 3\n"])
+        self.assertEqual(self.recorder.counters['SlackPostsMerged'], 1)
+
+    def test_retry_after_pauses_the_channel(self):
+        calls = []
+        def send(channel_id, text, username):
+            calls.append((self.clock.now, text))
+            if len(calls) == 1:
+                # the scores queued while the channel waits are sent with the first ones
+                self.outbox.enqueue('C1', scores={'bob': 5})
+                raise rate_limited('3')
+            return {'ok': True}
+        post = self.outbox.enqueue('C1', scores={'alice': 4})
+
+        self.outbox.flush(send)
+
+        self.assertEqual(calls, [(0.0, "alice: 4\n"), (3.0, "alice: 4\nbob: 5\n")])
+        self.assertEqual(outbox.response_of(post), {'ok': True})
+        self.assertEqual(self.recorder.counters['SlackPostsThrottled'], 1)
+
+    def test_posts_are_dropped_after_max_wait(self):
+        self.outbox.max_wait = 0.5
+        posts = [self.outbox.enqueue('C1', text=f"post {i}") for i in range(4)]
+
+        self.outbox.flush(self.send)
+
+        # the oldest post was dropped from the full queue, the last one as the
+        # channel has no token for another second
+        self.assertEqual([text for _, _, text in self.sent], ["post 1", "post 2"])
+        self.assertEqual(posts[0]['response'], outbox.DROPPED_RESPONSE)
+        self.assertEqual(posts[3]['response'], outbox.DROPPED_RESPONSE)
+        self.assertEqual(self.recorder.counters['SlackPostsDropped'], 2)
+        self.assertEqual(self.outbox.pending, {})
+
+    def test_max_wait_of_one_flush(self):
+        posts = [self.outbox.enqueue('C1', text=f"post {i}") for i in range(3)]
+
+        # e.g. while Slack waits for the response to the request
+        self.outbox.flush(self.send, max_wait=0.5)
+
+        self.assertEqual([text for _, _, text in self.sent], ["post 0", "post 1"])
+        self.assertEqual(posts[2]['response'], outbox.DROPPED_RESPONSE)
+
+    def test_api_errors_are_returned(self):
+        def send(channel_id, text, username):
+            raise SlackApiError('channel_not_found', {'ok': False, 'error': 'channel_not_found'})
+        post = self.outbox.enqueue('C1', text="hello")
+
+        self.outbox.flush(send)
+
+        self.assertEqual(post['response'], {'ok': False, 'error': 'channel_not_found'})
+
+    def test_connection_error_drops_the_pending_posts(self):
+        def send(channel_id, text, username):
+            raise ConnectionError()
+        self.outbox.enqueue('C1', text="first")
+        other = self.outbox.enqueue('C2', text="other channel")
+
+        with self.assertRaises(ConnectionError):
+            self.outbox.flush(send)
+
+        # not sent later by another invocation
+        self.assertEqual(self.outbox.pending, {})
+        self.assertEqual(other['response'], outbox.DROPPED_RESPONSE)
+        self.assertEqual(self.recorder.counters['SlackPostsDropped'], 1)
+
+    def test_retry_after(self):
+        self.assertEqual(outbox.retry_after(rate_limited('7')), 7.0)
+        self.assertEqual(outbox.retry_after(rate_limited('soon')), outbox.DEFAULT_RETRY_AFTER)
+        self.assertIsNone(outbox.retry_after(SlackApiError('error', {'ok': False})))
+        self.assertIsNone(outbox.retry_after(ConnectionError()))
+
+class TestPostMessage(unittest.TestCase):
+
+    def setUp(self):
+        outbox.reset_outbox()
+
+    def tearDown(self):
+        outbox.reset_outbox()
+        slack_client.reset_client()
+
+    def test_post_message_waits_for_retry_after(self):
+        clock = FakeClock()
+        outbox._outbox = outbox.Outbox(clock=clock, sleep=clock.sleep)
+        mock_client = MagicMock()
+        mock_client.chat_postMessage.side_effect = [rate_limited('1'), {'ok': True}]
+        slack_client.set_client(mock_client)
+
+        response = post_message('C1', 'alice: 1\n')
+
+        self.assertEqual(response, {'ok': True})
+        self.assertEqual(mock_client.chat_postMessage.call_count, 2)
+        self.assertEqual(clock.sleeps, [1.0])
+
+    def test_scores_are_merged_with_the_pending_post(self):
+        # e.g. queued by a concurrent invocation waiting for the channel
+        pending = outbox.get_outbox().enqueue('C1', scores={'alice': 1, 'bob': 2})
+        mock_client = MagicMock()
+        mock_client.chat_postMessage.return_value = {'ok': True}
+        slack_client.set_client(mock_client)
+
+        response = post_message('C1', scores={'alice': 3})
+
+        self.assertEqual(response, {'ok': True})
+        self.assertEqual(outbox.response_of(pending), {'ok': True})
+        mock_client.chat_postMessage.assert_called_once_with(channel='C1', text="alice: 3\nbob: 2\n", username="++Bot")
+
+if __name__ == '__main__':
+    unittest.main()
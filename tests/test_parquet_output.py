@@ -0,0 +1,151 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import base64
+import datetime
+import json
+import re
+import tempfile
+from unittest.mock import patch
+from lambda_function_firehose.handler import lambda_handler, PARQUET_COLUMNS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Types of the Python values that Firehose reads into each Glue column type.
+# timestamp columns are read from epoch milliseconds ("millis" timestamp format).
+PYTHON_TYPES = {
+    'string': str,
+    'int': int,
+    'timestamp': int,
+}
+
+
+# Glue table whose schema Firehose converts the records with
+MAIN_TF = os.path.join(os.path.dirname(__file__), '..', 'tf-assets', 'main.tf')
+
+
+def glue_columns(table):
+    """
+    Returns:
+        dict: {name (str): type (str)} of the columns of an aws_glue_catalog_table in main.tf
+    """
+    with open(MAIN_TF) as f:
+        tf = f.read()
+    start = tf.index(f'resource "aws_glue_catalog_table" "{table}"')
+    end = tf.find('\nresource ', start + 1)
+    block = tf[start:end if end != -1 else len(tf)]
+    return dict(re.findall(r'columns\s*{\s*name\s*=\s*"([^"]+)"\s*type\s*=\s*"([^"]+)"', block))
+
+
+def encode(record):
+    return base64.b64encode(json.dumps(record).encode('utf-8')).decode('utf-8')
+
+
+def decode_lines(response):
+    return [json.loads(base64.b64decode(record['data'])) for record in response['records']]
+
+
+def write_parquet(rows, path, compression='snappy'):
+    """
+    Convert the transformed records like Firehose record format conversion does.
+    """
+    arrow_types = {
+        'string': pyarrow.string(),
+        'int': pyarrow.int32(),
+        'timestamp': pyarrow.timestamp('ms'),
+    }
+    schema = pyarrow.schema([(name, arrow_types[type_]) for name, type_ in PARQUET_COLUMNS.items()])
+    columns = {name: [row[name] for row in rows] for name in PARQUET_COLUMNS}
+    pyarrow.parquet.write_table(pyarrow.table(columns, schema=schema), path, compression=compression)
+
+
+class TestParquetOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.created_at = 1700000000123
+        self.record_data = {
+            "eventID": "some_id",
+            "eventName": "INSERT",
+            "dynamodb": {
+                "ApproximateCreationDateTime": self.created_at,
+                "NewImage": {
+                    "to_username": {"S": "to_user"},
+                    "from_username": {"S": "from_user"},
+                    "message": {"S": "to_user++ to_user++"},
+                    "username": {"S": "U123"},
+                    "incr_num": {"N": "2"},
+                    "time_to_username": {"S": "1700000000.000100#to_user"}
+                }
+            }
+        }
+        self.event = {
+            'records': [
+                {'recordId': 'rec1', 'data': encode(self.record_data)},
+                {'recordId': 'rec2', 'data': encode(self.record_data)},
+            ]
+        }
+
+    @patch('lambda_function_firehose.handler.OUTPUT_FORMAT', 'json')
+    def test_json_output_keeps_change_record_values(self):
+        rows = decode_lines(lambda_handler(self.event, {}))
+        self.assertEqual(rows[0]['incr_num'], '2')
+
+    @patch('lambda_function_firehose.handler.OUTPUT_FORMAT', 'parquet')
+    def test_parquet_output_matches_schema(self):
+        rows = decode_lines(lambda_handler(self.event, {}))
+        self.assertEqual(len(rows), 2)
+        for row in rows:
+            self.assertEqual(set(row), set(PARQUET_COLUMNS))
+            for name, type_ in PARQUET_COLUMNS.items():
+                self.assertIsInstance(row[name], PYTHON_TYPES[type_], name)
+        self.assertEqual(rows[0]['incr_num'], 2)
+        self.assertEqual(rows[0]['ApproximateCreationDateTime'], self.created_at)
+
+    def test_schema_is_the_glue_table(self):
+        self.assertEqual(glue_columns('messages_parquet'), PARQUET_COLUMNS)
+
+    @patch('lambda_function_firehose.handler.OUTPUT_FORMAT', 'parquet')
+    def test_parquet_output_matches_glue_table(self):
+        columns = glue_columns('messages_parquet')
+
+        for row in decode_lines(lambda_handler(self.event, {})):
+            self.assertEqual(set(row), set(columns))
+            for name, type_ in columns.items():
+                self.assertIsInstance(row[name], PYTHON_TYPES[type_], name)
+            # a Glue int is 32 bits
+            self.assertLess(abs(row['incr_num']), 2**31)
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    @patch('lambda_function_firehose.handler.OUTPUT_FORMAT', 'parquet')
+    def test_parquet_round_trip(self):
+        rows = decode_lines(lambda_handler(self.event, {}))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'part-0000.parquet')
+            write_parquet(rows, path)
+
+            metadata = pyarrow.parquet.ParquetFile(path).metadata
+            self.assertEqual(metadata.row_group(0).column(0).compression, 'SNAPPY')
+
+            table = pyarrow.parquet.read_table(path)
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.schema.field('incr_num').type, pyarrow.int32())
+        self.assertEqual(table.schema.field('ApproximateCreationDateTime').type, pyarrow.timestamp('ms'))
+        self.assertEqual(table.schema.field('to_username').type, pyarrow.string())
+
+        row = table.to_pylist()[0]
+        self.assertEqual(row['incr_num'], 2)
+        self.assertEqual(row['to_username'], 'to_user')
+        self.assertEqual(row['ApproximateCreationDateTime'],
+                         datetime.datetime(2023, 11, 14, 22, 13, 20, 123000))
+
+
+if __name__ == '__main__':
+    unittest.main()
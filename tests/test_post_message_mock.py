@@ -4,27 +4,30 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import MagicMock
+from lambda_function import outbox, slack_client
 from lambda_function.handler import post_message
 from slack_sdk.errors import SlackApiError
 
 class TestPostMessageMock(unittest.TestCase):
+
+    def tearDown(self):
+        outbox.reset_outbox()
+        slack_client.reset_client()
     
-    @patch('lambda_function.handler.WebClient')
-    def test_post_message_success(self, MockWebClient):
+    def test_post_message_success(self):
         # Mocking successful response from chat_postMessage method
         mock_response = {"ok": True}
         mock_client = MagicMock()
         mock_client.chat_postMessage.return_value = mock_response
-        MockWebClient.return_value = mock_client
+        slack_client.set_client(mock_client)
 
         response = post_message('test_channel', 'test_text')
         
         self.assertEqual(response, mock_response)
         mock_client.chat_postMessage.assert_called_once()
 
-    @patch('lambda_function.handler.WebClient')
-    def test_post_message_error(self, MockWebClient):
+    def test_post_message_error(self):
         # Mocking error from chat_postMessage method
         mock_error_response = {"ok": False, "error": "some_error"}
         mock_client = MagicMock()
@@ -32,7 +35,7 @@ class TestPostMessageMock(unittest.TestCase):
             message="Error message",
             response=mock_error_response
         )
-        MockWebClient.return_value = mock_client
+        slack_client.set_client(mock_client)
 
         response = post_message('test_channel', 'test_text')
 
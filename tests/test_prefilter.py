@@ -0,0 +1,75 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import unittest
+from unittest.mock import patch
+from lambda_function import prefilter
+from lambda_function.handler import lambda_handler
+
+def message(**fields):
+    event = {"type": "message", "text": "alice++", "user": "U1", "channel": "C1", "ts": "1693751100.000100"}
+    event.update(fields)
+    return {"type": "event_callback", "event_id": "Ev1", "event": event}
+
+class TestPrefilter(unittest.TestCase):
+
+    def test_is_stale(self):
+        self.assertFalse(prefilter.is_stale({'x-slack-request-timestamp': '1000'}, now=1000 + prefilter.MAX_REQUEST_AGE))
+        self.assertTrue(prefilter.is_stale({'x-slack-request-timestamp': '1000'}, now=1001 + prefilter.MAX_REQUEST_AGE))
+        # left to verify_request
+        self.assertFalse(prefilter.is_stale({}, now=1000))
+        self.assertFalse(prefilter.is_stale(None, now=1000))
+        self.assertFalse(prefilter.is_stale({'x-slack-request-timestamp': 'abc'}, now=1000))
+
+    def test_skip_reason(self):
+        self.assertIsNone(prefilter.skip_reason(message()))
+        self.assertIsNone(prefilter.skip_reason(message(text="++top 5")))
+        self.assertIsNone(prefilter.skip_reason(message(subtype="thread_broadcast")))
+        self.assertEqual(prefilter.skip_reason({"type": "url_verification", "challenge": "abc"}), 'NoEvent')
+        self.assertEqual(prefilter.skip_reason(message(type="reaction_added")), 'EventType')
+        self.assertEqual(prefilter.skip_reason(message(subtype="message_changed")), 'Subtype')
+        self.assertEqual(prefilter.skip_reason(message(subtype="channel_join")), 'Subtype')
+        self.assertEqual(prefilter.skip_reason(message(subtype="bot_message")), 'Subtype')
+        self.assertEqual(prefilter.skip_reason(message(bot_id="B1")), 'Bot')
+        self.assertEqual(prefilter.skip_reason(message(text="see you tomorrow, c++ rocks")), None)
+        self.assertEqual(prefilter.skip_reason(message(text="see you tomorrow")), 'NoIncrement')
+        self.assertEqual(prefilter.skip_reason(message(text=None)), 'NoIncrement')
+
+    @patch('lambda_function.prefilter.IGNORED_USER_IDS', frozenset({'UBOT'}))
+    def test_ignored_user(self):
+        self.assertEqual(prefilter.skip_reason(message(user="UBOT")), 'Bot')
+
+class TestLambdaHandlerPrefilter(unittest.TestCase):
+
+    @patch('lambda_function.handler.verify_request')
+    def test_stale_request_is_not_verified(self, mock_verify):
+        event = {
+            'headers': {'x-slack-request-timestamp': '1000', 'x-slack-signature': 'v0=abc'},
+            'body': json.dumps(message())
+        }
+        self.assertIsNone(lambda_handler(event, {}))
+        mock_verify.assert_not_called()
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.json.loads')
+    def test_body_without_marker_is_not_decoded(self, mock_loads, mock_verify):
+        event = {'body': json.dumps(message(text="good morning"))}
+        self.assertEqual(lambda_handler(event, {}), {'statusCode': 200})
+        mock_loads.assert_not_called()
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.save_data_to_dynamodb')
+    @patch('lambda_function.handler.post_message')
+    def test_non_actionable_events_are_skipped(self, mock_post, mock_save, mock_verify):
+        edited = message(subtype="message_changed", message={"text": "alice++"})
+        del edited['event']['text']
+        for body in (edited, message(bot_id="B1", text="alice: 3\n++")):
+            self.assertEqual(lambda_handler({'body': json.dumps(body)}, {}), {'statusCode': 200})
+        mock_save.assert_not_called()
+        mock_post.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import unittest
+from collections import Counter
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+from fakes import FakeDynamoDB
+from lambda_function import message_schema, sharded_counter
+from tools import reconcile_user_counts as reconcile
+
+# 2023-09-03 14:05 UTC
+START = 1693749900000
+
+def user_count(username, total):
+    return {'username': {'S': username}, 'total_num': {'N': str(total)}, 'board': {'S': 'all'}}
+
+class TestReconcile(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeDynamoDB()
+        messages = [
+            ({'alice': 2}, 1),
+            ({'alice': 1, 'bob': 3}, 2),
+            ({'carol': 1}, 1),
+            ({'dave': 4}, 2),
+        ]
+        for i, (user_map, version) in enumerate(messages):
+            for item in message_schema.build_items(f"U{i}", f"sender{i}", user_map, '++', START + i, version=version):
+                self.client.put_item(TableName='Messages', Item=item)
+
+        # alice is right, bob was counted twice, carol was never counted,
+        # dave is sharded and is missing 1 on his shards, erin has no message
+        for item in (user_count('alice', 3), user_count('bob', 6), user_count('erin', 2),
+                     {**user_count('dave', 1), 'shard_count': {'N': '4'}},
+                     {'username': {'S': 'dave#shard-0'}, 'total_num': {'N': '1'}},
+                     {'username': {'S': 'dave#shard-3'}, 'total_num': {'N': '1'}},
+                     {'username': {'S': sharded_counter.REGISTRY_KEY}, 'usernames': {'SS': ['dave']}}):
+            self.client.put_item(TableName='UserCounts', Item=item)
+
+    def test_dry_run_reports_the_differences(self):
+        report = reconcile.reconcile(self.client, total_segments=4)
+
+        self.assertEqual(report['users'], 5)
+        self.assertEqual(report['corrections'], [
+            {'username': 'bob', 'expected': 3, 'actual': 6, 'delta': -3},
+            {'username': 'erin', 'expected': 0, 'actual': 2, 'delta': -2},
+            {'username': 'carol', 'expected': 1, 'actual': 0, 'delta': 1},
+            {'username': 'dave', 'expected': 4, 'actual': 3, 'delta': 1},
+        ])
+        self.assertEqual(report['total_delta'], -3)
+        self.assertNotIn('result', report)
+        self.assertEqual(self.client.calls['TransactWriteItems'], 0)
+        # every segment of both tables is read
+        self.assertGreaterEqual(self.client.calls['Scan'], 8)
+
+    def test_apply_repairs_the_totals(self):
+        report = reconcile.reconcile(self.client, total_segments=4, apply=True, writes_per_second=0)
+
+        self.assertEqual(report['result'], {'ok': True, 'applied': 4, 'failed': [], 'calls': 1})
+        counters = sharded_counter.ShardedCounters()
+        self.assertEqual(counters.read_totals(self.client, ['alice', 'bob', 'carol', 'dave', 'erin']),
+                         {'alice': 3, 'bob': 3, 'carol': 1, 'dave': 4, 'erin': 0})
+        self.assertEqual(reconcile.reconcile(self.client, total_segments=3)['corrections'], [])
+
+    @patch('tools.reconcile_user_counts.SCAN_PAGE_SIZE', 1)
+    def test_scan_pages_are_followed(self):
+        totals = reconcile.parallel_sum(reconcile.sum_messages, self.client, 2)
+
+        self.assertEqual(totals, {'alice': 3, 'bob': 3, 'carol': 1, 'dave': 4})
+        # one page per item
+        self.assertEqual(self.client.calls['Scan'], 7)
+
+    def test_failed_chunk_is_reported(self):
+        error = ClientError({'Error': {'Code': 'ValidationException', 'Message': 'invalid'}}, 'TransactWriteItems')
+        corrections = reconcile.diff(Counter({'alice': 1, 'bob': 2}), Counter())
+
+        with patch.object(self.client, 'transact_write_items', side_effect=error):
+            result = reconcile.apply_corrections(self.client, corrections, reconcile.RateLimiter(0))
+
+        self.assertFalse(result['ok'])
+        self.assertEqual(result['failed'], ['bob', 'alice'])
+
+class TestBackfillBoard(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeDynamoDB()
+        for item in (user_count('alice', 3),
+                     {'username': {'S': 'bob'}, 'total_num': {'N': '2'}},
+                     {'username': {'S': 'carol'}, 'total_num': {'N': '1'}, 'shard_count': {'N': '4'}},
+                     {'username': {'S': 'carol#shard-1'}, 'total_num': {'N': '1'}},
+                     {'username': {'S': sharded_counter.REGISTRY_KEY}, 'usernames': {'SS': ['carol']}}):
+            self.client.put_item(TableName='UserCounts', Item=item)
+
+    def test_dry_run_lists_the_users_without_board(self):
+        report = reconcile.backfill_board(self.client, total_segments=3)
+
+        self.assertEqual(report['missing'], ['bob', 'carol'])
+        self.assertEqual(self.client.calls['UpdateItem'], 0)
+
+    def test_board_is_set_on_the_users_only(self):
+        report = reconcile.backfill_board(self.client, total_segments=3, apply=True, writes_per_second=0)
+
+        self.assertEqual((report['updated'], report['failed']), (2, []))
+        boards = {
+            item['username']['S']: item.get('board', {}).get('S')
+            for item in self.client.scan(TableName='UserCounts')['Items']
+        }
+        self.assertEqual(boards, {'alice': 'all', 'bob': 'all', 'carol': 'all', 'carol#shard-1': None,
+                                  sharded_counter.REGISTRY_KEY: None})
+        self.assertEqual(reconcile.backfill_board(self.client, total_segments=3)['missing'], [])
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_units_are_spread_at_the_rate(self):
+        now = [0.0]
+        sleeps = []
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+        limiter = reconcile.RateLimiter(100, clock=lambda: now[0], sleep=sleep)
+
+        for _ in range(3):
+            limiter.acquire(100)
+
+        self.assertEqual(sleeps, [1.0, 1.0])
+        self.assertEqual(now[0], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
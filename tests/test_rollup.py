@@ -0,0 +1,156 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from lambda_function_rollup.rollup import (
+    period_keys, aggregate, merge_top, InMemoryBackend, DynamoDBBackend, TOP_KEY
+)
+
+# 2023-09-03 14:25:00 UTC
+TIMESTAMP_MS = 1693751100000
+
+def conditional_check_failed():
+    return ClientError(
+        {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'version'}},
+        'PutItem'
+    )
+
+class FakeRollupTable:
+    """
+    Just enough of the DynamoDB client for DynamoDBBackend.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.put_failures = 0
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ReturnValues):
+        key = (Key['period']['S'], Key['username']['S'])
+        item = self.items.setdefault(key, {'period': Key['period'], 'username': Key['username'],
+                                           'total_num': {'N': '0'}})
+        total = int(item['total_num']['N']) + int(ExpressionAttributeValues[':incr']['N'])
+        item['total_num'] = {'N': str(total)}
+        if ':expires_at' in ExpressionAttributeValues:
+            item['expires_at'] = ExpressionAttributeValues[':expires_at']
+        return {'Attributes': {'total_num': item['total_num']}}
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get((Key['period']['S'], Key['username']['S']))
+        return {'Item': item} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression, ExpressionAttributeValues):
+        if self.put_failures:
+            self.put_failures -= 1
+            raise conditional_check_failed()
+        key = (Item['period']['S'], Item['username']['S'])
+        current = self.items.get(key)
+        if current and current['version'] != ExpressionAttributeValues[':version']:
+            raise conditional_check_failed()
+        self.items[key] = Item
+
+class TestPeriodKeys(unittest.TestCase):
+
+    def test_period_keys(self):
+        self.assertEqual(period_keys(TIMESTAMP_MS), {
+            'hour': 'hour#2023-09-03T14',
+            'day': 'day#2023-09-03',
+            'week': 'week#2023-W35',
+            'month': 'month#2023-09',
+        })
+
+    def test_iso_week_across_years(self):
+        # 2021-01-01 belongs to the 53rd week of 2020
+        self.assertEqual(period_keys(1609459200000)['week'], 'week#2020-W53')
+
+class TestAggregate(unittest.TestCase):
+
+    def test_sums_per_period_and_user(self):
+        increments = aggregate([
+            (TIMESTAMP_MS, 'alice', 2),
+            (TIMESTAMP_MS, 'bob', 1),
+            (TIMESTAMP_MS + 3600 * 1000, 'alice', 1),
+        ])
+        self.assertEqual(increments['day#2023-09-03'], {'alice': 3, 'bob': 1})
+        self.assertEqual(increments['hour#2023-09-03T14'], {'alice': 2, 'bob': 1})
+        self.assertEqual(increments['hour#2023-09-03T15'], {'alice': 1})
+        self.assertEqual(len(increments), 5)
+
+class TestMergeTop(unittest.TestCase):
+
+    def test_new_user_enters_and_last_leaves(self):
+        top = [('alice', 5), ('bob', 3)]
+        self.assertEqual(merge_top(top, {'carol': 4}, 2), [('alice', 5), ('carol', 4)])
+
+    def test_updated_user_moves_up(self):
+        top = [('alice', 5), ('bob', 3)]
+        self.assertEqual(merge_top(top, {'bob': 6}, 2), [('bob', 6), ('alice', 5)])
+
+    def test_stale_total_does_not_go_backwards(self):
+        top = merge_top([('alice', 5)], {'bob': 8}, 2)
+        # a late invocation with the total bob had before
+        self.assertEqual(merge_top(top, {'bob': 6}, 2), [('bob', 8), ('alice', 5)])
+
+    def test_ties_by_username(self):
+        self.assertEqual(merge_top([], {'bob': 1, 'alice': 1}, 5), [('alice', 1), ('bob', 1)])
+
+class TestInMemoryBackend(unittest.TestCase):
+
+    def test_top_matches_counters(self):
+        backend = InMemoryBackend(top_size=2)
+        backend.apply(aggregate([(TIMESTAMP_MS, 'alice', 1), (TIMESTAMP_MS, 'bob', 2)]))
+        backend.apply(aggregate([(TIMESTAMP_MS, 'carol', 1), (TIMESTAMP_MS, 'alice', 2)]))
+
+        self.assertEqual(backend.get_top('month#2023-09'), [('alice', 3), ('bob', 2)])
+        self.assertEqual(backend.get_top('month#2023-09', limit=1), [('alice', 3)])
+        self.assertEqual(backend.get_count('week#2023-W35', 'carol'), 1)
+        self.assertEqual(backend.get_top('month#2023-10'), [])
+
+class TestDynamoDBBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeRollupTable()
+        self.backend = DynamoDBBackend(self.table, 'Rollups', top_size=2)
+
+    def test_counters_and_top(self):
+        self.backend.apply(aggregate([(TIMESTAMP_MS, 'alice', 1), (TIMESTAMP_MS, 'bob', 2)]))
+        self.backend.apply(aggregate([(TIMESTAMP_MS, 'carol', 1), (TIMESTAMP_MS, 'alice', 2)]))
+
+        self.assertEqual(self.backend.get_top('day#2023-09-03'), [('alice', 3), ('bob', 2)])
+        self.assertEqual(self.backend.get_count('day#2023-09-03', 'carol'), 1)
+        self.assertEqual(self.table.items[('day#2023-09-03', TOP_KEY)]['version'], {'N': '2'})
+
+    def test_only_hourly_items_expire(self):
+        self.backend.apply(aggregate([(TIMESTAMP_MS, 'alice', 1)]))
+
+        self.assertIn('expires_at', self.table.items[('hour#2023-09-03T14', 'alice')])
+        self.assertIn('expires_at', self.table.items[('hour#2023-09-03T14', TOP_KEY)])
+        self.assertNotIn('expires_at', self.table.items[('day#2023-09-03', 'alice')])
+
+    @patch('lambda_function_rollup.rollup.time.sleep')
+    def test_top_retried_after_concurrent_write(self, sleep):
+        self.table.put_failures = 1
+        self.assertTrue(self.backend.update_top('day#2023-09-03', {'alice': 1}))
+        self.assertEqual(self.backend.get_top('day#2023-09-03'), [('alice', 1)])
+
+    @patch('lambda_function_rollup.rollup.time.sleep')
+    def test_top_gives_up(self, sleep):
+        self.table.put_failures = 10
+        self.assertFalse(self.backend.update_top('day#2023-09-03', {'alice': 1}))
+
+    def test_unchanged_top_not_written(self):
+        client = MagicMock()
+        client.get_item.return_value = {'Item': {
+            'top': {'L': [{'M': {'username': {'S': 'alice'}, 'total_num': {'N': '3'}}}]},
+            'version': {'N': '1'}
+        }}
+        backend = DynamoDBBackend(client, 'Rollups', top_size=1)
+
+        self.assertTrue(backend.update_top('day#2023-09-03', {'bob': 2}))
+        client.put_item.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
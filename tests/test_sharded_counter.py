@@ -0,0 +1,165 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import patch
+from lambda_function import leaderboard, sharded_counter
+from lambda_function.sharded_counter import (
+    ShardedCounters, RateTracker, shard_key, base_username, REGISTRY_KEY
+)
+from lambda_function.handler import increment_count
+
+class FakeUserCounts:
+    """
+    Just enough of the DynamoDB client for the UserCounts updates of ShardedCounters.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.updates = []
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ReturnValues='NONE'):
+        username = Key['username']['S']
+        self.updates.append(username)
+        item = self.items.setdefault(username, {'username': {'S': username}})
+        values = ExpressionAttributeValues
+        if ':incr' in values:
+            total = int(item.get('total_num', {'N': '0'})['N']) + int(values[':incr']['N'])
+            item['total_num'] = {'N': str(total)}
+        if ':board' in values:
+            item['board'] = values[':board']
+        if ':shards' in values:
+            item.setdefault('shard_count', values[':shards'])
+        if ':username' in values:
+            usernames = set(item.get('usernames', {'SS': []})['SS']) | set(values[':username']['SS'])
+            item['usernames'] = {'SS': sorted(usernames)}
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}, 'Attributes': dict(item)}
+
+    def get_item(self, TableName, Key):
+        item = self.items.get(Key['username']['S'])
+        return {'Item': item} if item else {}
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems['UserCounts']['Keys']
+        found = [self.items[key['username']['S']] for key in keys if key['username']['S'] in self.items]
+        return {'Responses': {'UserCounts': found}}
+
+    def query(self, **kwargs):
+        indexed = [item for item in self.items.values() if 'board' in item]
+        indexed.sort(key=lambda item: -int(item['total_num']['N']))
+        return {'Items': [
+            {'username': item['username'], 'total_num': item['total_num'], 'board': item['board']}
+            for item in indexed[:kwargs['Limit']]
+        ]}
+
+class TestKeys(unittest.TestCase):
+
+    def test_shard_key_round_trip(self):
+        self.assertEqual(shard_key('alice', 3), 'alice#shard-3')
+        self.assertEqual(base_username('alice#shard-3'), 'alice')
+        self.assertEqual(base_username('alice'), 'alice')
+
+class TestRateTracker(unittest.TestCase):
+
+    def test_rate_resets_with_window(self):
+        now = [0]
+        tracker = RateTracker(window=10, clock=lambda: now[0])
+        for _ in range(20):
+            rate = tracker.observe('alice')
+        self.assertEqual(rate, 2)
+        now[0] = 10
+        self.assertEqual(tracker.observe('alice'), 0.1)
+
+class TestShardedCounters(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeUserCounts()
+        now = [0]
+        self.counters = ShardedCounters(shard_count=4, promote_rate=0.25,
+                                        rate_tracker=RateTracker(window=10, clock=lambda: now[0]))
+
+    def increment(self, username, count=1):
+        response = self.counters.increment(self.table, username, count, 'all')
+        return int(response['Attributes']['total_num']['N'])
+
+    def test_cold_user_not_sharded(self):
+        self.assertEqual(self.increment('alice'), 1)
+        self.assertEqual(self.increment('alice', 2), 3)
+        self.assertEqual(self.table.updates, ['alice', 'alice'])
+        self.assertNotIn('shard_count', self.table.items['alice'])
+
+    def test_hot_user_promoted(self):
+        totals = [self.increment('alice') for _ in range(10)]
+
+        self.assertEqual(totals, list(range(1, 11)))
+        self.assertEqual(self.counters.sharded, {'alice': 4})
+        self.assertEqual(self.table.items['alice']['shard_count'], {'N': '4'})
+        self.assertEqual(self.table.items[REGISTRY_KEY]['usernames'], {'SS': ['alice']})
+        shards = [key for key in self.table.items if key.startswith('alice#shard-')]
+        self.assertTrue(shards)
+        # shards stay out of the leaderboard index
+        self.assertTrue(all('board' not in self.table.items[key] for key in shards))
+        self.assertEqual(self.counters.read_totals(self.table, ['alice', 'bob']), {'alice': 10})
+
+    def test_sharded_by_another_container(self):
+        other = ShardedCounters(shard_count=4)
+        other.promote(self.table, 'alice')
+
+        # the first write still goes to the user's item and reveals shard_count
+        self.assertEqual(self.increment('alice'), 1)
+        self.assertEqual(self.counters.sharded, {'alice': 4})
+        self.increment('alice')
+        self.assertTrue(self.table.updates[-1].startswith('alice#shard-'))
+
+    def test_update_action_of_sharded_user(self):
+        self.counters.sharded['alice'] = 4
+        action = self.counters.update_action(self.table, 'alice', 2, 'all')
+        self.assertTrue(action['Key']['username']['S'].startswith('alice#shard-'))
+        self.assertEqual(action['ExpressionAttributeValues'], {':incr': {'N': '2'}})
+
+class TestShardedLeaderboard(unittest.TestCase):
+
+    def setUp(self):
+        leaderboard.reset_cache()
+        sharded_counter.reset_counters()
+
+    def tearDown(self):
+        leaderboard.reset_cache()
+        sharded_counter.reset_counters()
+
+    @patch('lambda_function.sharded_counter.SHARDED_COUNTERS', True)
+    def test_top_and_score_add_up_shards(self):
+        table = FakeUserCounts()
+        counters = sharded_counter.get_counters()
+        for username, total in (('alice', 3), ('bob', 5), ('carol', 4)):
+            counters.increment(table, username, total, 'all')
+        counters.promote(table, 'alice')
+        for shard in range(2):
+            table.update_item('UserCounts', {'username': {'S': shard_key('alice', shard)}},
+                              "ADD total_num :incr", {':incr': {'N': '2'}})
+
+        self.assertEqual(leaderboard.query_top(table, 2), [('alice', 7), ('bob', 5)])
+        self.assertEqual(leaderboard.get_score(table, 'alice'), 7)
+        self.assertEqual(leaderboard.get_score(table, 'nobody'), 0)
+
+    @patch('lambda_function.sharded_counter.SHARDED_COUNTERS', True)
+    @patch('lambda_function.handler.dynamodb')
+    def test_increment_count_reports_sharded_totals(self, mock_dynamodb):
+        table = FakeUserCounts()
+        mock_dynamodb.update_item.side_effect = table.update_item
+        mock_dynamodb.batch_get_item.side_effect = table.batch_get_item
+        sharded_counter.get_counters().sharded['alice'] = 2
+        table.update_item('UserCounts', {'username': {'S': 'alice'}},
+                          "ADD total_num :incr SET board = :board",
+                          {':incr': {'N': '5'}, ':board': {'S': 'all'}})
+        table.items['alice']['shard_count'] = {'N': '2'}
+
+        response = increment_count({'alice': 1, 'bob': 2})
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['new_user_count_map'], {'alice': 6, 'bob': 2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lambda_function import slack_client
+from slack_sdk.errors import SlackApiError
+
+class FakeSlackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        status, headers, body = self.server.responses.pop(0) if self.server.responses else (200, {}, {'ok': True})
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class TestSlackClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSlackHandler)
+        self.server.connections = 0
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = slack_client.create_client(
+            'xoxb-test', base_url=f"http://127.0.0.1:{self.server.server_port}/api/")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        slack_client.reset_client()
+
+    def test_reuses_connection(self):
+        for _ in range(3):
+            self.assertTrue(self.client.chat_postMessage(channel='C1', text='alice: 1')['ok'])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_reconnects_after_server_closes_connection(self):
+        self.server.responses = [(200, {'Connection': 'close'}, {'ok': True})]
+        self.client.chat_postMessage(channel='C1', text='alice: 1')
+        self.assertTrue(self.client.chat_postMessage(channel='C1', text='alice: 2')['ok'])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_retries_rate_limited_calls(self):
+        self.server.responses = [(429, {'Retry-After': '0'}, {'ok': False, 'error': 'ratelimited'})]
+        response = self.client.api_call('auth.test')
+        self.assertTrue(response['ok'])
+
+    def test_rate_limited_post_is_left_to_the_outbox(self):
+        self.server.responses = [(429, {'Retry-After': '0'}, {'ok': False, 'error': 'ratelimited'})]
+        with self.assertRaises(SlackApiError) as e:
+            self.client.chat_postMessage(channel='C1', text='alice: 1')
+        self.assertEqual(e.exception.response.status_code, 429)
+        # not retried: the next call gets the next response
+        self.assertEqual(self.server.responses, [])
+
+    def test_raises_slack_api_error(self):
+        self.server.responses = [(200, {}, {'ok': False, 'error': 'channel_not_found'})]
+        with self.assertRaises(SlackApiError) as e:
+            self.client.chat_postMessage(channel='foo', text='alice: 1')
+        self.assertEqual(e.exception.response['error'], 'channel_not_found')
+
+    def test_get_client_is_shared(self):
+        client = slack_client.get_client('xoxb-test')
+        self.assertIs(client, slack_client.get_client('xoxb-test'))
+
+    def test_set_client(self):
+        fake = object()
+        slack_client.set_client(fake)
+        self.assertIs(slack_client.get_client('xoxb-test'), fake)
+
+if __name__ == '__main__':
+    unittest.main()
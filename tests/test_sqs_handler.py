@@ -0,0 +1,179 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import unittest
+from unittest.mock import patch
+from lambda_function import async_dispatch, dedupe, outbox
+from lambda_function.handler import sqs_handler, coalesce_user_maps, message_timestamp
+
+def sqs_record(message_id, text, user='U1', channel='C1', ts='1693751100.000100'):
+    body = {
+        'event_id': f'Ev{message_id}',
+        'event': {'text': text, 'user': user, 'channel': channel, 'ts': ts}
+    }
+    return {'messageId': message_id, 'body': json.dumps(body)}
+
+def updated(total):
+    return {'ResponseMetadata': {'HTTPStatusCode': 200}, 'Attributes': {'total_num': {'N': str(total)}}}
+
+class TestCoalesce(unittest.TestCase):
+
+    def test_coalesce_user_maps(self):
+        self.assertEqual(coalesce_user_maps([{'alice': 2}, {'alice': 1, 'bob': 1}, {}]), {'alice': 3, 'bob': 1})
+
+    def test_message_timestamp(self):
+        self.assertEqual(message_timestamp({'ts': '1693751100.000100'}), 1693751100000)
+
+@patch('lambda_function.handler.get_slack_username', return_value="John")
+@patch('lambda_function.handler.send_message', return_value={'ok': True})
+@patch('lambda_function.handler.dynamodb')
+class TestSqsHandler(unittest.TestCase):
+
+    def setUp(self):
+        dedupe.reset_deduplicator()
+        outbox.reset_outbox()
+
+    def tearDown(self):
+        dedupe.reset_deduplicator()
+        outbox.reset_outbox()
+
+    def test_one_update_per_user_per_batch(self, mock_dynamodb, mock_post, mock_get_slack_username):
+        mock_dynamodb.batch_write_item.return_value = {}
+        mock_dynamodb.update_item.side_effect = lambda **kwargs: updated(
+            {'alice': 13, 'bob': 4}[kwargs['Key']['username']['S']])
+        event = {'Records': [
+            sqs_record('m1', 'alice++ bob++', ts='1693751100.000100'),
+            sqs_record('m2', 'alice++ alice++', ts='1693751100.000200', channel='C2'),
+            sqs_record('m3', 'alice++', user='U2', ts='1693751101.000000'),
+        ]}
+
+        response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        # 4 rows in one BatchWriteItem, 2 users in 2 UpdateItem calls
+        mock_dynamodb.batch_write_item.assert_called_once()
+        self.assertEqual(len(mock_dynamodb.batch_write_item.call_args.kwargs['RequestItems']['Messages']), 4)
+        increments = {
+            call.kwargs['Key']['username']['S']: call.kwargs['ExpressionAttributeValues'][':incr']['N']
+            for call in mock_dynamodb.update_item.call_args_list
+        }
+        self.assertEqual(increments, {'alice': '4', 'bob': '1'})
+        # the scores of m1 and m3 share one post in C1
+        self.assertEqual(mock_post.call_count, 2)
+        mock_post.assert_any_call('C1', "alice: 13\nbob: 4\n", "++Bot")
+        mock_post.assert_any_call('C2', "alice: 13\n", "++Bot")
+
+    def test_unprocessed_rows_are_not_counted(self, mock_dynamodb, mock_post, mock_get_slack_username):
+        failed_row = {
+            'PutRequest': {'Item': {
+                'username': {'S': 'U1'},
+                'time_to_username': {'S': '1693751100000#bob'},
+                'to_username': {'S': 'bob'}
+            }}
+        }
+        mock_dynamodb.batch_write_item.return_value = {'UnprocessedItems': {'Messages': [failed_row]}}
+        mock_dynamodb.update_item.return_value = updated(1)
+        event = {'Records': [
+            sqs_record('m1', 'bob++'),
+            sqs_record('m2', 'alice++', user='U2'),
+        ]}
+
+        with patch('lambda_function.dynamodb_batch.backoff'):
+            response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': 'm1'}]})
+        mock_dynamodb.update_item.assert_called_once()
+        self.assertEqual(mock_dynamodb.update_item.call_args.kwargs['Key'], {'username': {'S': 'alice'}})
+
+    def test_failed_update_fails_its_messages(self, mock_dynamodb, mock_post, mock_get_slack_username):
+        mock_dynamodb.batch_write_item.return_value = {}
+
+        def update_item(**kwargs):
+            if kwargs['Key']['username']['S'] == 'bob':
+                raise RuntimeError('throttled')
+            return updated(1)
+        mock_dynamodb.update_item.side_effect = update_item
+        event = {'Records': [
+            sqs_record('m1', 'alice++ bob++'),
+            sqs_record('m2', 'alice++', user='U2'),
+        ]}
+
+        response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': 'm1'}]})
+        mock_post.assert_called_once_with('C1', "alice: 1\n", "++Bot")
+
+    def test_failed_batch_is_delivered_again(self, mock_dynamodb, mock_post, mock_get_slack_username):
+        mock_dynamodb.batch_write_item.side_effect = [RuntimeError('throttled'), {}]
+        mock_dynamodb.update_item.return_value = updated(1)
+        event = {'Records': [
+            sqs_record('m1', 'alice++'),
+            sqs_record('m2', 'bob++', user='U2'),
+        ]}
+
+        response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': 'm1'}, {'itemIdentifier': 'm2'}]})
+        mock_dynamodb.update_item.assert_not_called()
+
+        # the redelivery is not skipped as a duplicate
+        response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.assertEqual(mock_dynamodb.batch_write_item.call_count, 2)
+        self.assertEqual(mock_dynamodb.update_item.call_count, 2)
+
+    def test_failed_post_keeps_the_counted_messages(self, mock_dynamodb, mock_post, mock_get_slack_username):
+        mock_dynamodb.batch_write_item.return_value = {}
+        mock_dynamodb.update_item.return_value = updated(1)
+        event = {'Records': [
+            sqs_record('m1', 'alice++'),
+            sqs_record('m2', 'bob++', user='U2'),
+        ]}
+
+        with patch('lambda_function.handler.flush_posts', side_effect=ConnectionError()), \
+                patch.object(dedupe.EventDeduplicator, 'release') as mock_release:
+            response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        mock_release.assert_not_called()
+        self.assertEqual(mock_dynamodb.update_item.call_count, 2)
+
+        # a redelivery is still skipped as a duplicate
+        sqs_handler(event, {})
+
+        self.assertEqual(mock_dynamodb.update_item.call_count, 2)
+
+    def test_duplicates_and_commands(self, mock_dynamodb, mock_post, mock_get_slack_username):
+        mock_dynamodb.batch_write_item.return_value = {}
+        mock_dynamodb.update_item.return_value = updated(1)
+        mock_dynamodb.query.return_value = {'Items': []}
+        event = {'Records': [
+            sqs_record('m1', 'alice++'),
+            sqs_record('m1', 'alice++'),
+            sqs_record('m2', '++top 3'),
+            {'messageId': 'm3', 'body': 'not json'},
+        ]}
+
+        response = sqs_handler(event, {})
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': 'm3'}]})
+        mock_dynamodb.update_item.assert_called_once()
+        mock_post.assert_any_call('C1', "No one has received ++ yet.", "++Bot")
+
+class TestDispatchToQueue(unittest.TestCase):
+
+    @patch('lambda_function.async_dispatch.DISPATCH_QUEUE_URL', 'https://sqs.example/queue')
+    @patch('lambda_function.async_dispatch._sqs_client')
+    def test_dispatch_sends_body_to_queue(self, mock_sqs_client):
+        async_dispatch.dispatch({"event": {"text": "alice++"}})
+
+        kwargs = mock_sqs_client.send_message.call_args.kwargs
+        self.assertEqual(kwargs['QueueUrl'], 'https://sqs.example/queue')
+        self.assertEqual(json.loads(kwargs['MessageBody']), {"event": {"text": "alice++"}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import logging
+import unittest
+from unittest.mock import patch, MagicMock
+from lambda_function import structured_log
+from lambda_function.handler import lambda_handler
+
+class TestSampling(unittest.TestCase):
+
+    def test_is_sampled_is_deterministic(self):
+        keys = [f"msg#{i}" for i in range(1000)]
+        first = [structured_log.is_sampled(key, 0.1) for key in keys]
+        self.assertEqual(first, [structured_log.is_sampled(key, 0.1) for key in keys])
+        self.assertTrue(50 < sum(first) < 150)
+
+    def test_is_sampled_bounds(self):
+        self.assertFalse(structured_log.is_sampled('msg#1', 0))
+        self.assertTrue(structured_log.is_sampled('msg#1', 1))
+        self.assertFalse(structured_log.is_sampled(None, 1))
+
+class TestRedact(unittest.TestCase):
+
+    def test_bodies_are_replaced_by_their_length(self):
+        value = {'event': {'text': 'alice++ thanks', 'user': 'U1'}, 'items': [{'message': {'S': 'secret'}}]}
+        self.assertEqual(structured_log.redact(value, body_max=0), {
+            'event': {'text': '<14 chars>', 'user': 'U1'},
+            'items': [{'message': {'S': '<6 chars>'}}]
+        })
+
+    def test_bodies_are_truncated(self):
+        self.assertEqual(structured_log.redact({'text': 'alice++ thanks'}, body_max=7), {'text': 'alice++...'})
+        self.assertEqual(structured_log.redact({'text': 'bob++'}, body_max=7), {'text': 'bob++'})
+
+class TestLog(unittest.TestCase):
+
+    def tearDown(self):
+        structured_log.start_event(None)
+
+    def test_suppressed_fields_are_not_formatted(self):
+        expensive = MagicMock(return_value={'hits': 1})
+        with self.assertLogs(level='INFO') as logs:
+            structured_log.debug('user cache', stats=expensive)
+            structured_log.info('batch saved', stats=expensive)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(json.loads(logs.records[0].getMessage()), {'message': 'batch saved', 'stats': {'hits': 1}})
+        expensive.assert_called_once()
+
+    def test_sampled_event_writes_detail_lines(self):
+        with patch('lambda_function.structured_log.LOG_SAMPLE_RATE', 1):
+            structured_log.start_event('msg#1')
+        with self.assertLogs(level='INFO') as logs:
+            structured_log.debug('event received', event={'text': 'alice++'})
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelno, logging.INFO)
+        self.assertEqual(line['event'], {'text': '<7 chars>'})
+
+class TestLambdaHandlerLogging(unittest.TestCase):
+
+    def setUp(self):
+        body = {"event_id": "Ev1", "event": {"type": "message", "client_msg_id": "abc", "text": "alice++ secret",
+                                             "user": "U1", "channel": "C1"}}
+        self.event = {'body': json.dumps(body)}
+
+    def tearDown(self):
+        structured_log.start_event(None)
+
+    @patch('lambda_function.handler.verify_request', return_value=True)
+    @patch('lambda_function.handler.dedupe.get_deduplicator')
+    @patch('lambda_function.handler.save_data_to_dynamodb', return_value={"alice": 2})
+    @patch('lambda_function.handler.post_message', return_value={'ok': True})
+    def test_message_is_not_logged(self, mock_post, mock_save, mock_dedupe, mock_verify):
+        with self.assertLogs(level='DEBUG') as logs, patch('lambda_function.structured_log.LOG_SAMPLE_RATE', 1):
+            lambda_handler(self.event, {})
+
+        received = [json.loads(r.getMessage()) for r in logs.records if 'event received' in r.getMessage()]
+        self.assertEqual(received[0]['event']['text'], '<14 chars>')
+        self.assertFalse(any('secret' in r.getMessage() for r in logs.records))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import re
+import time
+import unittest
+from lambda_function.tokenizer import parse, tokenize
+
+# Pathological inputs must be parsed in well under this many seconds.
+TIME_LIMIT = 0.5
+SIZE = 64 * 1024
+
+def legacy_parse(text):
+    """The regular expressions the tokenizer replaces."""
+    is_reaction = bool(re.match(r'(\w+\+\+ *)+\s*.*', text))
+    user_map = {}
+    for user in re.findall(r'(\w+)\+\+', text):
+        user_map[user] = 1 + user_map.get(user, 0)
+    return is_reaction, user_map
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_tokens(self):
+        self.assertEqual(tokenize("alice++ bob++ Thanks!"), [(0, 'alice'), (8, 'bob')])
+
+    def test_adjacent_tokens(self):
+        self.assertEqual(parse("a++b+++c++"), (True, {'a': 1, 'b': 1, 'c': 1}))
+
+    def test_unicode_names(self):
+        self.assertEqual(parse("たろう++ José++ ありがとう"), (True, {'たろう': 1, 'José': 1}))
+
+    def test_mentions(self):
+        text = "<@U123ABC>++ <@U456|bob>++ <@U123ABC>++ thanks"
+        self.assertEqual(parse(text), (True, {'<@U123ABC>': 2, '<@U456>': 1}))
+
+    def test_invalid_mentions(self):
+        self.assertEqual(parse("<@>++ <#C123>++ @U1>++"), (False, {}))
+
+    def test_not_at_start(self):
+        self.assertEqual(parse("thanks alice++"), (False, {'alice': 1}))
+
+    def test_matches_legacy_regexes(self):
+        rng = random.Random(0)
+        alphabet = ['a', 'b', '_', '1', 'é', ' ', '+', '++', '-', '\n', '>']
+        for _ in range(5000):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+            self.assertEqual(parse(text), legacy_parse(text), repr(text))
+
+class TestTokenizerPathologicalInput(unittest.TestCase):
+
+    def assertFast(self, text):
+        self.assertGreaterEqual(len(text), 40 * 1024)
+        start = time.perf_counter()
+        parse(text)
+        self.assertLess(time.perf_counter() - start, TIME_LIMIT)
+
+    def test_long_word_without_increment(self):
+        self.assertFast('a' * SIZE + '+')
+
+    def test_long_word_with_increment(self):
+        self.assertFast('a' * SIZE + '++')
+
+    def test_many_tokens(self):
+        self.assertFast('a++ ' * (SIZE // 4))
+
+    def test_plus_signs(self):
+        self.assertFast('+' * SIZE)
+
+    def test_unclosed_mentions(self):
+        self.assertFast('<@U1' * (SIZE // 8) + '>++' * (SIZE // 6))
+
+    def test_words_between_increments(self):
+        self.assertFast(('a' * 100 + '+-') * (SIZE // 102) + '++')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import patch
+from lambda_function.handler import transact_save_data
+
+class TestTransactSaveData(unittest.TestCase):
+
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb')
+    def test_transact_save_data_success(self, mock_dynamodb, mock_get_slack_username):
+        mock_dynamodb.batch_get_item.return_value = {
+            'Responses': {'UserCounts': [
+                {'username': {'S': 'alice'}, 'total_num': {'N': '5'}},
+                {'username': {'S': 'bob'}, 'total_num': {'N': '3'}}
+            ]}
+        }
+
+        response = transact_save_data("johndoe", {'alice': 2, 'bob': 1}, "alice++ alice++ bob++")
+
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['new_user_count_map'], {'alice': 5, 'bob': 3})
+        # 2 recipients x (Put + Update) in a single round trip
+        mock_dynamodb.transact_write_items.assert_called_once()
+        actions = mock_dynamodb.transact_write_items.call_args.kwargs['TransactItems']
+        self.assertEqual(len(actions), 4)
+        self.assertEqual(actions[0]['Put']['Item']['from_username'], {'S': 'John'})
+        self.assertEqual(actions[1]['Update']['ExpressionAttributeValues'], {':incr': {'N': '2'}, ':board': {'S': 'all'}})
+        mock_dynamodb.batch_get_item.assert_called_once()
+
+    @patch('lambda_function.handler.get_slack_username', return_value="John")
+    @patch('lambda_function.handler.dynamodb_batch.transact_write_items')
+    @patch('lambda_function.handler.dynamodb')
+    def test_transact_save_data_partial_failure(self, mock_dynamodb, mock_transact, mock_get_slack_username):
+        mock_transact.return_value = {
+            'ok': False,
+            'failed': [
+                {'Put': {'TableName': 'Messages'}},
+                {'Update': {'TableName': 'UserCounts', 'Key': {'username': {'S': 'bob'}}}}
+            ],
+            'errors': ['TransactionCanceledException'],
+            'calls': 2
+        }
+        mock_dynamodb.batch_get_item.return_value = {
+            'Responses': {'UserCounts': [{'username': {'S': 'alice'}, 'total_num': {'N': '5'}}]}
+        }
+
+        response = transact_save_data("johndoe", {'alice': 2, 'bob': 1}, "alice++ alice++ bob++")
+
+        self.assertFalse(response['ok'])
+        self.assertEqual(response['failed'], ['bob'])
+        self.assertEqual(response['new_user_count_map'], {'alice': 5})
+
+if __name__ == '__main__':
+    unittest.main()
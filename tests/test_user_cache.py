@@ -0,0 +1,89 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from lambda_function.user_cache import UserDirectoryCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestUserDirectoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = UserDirectoryCache(max_size=2, ttl=60, clock=self.clock)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('U1'))
+        self.cache.put('U1', 'alice')
+        self.assertEqual(self.cache.get('U1'), 'alice')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0, 'size': 1})
+
+    def test_empty_display_name_is_a_hit(self):
+        self.cache.put('U1', '')
+        self.assertEqual(self.cache.get('U1'), '')
+
+    def test_ttl_expiry(self):
+        self.cache.put('U1', 'alice')
+        self.clock.now += 61
+        self.assertIsNone(self.cache.get('U1'))
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_lru_eviction(self):
+        self.cache.put('U1', 'alice')
+        self.cache.put('U2', 'bob')
+        self.cache.get('U1')
+        self.cache.put('U3', 'carol')
+        self.assertEqual(self.cache.get('U1'), 'alice')
+        self.assertIsNone(self.cache.get('U2'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_disabled(self):
+        cache = UserDirectoryCache(max_size=0)
+        cache.put('U1', 'alice')
+        self.assertIsNone(cache.get('U1'))
+
+    def test_preload_follows_cursor(self):
+        client = MagicMock()
+        client.users_list.side_effect = [
+            {'members': [{'id': 'U1', 'profile': {'display_name': 'alice'}}],
+             'response_metadata': {'next_cursor': 'page2'}},
+            {'members': [{'id': 'U2', 'deleted': True, 'profile': {'display_name': 'bob'}}],
+             'response_metadata': {'next_cursor': ''}}
+        ]
+
+        loaded = self.cache.preload(client)
+
+        self.assertEqual(loaded, 1)
+        self.assertEqual(client.users_list.call_args_list[1].kwargs['cursor'], 'page2')
+        self.assertEqual(self.cache.get('U1'), 'alice')
+        self.assertIsNone(self.cache.get('U2'))
+
+    def test_snapshot_round_trip(self):
+        self.cache.put('U1', 'alice')
+        self.cache.put('U2', 'bob', expires_at=self.clock.now + 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'users.json')
+            self.cache.save_snapshot(path)
+            self.clock.now += 10
+
+            cache = UserDirectoryCache(max_size=2, ttl=60, clock=self.clock)
+            self.assertEqual(cache.load_snapshot(path), 1)
+
+        self.assertEqual(cache.get('U1'), 'alice')
+        self.assertIsNone(cache.get('U2'))
+
+    def test_missing_snapshot(self):
+        self.assertEqual(self.cache.load_snapshot('/nonexistent/users.json'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import subprocess
+import unittest
+from unittest.mock import patch, MagicMock
+from lambda_function import slack_client
+from lambda_function.handler import lambda_handler
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+class TestWarmUp(unittest.TestCase):
+
+    def tearDown(self):
+        slack_client.reset_client()
+
+    def test_import_does_not_load_sdks(self):
+        code = (
+            "import sys; sys.path.insert(0, 'lambda_function'); import handler; "
+            "print(sorted(m for m in ('boto3', 'botocore', 'slack_sdk') if m in sys.modules))"
+        )
+        env = dict(os.environ, SLACK_TOKEN='x', SLACK_SIGNING_SECRET='y')
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    @patch('lambda_function.handler.dynamodb')
+    def test_warmup_event(self, mock_dynamodb):
+        mock_client = MagicMock()
+        slack_client.set_client(mock_client)
+
+        response = lambda_handler({'warmup': True}, {})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertIn('slack_client', response['warmup']['imports_ms'])
+        self.assertEqual(mock_dynamodb.mock_calls, [])
+        self.assertEqual(mock_client.mock_calls, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,10 +25,55 @@ variable "system_name" {
 variable "slack_token" {}
 variable "slack_signing_secret" {}
 
+# Format of the analytics files written to S3: "json" or "parquet"
+variable "analytics_output_format" {
+  default = "json"
+}
+
+# Compression of the Parquet files: "SNAPPY", "GZIP" or "UNCOMPRESSED"
+variable "analytics_parquet_compression" {
+  default = "SNAPPY"
+}
+
+# Layout of the Messages items: 1 (one item per recipient) or 2 (one message item and small recipient items)
+variable "messages_schema_version" {
+  default = "1"
+}
+
+# Number of to_username hash buckets of the analytics S3 prefix, 0 for none.
+# Changing it only affects the files written afterwards.
+variable "analytics_partition_buckets" {
+  default = 0
+}
+
+# Last year of the year partitions projected by the Glue tables; Athena finds
+# no row in the files of a later year
+variable "analytics_last_year" {
+  default = 2035
+}
+
 locals {
+  parquet_output   = var.analytics_output_format == "parquet"
+  analytics_prefix = local.parquet_output ? "parquet" : "success"
+
+  # bucket=NN/ after the hour when analytics_partition_buckets is set, see
+  # partition_keys in lambda_function_firehose/handler.py
+  bucketed        = var.analytics_partition_buckets > 0
+  bucket_prefix   = local.bucketed ? "bucket=!{partitionKeyFromLambda:bucket}/" : ""
+  bucket_location = local.bucketed ? "bucket=$${bucket}/" : ""
+  bucket_projection = local.bucketed ? {
+    "projection.bucket.type" = "enum"
+    "projection.bucket.values" = join(",", concat(
+      [for i in range(var.analytics_partition_buckets) : format("%0${length(tostring(var.analytics_partition_buckets - 1))}d", i)],
+      ["mixed"]
+    ))
+  } : {}
+
   dynamodb_table_names = {
-    messages    = "Messages"
-    user_counts = "UserCounts"
+    messages         = "Messages"
+    user_counts      = "UserCounts"
+    processed_events = "ProcessedEvents"
+    rollups          = "Rollups"
   }
 }
 
@@ -51,6 +96,12 @@ data "archive_file" "function_firehose_zip" {
   output_path = "../lambda/function_firehose.zip"
 }
 
+data "archive_file" "function_rollup_zip" {
+  type        = "zip"
+  source_dir  = "../build/function_rollup"
+  output_path = "../lambda/function_rollup.zip"
+}
+
 # Layer
 resource "aws_lambda_layer_version" "lambda_layer" {
   layer_name               = "${var.system_name}_lambda_layer"
@@ -73,18 +124,88 @@ resource "aws_lambda_function" "slack_bot" {
   layers           = ["${aws_lambda_layer_version.lambda_layer.arn}"]
   environment {
     variables = {
-      SLACK_TOKEN          = var.slack_token
-      SLACK_SIGNING_SECRET = var.slack_signing_secret
+      SLACK_TOKEN             = var.slack_token
+      SLACK_SIGNING_SECRET    = var.slack_signing_secret
+      DYNAMODB_WRITE_MODE     = "transact"
+      MESSAGES_SCHEMA_VERSION = var.messages_schema_version
+      FAST_ACK                = "1"
+      DEDUPE_TABLE            = local.dynamodb_table_names.processed_events
+      DISPATCH_QUEUE_URL      = aws_sqs_queue.slack_events.url
     }
   }
 }
 
+# Verified Slack events, saved in batches by the worker function
+# https://registry.terraform.io/providers/hashicorp/aws/latest/docs/resources/sqs_queue
+resource "aws_sqs_queue" "slack_events" {
+  name = "${var.system_name}_slack_events"
+  # at least 6 times the timeout of the worker function
+  visibility_timeout_seconds = 180
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.slack_events_dlq.arn
+    maxReceiveCount     = 5
+  })
+}
+
+resource "aws_sqs_queue" "slack_events_dlq" {
+  name                      = "${var.system_name}_slack_events_dlq"
+  message_retention_seconds = 1209600
+}
+
+resource "aws_lambda_function" "slack_bot_worker" {
+  function_name = "${var.system_name}_slack_bot_worker"
+
+  handler          = "handler.sqs_handler"
+  filename         = data.archive_file.function_zip.output_path
+  runtime          = "python3.11"
+  role             = aws_iam_role.lambda_iam_role.arn
+  source_code_hash = data.archive_file.function_zip.output_base64sha256
+  timeout          = 30
+  layers           = ["${aws_lambda_layer_version.lambda_layer.arn}"]
+  environment {
+    variables = {
+      SLACK_TOKEN             = var.slack_token
+      SLACK_SIGNING_SECRET    = var.slack_signing_secret
+      DEDUPE_TABLE            = local.dynamodb_table_names.processed_events
+      MESSAGES_SCHEMA_VERSION = var.messages_schema_version
+    }
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "slack_events" {
+  event_source_arn                   = aws_sqs_queue.slack_events.arn
+  function_name                      = aws_lambda_function.slack_bot_worker.arn
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 1
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
 resource "aws_lambda_function_event_invoke_config" "slack_bot" {
   function_name                = aws_lambda_function.slack_bot.function_name
   maximum_event_age_in_seconds = 60
   maximum_retry_attempts       = 0
 }
 
+# Scheduled warm-up event: initialises the clients without calling DynamoDB or Slack
+resource "aws_cloudwatch_event_rule" "slack_bot_warmup" {
+  name                = "${var.system_name}_slack_bot_warmup"
+  schedule_expression = "rate(5 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "slack_bot_warmup" {
+  rule  = aws_cloudwatch_event_rule.slack_bot_warmup.name
+  arn   = aws_lambda_function.slack_bot.arn
+  input = jsonencode({ warmup = true })
+}
+
+resource "aws_lambda_permission" "slack_bot_warmup" {
+  statement_id  = "AllowWarmupFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.slack_bot.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.slack_bot_warmup.arn
+}
+
 # Function for Firehose
 resource "aws_lambda_function" "firehose_transform" {
   function_name = "${var.system_name}_firehose_transform"
@@ -95,6 +216,14 @@ resource "aws_lambda_function" "firehose_transform" {
   role             = aws_iam_role.lambda_iam_role.arn
   source_code_hash = data.archive_file.function_firehose_zip.output_base64sha256
   timeout          = 30
+  layers           = ["${aws_lambda_layer_version.lambda_layer.arn}"]
+  environment {
+    variables = {
+      LOG_SAMPLE_RATE   = "0.001"
+      OUTPUT_FORMAT     = var.analytics_output_format
+      PARTITION_BUCKETS = var.analytics_partition_buckets
+    }
+  }
 }
 
 resource "aws_lambda_function_event_invoke_config" "firehose" {
@@ -102,7 +231,32 @@ resource "aws_lambda_function_event_invoke_config" "firehose" {
   maximum_event_age_in_seconds = 60
   maximum_retry_attempts       = 0
 }
+# Function for the leaderboard rollups, fed by the Messages change records of the Kinesis stream
+resource "aws_lambda_function" "rollup" {
+  function_name = "${var.system_name}_rollup"
+
+  handler          = "handler.lambda_handler"
+  filename         = data.archive_file.function_rollup_zip.output_path
+  runtime          = "python3.11"
+  role             = aws_iam_role.lambda_iam_role.arn
+  source_code_hash = data.archive_file.function_rollup_zip.output_base64sha256
+  timeout          = 60
+  environment {
+    variables = {
+      ROLLUP_TABLE = local.dynamodb_table_names.rollups
+    }
+  }
+}
 
+# https://registry.terraform.io/providers/hashicorp/aws/latest/docs/resources/lambda_event_source_mapping
+resource "aws_lambda_event_source_mapping" "rollup" {
+  event_source_arn                   = aws_kinesis_stream.stream.arn
+  function_name                      = aws_lambda_function.rollup.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 500
+  maximum_batching_window_in_seconds = 5
+  maximum_retry_attempts             = 3
+}
 
 # Role
 resource "aws_iam_role" "lambda_iam_role" {
@@ -141,6 +295,30 @@ resource "aws_iam_role_policy" "lambda_access_policy" {
         "logs:PutLogEvents"
       ],
       "Resource": "arn:aws:logs:*:*:*"
+    },
+    {
+      "Effect": "Allow",
+      "Action": [
+        "lambda:InvokeFunction"
+      ],
+      "Resource": "arn:aws:lambda:*:${data.aws_caller_identity.current.account_id}:function:${var.system_name}_slack_bot"
+    },
+    {
+      "Effect": "Allow",
+      "Action": [
+        "sqs:SendMessage",
+        "sqs:ReceiveMessage",
+        "sqs:DeleteMessage",
+        "sqs:GetQueueAttributes"
+      ],
+      "Resource": "${aws_sqs_queue.slack_events.arn}"
+    },
+    {
+      "Effect": "Allow",
+      "Action": [
+        "kinesis:PutRecords"
+      ],
+      "Resource": "${aws_kinesis_stream.stream.arn}"
     }
   ]
 }
@@ -153,6 +331,12 @@ resource "aws_iam_role_policy_attachment" "dynamodb_full_access" {
   policy_arn = "arn:aws:iam::aws:policy/AmazonDynamoDBFullAccess"
 }
 
+# Read the Kinesis stream (rollup function)
+resource "aws_iam_role_policy_attachment" "kinesis_execution" {
+  role       = aws_iam_role.lambda_iam_role.name
+  policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaKinesisExecutionRole"
+}
+
 # DynamoDB Tables - Messages, UserCounts
 # https://registry.terraform.io/providers/hashicorp/aws/latest/docs/resources/dynamodb_table
 resource "aws_dynamodb_table" "messages" {
@@ -170,6 +354,21 @@ resource "aws_dynamodb_table" "messages" {
     name = "time_to_username"
     type = "S"
   }
+
+  attribute {
+    name = "to_username"
+    type = "S"
+  }
+
+  # Messages received by a user, newest first, read by the ++history command.
+  # Version 2 message items have no to_username and are not in the index.
+  global_secondary_index {
+    name               = "history"
+    hash_key           = "to_username"
+    range_key          = "time_to_username"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["from_username", "message", "message_z", "incr_num"]
+  }
 }
 
 resource "aws_dynamodb_table" "user_counts" {
@@ -181,6 +380,64 @@ resource "aws_dynamodb_table" "user_counts" {
     name = "username"
     type = "S"
   }
+
+  attribute {
+    name = "board"
+    type = "S"
+  }
+
+  attribute {
+    name = "total_num"
+    type = "N"
+  }
+
+  # Users sorted by total_num, read by the ++top command
+  global_secondary_index {
+    name            = "leaderboard"
+    hash_key        = "board"
+    range_key       = "total_num"
+    projection_type = "KEYS_ONLY"
+  }
+}
+
+# Markers of the Slack events that have been processed, deleted by TTL.
+resource "aws_dynamodb_table" "processed_events" {
+  name         = local.dynamodb_table_names.processed_events
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "event_key"
+
+  attribute {
+    name = "event_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Per-period counters and top-N, updated by the rollup function. Hourly items are deleted by TTL.
+resource "aws_dynamodb_table" "rollups" {
+  name         = local.dynamodb_table_names.rollups
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "period"
+  range_key    = "username"
+
+  attribute {
+    name = "period"
+    type = "S"
+  }
+
+  attribute {
+    name = "username"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
 }
 
 # Kinesis Data Stream
@@ -224,8 +481,18 @@ resource "aws_kinesis_firehose_delivery_stream" "extended_s3_stream" {
     role_arn           = aws_iam_role.firehose_role.arn
     bucket_arn         = aws_s3_bucket.firehose_destination.arn
     buffering_interval = 60
+    # dynamic partitioning and record format conversion need a buffer of at least 64 MiB
+    buffering_size = 64
+
+    # Partitioned by the time the messages were written, as computed by the
+    # transform, not by the time they reached Firehose.
+    # Dynamic partitioning can only be enabled when the stream is created.
+    # https://docs.aws.amazon.com/firehose/latest/dev/dynamic-partitioning.html
+    dynamic_partitioning_configuration {
+      enabled = "true"
+    }
 
-    prefix              = "${var.system_name}/success/year=!{timestamp:yyyy}/month=!{timestamp:MM}/day=!{timestamp:dd}/hour=!{timestamp:HH}/"
+    prefix              = "${var.system_name}/${local.analytics_prefix}/year=!{partitionKeyFromLambda:year}/month=!{partitionKeyFromLambda:month}/day=!{partitionKeyFromLambda:day}/hour=!{partitionKeyFromLambda:hour}/${local.bucket_prefix}"
     error_output_prefix = "${var.system_name}/error/year=!{timestamp:yyyy}/month=!{timestamp:MM}/day=!{timestamp:dd}/hour=!{timestamp:HH}/!{firehose:error-output-type}"
 
 
@@ -239,6 +506,35 @@ resource "aws_kinesis_firehose_delivery_stream" "extended_s3_stream" {
         }
       }
     }
+
+    # https://docs.aws.amazon.com/firehose/latest/dev/record-format-conversion.html
+    dynamic "data_format_conversion_configuration" {
+      for_each = local.parquet_output ? [1] : []
+      content {
+        input_format_configuration {
+          deserializer {
+            hive_json_ser_de {
+              # ApproximateCreationDateTime is in epoch milliseconds
+              timestamp_formats = ["millis"]
+            }
+          }
+        }
+
+        output_format_configuration {
+          serializer {
+            parquet_ser_de {
+              compression = var.analytics_parquet_compression
+            }
+          }
+        }
+
+        schema_configuration {
+          database_name = aws_glue_catalog_table.messages_parquet.database_name
+          table_name    = aws_glue_catalog_table.messages_parquet.name
+          role_arn      = aws_iam_role.firehose_role.arn
+        }
+      }
+    }
   }
 }
 
@@ -296,6 +592,20 @@ data "aws_iam_policy_document" "firehose_s3_lambda" {
       "*"
     ]
   }
+  # schema of the record format conversion
+  statement {
+    effect = "Allow"
+    actions = [
+      "glue:GetTable",
+      "glue:GetTableVersion",
+      "glue:GetTableVersions"
+    ]
+    resources = [
+      "arn:aws:glue:ap-northeast-1:${data.aws_caller_identity.current.account_id}:catalog",
+      "arn:aws:glue:ap-northeast-1:${data.aws_caller_identity.current.account_id}:database/${aws_glue_catalog_database.slack_db.name}",
+      "arn:aws:glue:ap-northeast-1:${data.aws_caller_identity.current.account_id}:table/${aws_glue_catalog_database.slack_db.name}/*"
+    ]
+  }
 }
 
 resource "aws_iam_policy" "firehose_policy" {
@@ -341,12 +651,12 @@ resource "aws_glue_catalog_table" "messages" {
 
   table_type = "EXTERNAL_TABLE"
 
-  parameters = {
+  parameters = merge({
     "projection.enabled"        = "true"
     "projection.year.digits"    = "4"
     "projection.year.interval"  = "1"
     "projection.year.type"      = "integer"
-    "projection.year.range"     = "2023,2025"
+    "projection.year.range"     = "2023,${var.analytics_last_year}"
     "projection.month.digits"   = "2"
     "projection.month.interval" = "1"
     "projection.month.type"     = "integer"
@@ -359,9 +669,8 @@ resource "aws_glue_catalog_table" "messages" {
     "projection.hour.interval"  = "1"
     "projection.hour.type"      = "integer"
     "projection.hour.range"     = "0,23"
-    "storage.location.template" = "s3://${aws_s3_bucket.firehose_destination.bucket}/${var.system_name}/success/year=$${year}/month=$${month}/day=$${day}/hour=$${hour}/"
-
-  }
+    "storage.location.template" = "s3://${aws_s3_bucket.firehose_destination.bucket}/${var.system_name}/success/year=$${year}/month=$${month}/day=$${day}/hour=$${hour}/${local.bucket_location}"
+  }, local.bucket_projection)
 
   storage_descriptor {
     location      = "s3://${aws_s3_bucket.firehose_destination.bucket}/${var.system_name}/success/"
@@ -438,5 +747,129 @@ resource "aws_glue_catalog_table" "messages" {
     name = "hour"
     type = "int"
   }
+
+  dynamic "partition_keys" {
+    for_each = local.bucketed ? [1] : []
+    content {
+      name = "bucket"
+      type = "string"
+    }
+  }
 }
 
+
+# Same records in Parquet, written when analytics_output_format is "parquet".
+# Also the schema of the Firehose record format conversion: keep the columns
+# in sync with PARQUET_COLUMNS in lambda_function_firehose/handler.py.
+resource "aws_glue_catalog_table" "messages_parquet" {
+  name          = "messages_parquet"
+  database_name = aws_glue_catalog_database.slack_db.name
+
+  table_type = "EXTERNAL_TABLE"
+
+  parameters = merge({
+    "classification"            = "parquet"
+    "projection.enabled"        = "true"
+    "projection.year.digits"    = "4"
+    "projection.year.interval"  = "1"
+    "projection.year.type"      = "integer"
+    "projection.year.range"     = "2023,${var.analytics_last_year}"
+    "projection.month.digits"   = "2"
+    "projection.month.interval" = "1"
+    "projection.month.type"     = "integer"
+    "projection.month.range"    = "1,12"
+    "projection.day.digits"     = "2"
+    "projection.day.interval"   = "1"
+    "projection.day.type"       = "integer"
+    "projection.day.range"      = "1,31"
+    "projection.hour.digits"    = "2"
+    "projection.hour.interval"  = "1"
+    "projection.hour.type"      = "integer"
+    "projection.hour.range"     = "0,23"
+    "storage.location.template" = "s3://${aws_s3_bucket.firehose_destination.bucket}/${var.system_name}/parquet/year=$${year}/month=$${month}/day=$${day}/hour=$${hour}/${local.bucket_location}"
+  }, local.bucket_projection)
+
+  storage_descriptor {
+    location      = "s3://${aws_s3_bucket.firehose_destination.bucket}/${var.system_name}/parquet/"
+    input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
+
+    ser_de_info {
+      serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+    }
+
+    columns {
+      name = "eventID"
+      type = "string"
+    }
+
+    columns {
+      name = "eventName"
+      type = "string"
+    }
+
+    columns {
+      name = "ApproximateCreationDateTime"
+      type = "timestamp"
+    }
+
+    columns {
+      name = "to_username"
+      type = "string"
+    }
+
+    columns {
+      name = "from_username"
+      type = "string"
+    }
+
+    columns {
+      name = "message"
+      type = "string"
+    }
+
+    columns {
+      name    = "username"
+      type    = "string"
+      comment = "Slack User ID"
+    }
+
+    columns {
+      name = "incr_num"
+      type = "int"
+    }
+
+    columns {
+      name = "time_to_username"
+      type = "string"
+    }
+  }
+
+  partition_keys {
+    name = "year"
+    type = "int"
+  }
+
+  partition_keys {
+    name = "month"
+    type = "int"
+  }
+
+  partition_keys {
+    name = "day"
+    type = "int"
+  }
+
+  partition_keys {
+    name = "hour"
+    type = "int"
+  }
+
+  dynamic "partition_keys" {
+    for_each = local.bucketed ? [1] : []
+    content {
+      name = "bucket"
+      type = "string"
+    }
+  }
+}
@@ -0,0 +1,348 @@
+"""
+Rebuild the UserCounts totals from the Messages table and repair them.
+
+`total_num` is only changed by ADD, so a message saved without its
+increments (or counted twice by a retry) stays wrong forever. This tool:
+
+1. sums `incr_num` by `to_username` over Messages with a parallel Scan,
+   one segment per worker thread (version 1 items and version 2 recipient
+   items; the version 2 message items have no `to_username` and are skipped);
+2. sums `total_num` over UserCounts, adding the `#shard-N` items of the
+   sharded users to their user;
+3. reports the users whose totals differ and, with --apply, ADDs the
+   difference to their own item with TransactWriteItems, at most
+   --writes-per-second updates per second.
+
+The increments made while the tool runs can show up as differences: the
+corrections are ADDs, so they never lose an increment, but run it when the
+bot is quiet, or run it twice and check that the second report is empty.
+
+With --backfill-board, the tool instead SETs `board` on the user items
+written before the leaderboard index existed, which ++top does not list
+until their next increment. Run it once before deploying the index reads.
+
+    python tools/reconcile_user_counts.py                # dry run
+    python tools/reconcile_user_counts.py --apply --segments 32 --writes-per-second 200
+    python tools/reconcile_user_counts.py --backfill-board --apply
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lambda_function import dynamodb_batch, leaderboard, sharded_counter
+
+# Items read per Scan page.
+SCAN_PAGE_SIZE = 1000
+
+
+class RateLimiter:
+    """
+    Spread units of work (e.g. written items) evenly at a maximum rate.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate (float): units per second, 0 for no limit
+            clock (function): returns the current time in seconds
+            sleep (function): waits for a number of seconds
+        """
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._next = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, units=1):
+        """
+        Wait until `units` more units can be used.
+
+        Args:
+            units (int): units used by the caller
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = self.clock()
+            start = max(self._next, now)
+            self._next = start + units / self.rate
+        if start > now:
+            self.sleep(start - now)
+
+
+def scan_segment(client, table_name, segment, total_segments, projection, page_size=None):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        table_name (str): name of the table
+        segment (int): segment read, from 0 to total_segments - 1
+        total_segments (int): number of segments of the scan
+        projection (str): ProjectionExpression, names of the attributes read
+        page_size (int): items per Scan call, SCAN_PAGE_SIZE by default
+    Returns:
+        generator: items of the segment, reading the next page when needed
+
+    https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Scan.html#Scan.ParallelScan
+    """
+    request = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'ProjectionExpression': projection,
+        'Limit': page_size or SCAN_PAGE_SIZE
+    }
+    while True:
+        response = client.scan(**request)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def sum_messages(client, segment, total_segments):
+    """
+    Returns:
+        Counter: incr_num received by each to_username in one segment of Messages
+    """
+    totals = Counter()
+    for item in scan_segment(client, 'Messages', segment, total_segments, 'to_username, incr_num'):
+        if 'to_username' in item and 'incr_num' in item:
+            totals[item['to_username']['S']] += int(item['incr_num']['N'])
+    return totals
+
+
+def sum_user_counts(client, segment, total_segments):
+    """
+    Returns:
+        Counter: total_num of each user in one segment of UserCounts, shards included
+    """
+    totals = Counter()
+    for item in scan_segment(client, 'UserCounts', segment, total_segments, 'username, total_num'):
+        key = item['username']['S']
+        if key == sharded_counter.REGISTRY_KEY:
+            continue
+        # an item without total_num still exists, e.g. a user promoted to shards
+        totals[sharded_counter.base_username(key)] += int(item.get('total_num', {'N': '0'})['N'])
+    return totals
+
+
+def parallel_sum(function, client, total_segments):
+    """
+    Args:
+        function (function): sum_messages or sum_user_counts
+        client (object): boto3 DynamoDB client, shared by the threads
+        total_segments (int): number of segments, one thread each
+    Returns:
+        Counter: sum of the counters of every segment
+    """
+    totals = Counter()
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        futures = [executor.submit(function, client, segment, total_segments) for segment in range(total_segments)]
+        for future in futures:
+            totals.update(future.result())
+    return totals
+
+
+def missing_board(client, segment, total_segments):
+    """
+    Returns:
+        list: usernames of the user items of one segment of UserCounts without board,
+              shards and the registry excluded as they are never in the leaderboard index
+    """
+    usernames = []
+    for item in scan_segment(client, 'UserCounts', segment, total_segments, 'username, board'):
+        key = item['username']['S']
+        if 'board' in item or key == sharded_counter.REGISTRY_KEY or sharded_counter.base_username(key) != key:
+            continue
+        usernames.append(key)
+    return usernames
+
+
+def backfill_board(client, total_segments=16, apply=False, writes_per_second=100):
+    """
+    SET board on the UserCounts items that are missing from the leaderboard index.
+
+    The update is conditioned on board not existing, so an item incremented
+    in the meantime is left as it is.
+
+    Args:
+        client (object): boto3 DynamoDB client
+        total_segments (int): segments (and threads) of the Scan
+        apply (bool): write board, False for a dry run
+        writes_per_second (float): maximum UserCounts updates per second, 0 for no limit
+    Returns:
+        dict:
+            missing (list): usernames whose item has no board
+            updated (int): number of items updated, only with apply
+            failed (list): usernames whose item could not be updated, only with apply
+            seconds (float): duration of the run
+    """
+    from botocore.exceptions import ClientError
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        futures = [executor.submit(missing_board, client, segment, total_segments) for segment in range(total_segments)]
+        missing = sorted(username for future in futures for username in future.result())
+
+    report = {'missing': missing}
+    if apply:
+        limiter = RateLimiter(writes_per_second)
+        updated = 0
+        failed = []
+        for username in missing:
+            limiter.acquire()
+            try:
+                client.update_item(
+                    TableName='UserCounts',
+                    Key={'username': {'S': username}},
+                    UpdateExpression="SET board = :board",
+                    ConditionExpression="attribute_not_exists(board)",
+                    ExpressionAttributeValues={':board': {'S': leaderboard.BOARD}}
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    failed.append(username)
+        report.update({'updated': updated, 'failed': failed})
+    report['seconds'] = round(time.monotonic() - start, 3)
+    return report
+
+
+def diff(expected, actual):
+    """
+    Args:
+        expected (Counter): totals computed from Messages
+        actual (Counter): totals found in UserCounts
+    Returns:
+        list: dicts with username, expected, actual and delta (expected - actual)
+              of the users whose totals differ, largest difference first
+    """
+    corrections = []
+    for username in expected.keys() | actual.keys():
+        delta = expected[username] - actual[username]
+        if delta:
+            corrections.append({
+                'username': username,
+                'expected': expected[username],
+                'actual': actual[username],
+                'delta': delta
+            })
+    corrections.sort(key=lambda correction: (-abs(correction['delta']), correction['username']))
+    return corrections
+
+
+def apply_corrections(client, corrections, limiter):
+    """
+    ADD the differences to the users' own UserCounts items, up to 100 per
+    TransactWriteItems call. A chunk is written or fails as a whole; the
+    users of a failed chunk are reported and can be repaired by another run.
+
+    Args:
+        client (object): boto3 DynamoDB client
+        corrections (list): value returned by diff
+        limiter (RateLimiter): rate of the updates
+    Returns:
+        dict:
+            ok (bool): True if every correction has been written
+            applied (int): number of corrections written
+            failed (list): usernames whose correction was not written
+            calls (int): number of TransactWriteItems calls
+    """
+    actions = [
+        {
+            'Update': {
+                'TableName': 'UserCounts',
+                'Key': {'username': {'S': correction['username']}},
+                'UpdateExpression': "ADD total_num :incr SET board = :board",
+                'ExpressionAttributeValues': {
+                    ':incr': {'N': str(correction['delta'])},
+                    ':board': {'S': leaderboard.BOARD}
+                }
+            }
+        }
+        for correction in corrections
+    ]
+
+    failed = []
+    calls = 0
+    for chunk in dynamodb_batch.chunked(actions, dynamodb_batch.TRANSACT_WRITE_LIMIT):
+        limiter.acquire(len(chunk))
+        result = dynamodb_batch.transact_write_items(client, chunk)
+        calls += result['calls']
+        failed.extend(action['Update']['Key']['username']['S'] for action in result['failed'])
+
+    return {
+        'ok': not failed,
+        'applied': len(actions) - len(failed),
+        'failed': failed,
+        'calls': calls
+    }
+
+
+def reconcile(client, total_segments=16, apply=False, writes_per_second=100):
+    """
+    Args:
+        client (object): boto3 DynamoDB client
+        total_segments (int): segments (and threads) of each Scan
+        apply (bool): write the corrections, False for a dry run
+        writes_per_second (float): maximum UserCounts updates per second, 0 for no limit
+    Returns:
+        dict:
+            users (int): number of users found in either table
+            corrections (list): value returned by diff
+            total_delta (int): sum of the differences
+            result (dict): value returned by apply_corrections, only with apply
+            seconds (float): duration of the run
+    """
+    start = time.monotonic()
+    expected = parallel_sum(sum_messages, client, total_segments)
+    actual = parallel_sum(sum_user_counts, client, total_segments)
+    corrections = diff(expected, actual)
+
+    report = {
+        'users': len(expected.keys() | actual.keys()),
+        'corrections': corrections,
+        'total_delta': sum(correction['delta'] for correction in corrections)
+    }
+    if apply and corrections:
+        report['result'] = apply_corrections(client, corrections, RateLimiter(writes_per_second))
+    report['seconds'] = round(time.monotonic() - start, 3)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=16, help='segments (and threads) of each Scan')
+    parser.add_argument('--apply', action='store_true', help='write the corrections (dry run by default)')
+    parser.add_argument('--writes-per-second', type=float, default=100, help='UserCounts updates per second, 0 for no limit')
+    parser.add_argument('--backfill-board', action='store_true',
+                        help='set board on the UserCounts items missing from the leaderboard index instead')
+    args = parser.parse_args(argv)
+
+    import boto3
+    from botocore.config import Config
+    # one connection per scan thread
+    client = boto3.client('dynamodb', config=Config(max_pool_connections=max(10, args.segments)))
+
+    if args.backfill_board:
+        report = backfill_board(client, args.segments, args.apply, args.writes_per_second)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if report.get('failed'):
+            sys.exit(1)
+        return
+
+    report = reconcile(client, args.segments, args.apply, args.writes_per_second)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.apply and not report.get('result', {'ok': True})['ok']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()